@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import Category, Tag
+from django.utils import timezone
+
+from .models import Category, Job, Tag
 
 
 @admin.register(Category)
@@ -15,3 +17,41 @@ class TagAdmin(admin.ModelAdmin):
     list_display = ["name", "created_at"]
     search_fields = ["name"]
     readonly_fields = ["created_at"]
+
+
+class JobFailedFilter(admin.SimpleListFilter):
+    title = "状態"
+    parameter_name = "failed"
+
+    def lookups(self, request, model_admin):
+        return [("1", "失敗"), ("0", "未実行")]
+
+    def queryset(self, request, queryset):
+        if self.value() in ("0", "1"):
+            return queryset.filter(failed_at__isnull=self.value() == "0")
+        return queryset
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ["name", "key", "attempts", "run_at", "locked_by", "failed_at"]
+    list_filter = [JobFailedFilter, "name"]
+    search_fields = ["name", "key"]
+    readonly_fields = [field.name for field in Job._meta.fields]
+    actions = ["retry"]
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description="選択したジョブを再実行")
+    def retry(self, request, queryset):
+        now = timezone.now()
+        # 実行中のジョブは二重に実行しないよう対象から外す
+        count = queryset.exclude(locked_until__gt=now).update(
+            failed_at=None,
+            attempts=0,
+            run_at=now,
+            locked_by="",
+            locked_until=None,
+        )
+        self.message_user(request, f"{count}件のジョブを再実行します。")
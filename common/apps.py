@@ -1,6 +1,13 @@
 from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
 
 
 class CommonConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'common'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
+
+        # 各アプリの jobs.py でジョブの処理を登録する
+        autodiscover_modules("jobs")
@@ -0,0 +1,178 @@
+"""内容のハッシュで保存するファイル（Blob）の保存と配信
+
+ファイルは blobs/ab/cd/<sha256> に置き、同じ内容のファイルは1つだけ保存する。
+アップロードされたファイルは受信しながらハッシュを計算して一時ファイルに書き出し、
+保存時はファイルを移動するだけで、ハッシュを計算し直すことはない。
+
+配信は BLOB_X_ACCEL_PREFIX を設定すると X-Accel-Redirect で nginx に任せ、
+Django は権限の確認とヘッダーの設定だけを行う。
+"""
+
+import hashlib
+import mimetypes
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.db import IntegrityError, transaction
+from django.http import FileResponse, HttpResponse
+from django.utils.http import content_disposition_header
+
+from .models import Blob
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def blob_name(sha256):
+    """ストレージ上のパス。1ディレクトリのファイル数が増えすぎないよう2階層に分ける"""
+    return f"blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}"
+
+
+def hash_file(path):
+    """(SHA-256, サイズ)"""
+    hasher = hashlib.sha256()
+    size = 0
+    with open(path, "rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            hasher.update(chunk)
+            size += len(chunk)
+    return hasher.hexdigest(), size
+
+
+def upload_dir():
+    os.makedirs(settings.BLOB_UPLOAD_DIR, exist_ok=True)
+    return settings.BLOB_UPLOAD_DIR
+
+
+def store_file(path, sha256=None, size=None):
+    """ファイルを Blob として取り込む
+
+    path のファイルは移動するか（新しい内容の場合）削除する（保存済みの場合）。
+    sha256 を省略した場合はここで計算する。
+    """
+    if sha256 is None:
+        sha256, size = hash_file(path)
+    blob = Blob.objects.filter(sha256=sha256).first()
+    if blob is not None:
+        os.remove(path)
+        return blob
+
+    name = blob_name(sha256)
+    target = default_storage.path(name)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    # 同じ内容を同時に保存しても中身は同じなので、後から移動した方で上書きしてよい
+    shutil.move(path, target)
+    os.chmod(target, settings.FILE_UPLOAD_PERMISSIONS or 0o644)
+    try:
+        with transaction.atomic():
+            return Blob.objects.create(sha256=sha256, size=size, file=name)
+    except IntegrityError:
+        return Blob.objects.get(sha256=sha256)
+
+
+def store_upload(uploaded_file):
+    """フォームでアップロードされたファイルを Blob として取り込む"""
+    sha256 = getattr(uploaded_file, "sha256", None)
+    if sha256 and hasattr(uploaded_file, "temporary_file_path"):
+        # 一時ファイルは移動・削除されるが、閉じるときに存在しなくても問題ない
+        return store_file(
+            uploaded_file.temporary_file_path(), sha256, uploaded_file.size
+        )
+
+    # メモリ上のファイルなどは一時ファイルに書き出してから取り込む
+    with tempfile.NamedTemporaryFile(dir=upload_dir(), delete=False) as f:
+        for chunk in uploaded_file.chunks():
+            f.write(chunk)
+    return store_file(f.name)
+
+
+class HashingFileUploadHandler(TemporaryFileUploadHandler):
+    """一時ファイルに書き出しながら SHA-256 を計算する
+
+    ファイルには sha256 属性が付き、store_upload() でハッシュを計算し直さずに取り込める。
+    Blob に取り込むビューだけで use_hashing_upload_handler() を使って有効にする。
+    """
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.hasher = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        self.hasher.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.sha256 = self.hasher.hexdigest()
+        return file
+
+
+def use_hashing_upload_handler(request):
+    """このリクエストのアップロードを HashingFileUploadHandler で受け取る
+
+    request.POST / FILES を読む前に呼ぶこと（CSRF の確認も読むので、ビューは csrf_exempt にして
+    中で csrf_protect する）。
+    """
+    request.upload_handlers.insert(0, HashingFileUploadHandler(request))
+
+
+def serve_file(file, filename, content_type=None, as_attachment=True):
+    """保存済みのファイルを返すレスポンス"""
+    content_type = (
+        content_type
+        or mimetypes.guess_type(filename)[0]
+        or "application/octet-stream"
+    )
+    prefix = settings.BLOB_X_ACCEL_PREFIX
+    if not prefix:
+        return FileResponse(
+            file.open("rb"),
+            as_attachment=as_attachment,
+            filename=filename,
+            content_type=content_type,
+        )
+
+    response = HttpResponse(content_type=content_type)
+    response["X-Accel-Redirect"] = prefix.rstrip("/") + "/" + file.name
+    response["Content-Disposition"] = content_disposition_header(
+        as_attachment, filename
+    )
+    # 内容が変わらないので、ブラウザに長くキャッシュさせてよい（認証が必要なので private）
+    response["Cache-Control"] = "private, max-age=31536000, immutable"
+    return response
+
+
+def serve_blob(blob, filename, content_type=None):
+    """Blob をダウンロードさせるレスポンス"""
+    return serve_file(blob.file, filename, content_type)
+
+
+def orphans():
+    """どこからも参照されていない Blob"""
+    queryset = Blob.objects.all()
+    for relation in Blob._meta.related_objects:
+        queryset = queryset.filter(
+            **{f"{relation.field.related_query_name()}__isnull": True}
+        )
+    return queryset
+
+
+def delete_orphans(before):
+    """before より前に作られた、参照されていない Blob をファイルごと削除する
+
+    保存直後でまだ参照されていない Blob を消さないよう、作成から時間が経ったものだけを対象にする。
+    """
+    deleted = 0
+    candidates = orphans().filter(created_at__lt=before).values_list(
+        "pk", "file", "preview"
+    )
+    for pk, *names in list(candidates):
+        # 確認してから削除するまでの間に参照された場合は残す
+        if orphans().filter(pk=pk).delete()[0]:
+            for name in filter(None, names):
+                default_storage.delete(name)
+            deleted += 1
+    return deleted
@@ -0,0 +1,84 @@
+"""カテゴリツリーのプロセス内キャッシュと、下位カテゴリを含む絞り込み
+
+ツリー全体を各プロセスに保持し、共有キャッシュのバージョンが
+変わったときだけ読み直す。カテゴリの保存・移動・削除でバージョンを
+更新するので、他のワーカーにも次のリクエストで反映される。
+"""
+
+import threading
+import uuid
+
+from django.core.cache import cache
+
+from .models import Category
+
+CATEGORY_TREE_VERSION_KEY = "common:category_tree_version"
+
+_lock = threading.Lock()
+_tree = None
+_tree_version = None
+
+
+class CategoryTree:
+    """ツリー順（tree_id, lft）に並べたカテゴリ"""
+
+    def __init__(self, categories):
+        self.nodes = tuple(categories)
+        self._by_pk = {category.pk: category for category in self.nodes}
+
+    def __iter__(self):
+        return iter(self.nodes)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    def get(self, pk):
+        return self._by_pk.get(pk)
+
+    def descendant_ids(self, category, include_self=True):
+        """下位カテゴリの id（MPTT の lft/rght の範囲から求める）"""
+        return {
+            node.pk
+            for node in self.nodes
+            if node.tree_id == category.tree_id
+            and category.lft <= node.lft <= category.rght
+            and (include_self or node.pk != category.pk)
+        }
+
+
+def get_tree():
+    """キャッシュしたカテゴリツリーを返す。共有キャッシュのバージョンが変わっていれば読み直す"""
+    global _tree, _tree_version
+
+    version = cache.get(CATEGORY_TREE_VERSION_KEY)
+    if version is None:
+        cache.add(CATEGORY_TREE_VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(CATEGORY_TREE_VERSION_KEY)
+
+    with _lock:
+        if _tree is None or _tree_version != version:
+            # 読み込み中に更新されても、先に読んだバージョンで登録するので次回読み直される
+            _tree = CategoryTree(Category.objects.order_by("tree_id", "lft"))
+            _tree_version = version
+        return _tree
+
+
+def invalidate_tree():
+    """全プロセスのカテゴリツリーを無効にする"""
+    cache.set(CATEGORY_TREE_VERSION_KEY, uuid.uuid4().hex, None)
+
+
+def filter_by_category(queryset, category, include_descendants=False, field="category"):
+    """カテゴリで絞り込む
+
+    include_descendants のときは下位カテゴリも含める。id の一覧に展開せず、
+    tree_id と lft の範囲の条件にするので (tree_id, lft) のインデックスが使える。
+    """
+    if not include_descendants:
+        return queryset.filter(**{field: category})
+    return queryset.filter(
+        **{
+            f"{field}__tree_id": category.tree_id,
+            f"{field}__lft__range": (category.lft, category.rght),
+        }
+    )
@@ -0,0 +1,56 @@
+"""ジョブのワーカーとキャッシュの設定を起動時に確かめる"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+from django.db import DatabaseError
+from django.utils import timezone
+
+PER_PROCESS_CACHES = (
+    "django.core.cache.backends.locmem.LocMemCache",
+    "django.core.cache.backends.dummy.DummyCache",
+)
+
+
+@register(Tags.caches)
+def check_shared_cache(app_configs, **kwargs):
+    """ワーカーで実行するジョブのキャッシュ破棄が web に届くか"""
+    backend = settings.CACHES["default"]["BACKEND"]
+    if settings.JOBS_EAGER or backend not in PER_PROCESS_CACHES:
+        return []
+    return [
+        Warning(
+            "キャッシュがプロセスごとに分かれているため、run_jobs のワーカーでの"
+            "ダッシュボード統計などの破棄が web に反映されません。",
+            hint="CACHE_URL に web とワーカーで共有するキャッシュ（filecache:// など）を指定してください。",
+            id="common.W001",
+        )
+    ]
+
+
+@register(Tags.database)
+def check_job_runner(app_configs, databases=None, **kwargs):
+    """実行予定を過ぎても取り出されないジョブがあれば、ワーカーが動いていない"""
+    if settings.JOBS_EAGER or not databases:
+        return []
+    from .models import Job
+
+    overdue = timezone.now() - timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+    try:
+        count = Job.objects.filter(
+            failed_at__isnull=True, locked_until__isnull=True, run_at__lt=overdue
+        ).count()
+    except DatabaseError:
+        # マイグレーション前など
+        return []
+    if not count:
+        return []
+    return [
+        Warning(
+            f"実行予定から {settings.JOB_LOCK_TIMEOUT} 秒以上取り出されていないジョブが"
+            f" {count} 件あります。",
+            hint="python manage.py run_jobs でワーカーを起動するか、開発環境では JOBS_EAGER を有効にしてください。",
+            id="common.W002",
+        )
+    ]
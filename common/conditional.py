@@ -0,0 +1,59 @@
+"""詳細ページの条件付き GET（ETag）
+
+ブラウザが持っている版と変わっていなければ、テンプレートを描画せずに 304 を返す。
+ページにはログイン中のユーザー名や CSRF トークンも含まれるので、ETag には
+表示する内容の更新日時などに加えて、ユーザー・CSRF の値・部分キャッシュのバージョンを含める。
+これらは日時では表せないので Last-Modified は付けない（If-Modified-Since だけのクライアントには
+毎回本文を返す）。
+"""
+
+import hashlib
+
+from django.contrib.messages import get_messages
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+)
+from django.utils.http import quote_etag
+
+from .fragments import fragment_version
+
+
+class ConditionalDetailMixin:
+    """DetailView に条件付き GET を付ける
+
+    get_etag_values() で ETag に含める値のリストを返す。
+    get_object() は 304 を返す場合も1回だけ呼ばれる。
+    """
+
+    def get_etag_values(self):
+        return [self.object.updated_at]
+
+    def get_etag(self, values):
+        request = self.request
+        values = [
+            *values,
+            request.user.pk,
+            request.META.get("CSRF_COOKIE", ""),
+            fragment_version(),
+        ]
+        digest = hashlib.sha256(repr(values).encode()).hexdigest()[:32]
+        return quote_etag(digest)
+
+    def get(self, request, *args, **kwargs):
+        self.object = self.get_object()
+        # 表示待ちのメッセージがあるときは、必ず描画して表示する
+        if len(get_messages(request)):
+            return self.render_to_response(self.get_context_data(object=self.object))
+
+        etag = self.get_etag(self.get_etag_values())
+        response = get_conditional_response(request, etag=etag)
+        if response is None:
+            context = self.get_context_data(object=self.object)
+            response = self.render_to_response(context)
+        response.headers.setdefault("ETag", etag)
+        # 毎回確認させる（変わっていなければ 304 で本文は送らない）
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ["Cookie"])
+        return response
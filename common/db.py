@@ -0,0 +1,77 @@
+"""SQLite の書き込みロックの競合への対処"""
+
+import asyncio
+import functools
+import logging
+import random
+import time
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.db import OperationalError, connection
+
+logger = logging.getLogger(__name__)
+
+
+def is_lock_error(error):
+    """ロック待ちのタイムアウトによる失敗かどうか"""
+    message = str(error).lower()
+    return "database is locked" in message or "database table is locked" in message
+
+
+def retry_on_lock(func):
+    """ロック待ちで失敗した書き込みを、間隔を空けてやり直す
+
+    トランザクションの途中ではやり直せないので、トランザクションの外側で
+    呼ばれた場合のみ再試行する。中で行う書き込みは1トランザクションにまとめておくこと。
+    async 関数にも使える。
+    """
+
+    def should_retry(error, attempt):
+        return (
+            attempt < settings.DATABASE_LOCK_RETRIES
+            and is_lock_error(error)
+            and not connection.in_atomic_block
+        )
+
+    def backoff(attempt):
+        # 同時に失敗したワーカーが揃ってやり直さないように揺らぎを入れる
+        delay = settings.DATABASE_LOCK_RETRY_DELAY * 2**attempt
+        delay *= random.uniform(0.5, 1.5)
+        logger.warning(
+            "%s: ロック待ちで失敗したため %.3f 秒後にやり直します（%d回目）",
+            func.__qualname__,
+            delay,
+            attempt + 1,
+        )
+        return delay
+
+    if iscoroutinefunction(func):
+
+        @functools.wraps(func)
+        async def async_wrapper(*args, **kwargs):
+            attempt = 0
+            while True:
+                try:
+                    return await func(*args, **kwargs)
+                except OperationalError as e:
+                    if not should_retry(e, attempt):
+                        raise
+                await asyncio.sleep(backoff(attempt))
+                attempt += 1
+
+        return async_wrapper
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        attempt = 0
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except OperationalError as e:
+                if not should_retry(e, attempt):
+                    raise
+            time.sleep(backoff(attempt))
+            attempt += 1
+
+    return wrapper
@@ -0,0 +1,108 @@
+import re
+
+from django import forms
+from django.forms.models import ModelChoiceIterator
+
+from .categories import get_tree
+from .models import Category, Tag
+
+TAG_SEPARATOR = re.compile(r"[,、，]")
+
+
+class TagNamesField(forms.CharField):
+    """カンマ区切りのタグ名を入力し、タグ名のリストとして受け取るフィールド
+
+    未登録のタグ名は保存時に作成する（フォームに TagNamesFormMixin を使う）。
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("required", False)
+        kwargs.setdefault("help_text", "カンマ区切りで入力")
+        kwargs.setdefault(
+            "widget",
+            forms.TextInput(
+                attrs={"class": "form-control", "placeholder": "カンマ区切りで入力"}
+            ),
+        )
+        super().__init__(**kwargs)
+
+    def prepare_value(self, value):
+        if isinstance(value, str) or value is None:
+            return value
+        return ", ".join(tag.name for tag in value)
+
+    def to_python(self, value):
+        value = super().to_python(value)
+        names = (name.strip() for name in TAG_SEPARATOR.split(value))
+        return list(dict.fromkeys(filter(None, names)))
+
+    def validate(self, value):
+        super().validate(value)
+        max_length = Tag._meta.get_field("name").max_length
+        for name in value:
+            if len(name) > max_length:
+                raise forms.ValidationError(
+                    f"タグ名は{max_length}文字以内で入力してください。（{name}）"
+                )
+
+    def has_changed(self, initial, data):
+        return self.prepare_value(initial or []) != ", ".join(self.to_python(data))
+
+
+class TagNamesFormMixin:
+    """TagNamesField を持つ ModelForm 用。タグ名のタグを保存時に作成して設定する
+
+    検証の時点では作成しないので、保存しなかったフォームのタグは残らない。
+    """
+
+    def _save_m2m(self):
+        for name, field in self.fields.items():
+            if isinstance(field, TagNamesField) and name in self.cleaned_data:
+                self.cleaned_data[name] = Tag.objects.from_names(self.cleaned_data[name])
+        super()._save_m2m()
+
+
+class CategoryChoiceIterator(ModelChoiceIterator):
+    def __iter__(self):
+        if self.field.empty_label is not None:
+            yield ("", self.field.empty_label)
+        for category in get_tree():
+            yield self.choice(category)
+
+    def __len__(self):
+        return len(get_tree()) + (self.field.empty_label is not None)
+
+    def __bool__(self):
+        return self.field.empty_label is not None or bool(len(get_tree()))
+
+
+class CategoryChoiceField(forms.ModelChoiceField):
+    """カテゴリ選択
+
+    選択肢の表示と入力値の検証にキャッシュしたカテゴリツリーを使うので、
+    データベースに問い合わせない。階層は名前の前の「---」で表す。
+    """
+
+    iterator = CategoryChoiceIterator
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("queryset", Category.objects.all())
+        super().__init__(**kwargs)
+
+    def label_from_instance(self, obj):
+        return f"{'---' * obj.level} {obj.name}".strip()
+
+    def to_python(self, value):
+        if value in self.empty_values:
+            return None
+        try:
+            category = get_tree().get(int(value))
+        except (TypeError, ValueError):
+            category = None
+        if category is None:
+            raise forms.ValidationError(
+                self.error_messages["invalid_choice"],
+                code="invalid_choice",
+                params={"value": value},
+            )
+        return category
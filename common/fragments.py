@@ -0,0 +1,29 @@
+"""テンプレートの部分キャッシュ（{% cache %}）に使うバージョン
+
+一覧の行などは、表示する行自身の値（updated_at・対応件数など）をキーに含めるので、
+行が変わればキーも変わる。行に表示しているカテゴリ名・タグ名・ユーザー名は
+行の値からは分からないため、それらが変更・削除されたときはこのバージョンを更新して
+すべての部分キャッシュを無効にする（めったに変わらないので、まとめて捨ててよい）。
+
+詳細ページは条件付き GET（common.conditional）で変わっていなければ描画自体を省くので、
+部分キャッシュは使わない。
+"""
+
+import uuid
+
+from django.core.cache import cache
+
+FRAGMENT_VERSION_KEY = "common:fragment_version"
+
+
+def fragment_version():
+    version = cache.get(FRAGMENT_VERSION_KEY)
+    if version is None:
+        cache.add(FRAGMENT_VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(FRAGMENT_VERSION_KEY)
+    return version
+
+
+def invalidate_fragments():
+    """全プロセスの部分キャッシュを無効にする"""
+    cache.set(FRAGMENT_VERSION_KEY, uuid.uuid4().hex, None)
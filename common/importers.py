@@ -0,0 +1,355 @@
+"""CSV / JSONL からの一括取り込みの共通部品
+
+1行ずつ読みながら batch_size 件ごとに bulk_create するので、
+ファイルの大きさに関わらずメモリ使用量は一定に保たれる。
+取り込めなかった行は理由とともに記録し、残りの行は取り込みを続ける。
+"""
+
+import csv
+import json
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.exceptions import ValidationError
+from django.core.management.base import BaseCommand, CommandError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from .categories import get_tree
+from .forms import TAG_SEPARATOR
+from .models import Category, Tag
+
+
+class RowError(Exception):
+    """取り込めない行"""
+
+
+@contextmanager
+def preserve_timestamps(*models):
+    """auto_now / auto_now_add を一時的に止めて、指定した日時をそのまま保存する"""
+    fields = [
+        field
+        for model in models
+        for field in model._meta.concrete_fields
+        if getattr(field, "auto_now", False) or getattr(field, "auto_now_add", False)
+    ]
+    saved = [(field, field.auto_now, field.auto_now_add) for field in fields]
+    for field in fields:
+        field.auto_now = field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field, auto_now, auto_now_add in saved:
+            field.auto_now, field.auto_now_add = auto_now, auto_now_add
+
+
+def read_rows(path, format=None):
+    """(行番号, 値の dict) を1行ずつ返す。形式は拡張子から判断する"""
+    path = Path(path)
+    format = format or ("jsonl" if path.suffix in (".jsonl", ".ndjson") else "csv")
+    with path.open(encoding="utf-8-sig", newline="") as f:
+        if format == "csv":
+            reader = csv.DictReader(f)
+            for row in reader:
+                yield reader.line_num, row
+            return
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            try:
+                row = json.loads(line)
+            except ValueError as e:
+                yield line_number, RowError(f"JSON として読み込めません: {e}")
+                continue
+            yield line_number, row
+
+
+def text(row, name, required=False, max_length=None):
+    value = row.get(name)
+    value = "" if value is None else str(value).strip()
+    if required and not value:
+        raise RowError(f"{name} は必須です。")
+    if max_length and len(value) > max_length:
+        raise RowError(f"{name} は{max_length}文字以内にしてください。")
+    return value
+
+
+def email(row, name, required=False):
+    value = text(row, name, required)
+    if value:
+        try:
+            validate_email(value)
+        except ValidationError:
+            raise RowError(f"{name} がメールアドレスの形式ではありません: {value}")
+    return value
+
+
+def choice(row, name, choices, default):
+    value = text(row, name) or default
+    if value not in dict(choices):
+        raise RowError(f"{name} の値が不正です: {value}")
+    return value
+
+
+def boolean(row, name):
+    value = row.get(name)
+    if isinstance(value, bool):
+        return value
+    return str(value or "").strip().lower() in ("1", "true", "yes", "on")
+
+
+def datetime_value(row, name, default=None):
+    value = text(row, name)
+    if not value:
+        return default
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise RowError(f"{name} が日時の形式ではありません: {value}")
+    if timezone.is_naive(parsed):
+        parsed = timezone.make_aware(parsed)
+    return parsed
+
+
+def names(row, name):
+    """タグ名のリスト（JSON の配列かカンマ区切り）"""
+    value = row.get(name) or []
+    if isinstance(value, str):
+        value = TAG_SEPARATOR.split(value)
+    result = list(dict.fromkeys(filter(None, (str(v).strip() for v in value))))
+    max_length = Tag._meta.get_field("name").max_length
+    for tag_name in result:
+        if len(tag_name) > max_length:
+            raise RowError(f"タグ名は{max_length}文字以内にしてください: {tag_name}")
+    return result
+
+
+def json_list(row, name):
+    """入れ子の値（CSV では JSON 文字列の列）"""
+    value = row.get(name) or []
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            raise RowError(f"{name} を JSON として読み込めません。")
+    if not isinstance(value, list):
+        raise RowError(f"{name} は配列で指定してください。")
+    return value
+
+
+class TagMap:
+    """タグ名 → ID。未登録のタグはまとめて作成する"""
+
+    def __init__(self):
+        self._ids = dict(Tag.objects.values_list("name", "pk"))
+
+    def resolve(self, tag_names):
+        missing = [name for name in set(tag_names) if name not in self._ids]
+        if missing:
+            Tag.objects.bulk_create(
+                [Tag(name=name) for name in missing], ignore_conflicts=True
+            )
+            self._ids.update(
+                Tag.objects.filter(name__in=missing).values_list("name", "pk")
+            )
+        return self._ids
+
+
+class CategoryMap:
+    """「親/子」形式のカテゴリのパス → ID。未登録のカテゴリは作成する"""
+
+    SEPARATOR = "/"
+
+    def __init__(self):
+        self._ids = {}
+        paths = {}
+        for category in get_tree():
+            parent_path = paths.get(category.parent_id)
+            path = (
+                f"{parent_path}{self.SEPARATOR}{category.name}"
+                if parent_path
+                else category.name
+            )
+            paths[category.pk] = path
+            self._ids.setdefault(path, category.pk)
+
+    def parse(self, path):
+        """パスを正規化する（未指定は ""）。カテゴリ名が長すぎる行は取り込めない"""
+        parts = [part.strip() for part in path.split(self.SEPARATOR) if part.strip()]
+        max_length = Category._meta.get_field("name").max_length
+        for part in parts:
+            if len(part) > max_length:
+                raise RowError(f"カテゴリ名が長すぎます: {part}")
+        return self.SEPARATOR.join(parts)
+
+    def resolve(self, paths):
+        """正規化したパス → ID。未登録のカテゴリは作成する
+
+        取り込む行の保存と同じトランザクションで呼び、取り込めなかった行のカテゴリは作らない。
+        """
+        for path in paths:
+            if not path or path in self._ids:
+                continue
+            parts = path.split(self.SEPARATOR)
+            parent_id = None
+            for i in range(len(parts)):
+                key = self.SEPARATOR.join(parts[: i + 1])
+                if key not in self._ids:
+                    # カテゴリは件数が少ないので、MPTT の位置計算のため1件ずつ保存する
+                    self._ids[key] = Category.objects.create(
+                        name=parts[i], parent_id=parent_id
+                    ).pk
+                parent_id = self._ids[key]
+        return self._ids
+
+
+class UserMap:
+    """ユーザー名 → ID（存在しないユーザーは None）"""
+
+    def __init__(self):
+        self._ids = {}
+        self._model = get_user_model()
+
+    def get(self, username):
+        if username not in self._ids:
+            self._ids[username] = (
+                self._model.objects.filter(username=username)
+                .values_list("pk", flat=True)
+                .first()
+            )
+        return self._ids[username]
+
+
+class BulkImporter(ABC):
+    """行を組み立てて batch_size 件ごとに保存する
+
+    build() で1行分のオブジェクトを作り（取り込めない場合は RowError）、
+    save_batch() で1トランザクションにまとめて保存する。
+    """
+
+    def __init__(self, batch_size=1000, progress=None, reject=None, default_user=None):
+        self.batch_size = batch_size
+        self.progress = progress or (lambda imported, rejected: None)
+        self.reject = reject or (lambda line_number, row, message: None)
+        self.default_user_id = default_user.pk if default_user else None
+        self.users = UserMap()
+        self.imported = 0
+        self.rejected = 0
+
+    def user(self, username, name, required=False):
+        """ユーザー名 → ID。必須で未指定の場合は default_user を使う"""
+        if not username:
+            if required and self.default_user_id is None:
+                raise RowError(f"{name} は必須です。")
+            return self.default_user_id if required else None
+        user_id = self.users.get(username)
+        if user_id is None:
+            raise RowError(f"{name} のユーザーが存在しません: {username}")
+        return user_id
+
+    @abstractmethod
+    def build(self, row):
+        """1行分のオブジェクトを作る。取り込めない行は RowError"""
+
+    @abstractmethod
+    def save_batch(self, batch):
+        """build() で作ったオブジェクトをまとめて保存する（トランザクションの中で呼ばれる）"""
+
+    def finish(self):
+        """すべての行を保存した後の処理"""
+
+    def run(self, rows):
+        batch = []
+        for line_number, row in rows:
+            try:
+                if isinstance(row, Exception):
+                    raise row
+                if not isinstance(row, dict):
+                    raise RowError("行の形式が不正です。")
+                batch.append(self.build(row))
+            except RowError as e:
+                self.rejected += 1
+                self.reject(line_number, row, str(e))
+                continue
+            if len(batch) >= self.batch_size:
+                self._save(batch)
+                batch = []
+        self._save(batch)
+        self.finish()
+        return self.imported, self.rejected
+
+    def _save(self, batch):
+        if not batch:
+            return
+        with transaction.atomic():
+            self.save_batch(batch)
+        self.imported += len(batch)
+        self.progress(self.imported, self.rejected)
+
+
+class ImportCommand(BaseCommand):
+    """取り込みコマンドの共通部分。importer_class を指定して使う"""
+
+    importer_class = None
+
+    def add_arguments(self, parser):
+        parser.add_argument("path", help="取り込むファイル（CSV または JSONL）")
+        parser.add_argument(
+            "--format", choices=["csv", "jsonl"], help="ファイル形式（省略時は拡張子から判断）"
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=1000, help="一度に登録する件数"
+        )
+        parser.add_argument(
+            "--default-user", help="ユーザーが指定されていない行に使うユーザー名"
+        )
+        parser.add_argument(
+            "--rejects", help="取り込めなかった行を書き出す JSONL ファイル"
+        )
+
+    def handle(self, *args, **options):
+        default_user = None
+        if options["default_user"]:
+            default_user = (
+                get_user_model().objects.filter(username=options["default_user"]).first()
+            )
+            if default_user is None:
+                raise CommandError(
+                    f"ユーザーが存在しません: {options['default_user']}"
+                )
+
+        rejects = open(options["rejects"], "w", encoding="utf-8") if options["rejects"] else None
+
+        def reject(line_number, row, message):
+            self.stderr.write(f"{line_number}行目: {message}")
+            if rejects:
+                record = {"line": line_number, "error": message}
+                if isinstance(row, dict):
+                    record["row"] = row
+                rejects.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+
+        def progress(imported, rejected):
+            self.stdout.write(f"{imported}件登録（{rejected}件除外）")
+
+        importer = self.importer_class(
+            batch_size=options["batch_size"],
+            progress=progress,
+            reject=reject,
+            default_user=default_user,
+        )
+        try:
+            imported, rejected = importer.run(
+                read_rows(options["path"], options["format"])
+            )
+        except OSError as e:
+            raise CommandError(f"ファイルを読み込めませんでした: {e}")
+        finally:
+            if rejects:
+                rejects.close()
+
+        self.stdout.write(
+            self.style.SUCCESS(f"{imported}件を取り込みました。（{rejected}件除外）")
+        )
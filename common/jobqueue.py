@@ -0,0 +1,222 @@
+"""データベースに保存するジョブキュー
+
+保存処理のトランザクションの中で enqueue() すると、ジョブも同じトランザクションで
+書き込まれる。確定した変更のジョブだけが残り、ロールバックすればジョブも消える。
+run_jobs コマンドのワーカーが、実行予定日時を過ぎたジョブを取り出して実行する。
+
+- まとめて実行: 同じ name・key の未実行のジョブは一度に取り出し、payload の
+  リストを処理に渡す（検索インデックスの更新なら、溜まった ID を1回で処理する）。
+- 再試行: 失敗したジョブは間隔を倍にしながら max_attempts 回まで実行し直す。
+  それでも失敗したものは failed_at を付けて残す（管理画面から再実行できる）。
+- ジョブを取り出したワーカーが止まった場合は、JOB_LOCK_TIMEOUT 秒後に別のワーカーが取り出す。
+
+処理は各アプリの jobs.py で @handler を付けて登録する。
+JOBS_EAGER を有効にすると、ワーカーを使わずにトランザクション確定後にその場で実行する（開発用）。
+"""
+
+import contextlib
+import logging
+import os
+import random
+import socket
+import traceback
+from collections import namedtuple
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .db import retry_on_lock
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+
+Handler = namedtuple("Handler", ["name", "func", "max_attempts", "atomic", "batch_size"])
+
+
+registry = {}
+
+
+class LockLost(Exception):
+    """実行中に期限が切れ、ジョブを別のワーカーに取られた"""
+
+
+def handler(name, max_attempts=5, atomic=False, batch_size=500):
+    """ジョブの処理を登録するデコレーター。処理は payload のリストを受け取る
+
+    atomic の処理はジョブの削除と同じトランザクションで実行し、ちょうど1回だけ反映する
+    （件数の加算など、2回実行すると結果が変わる処理に使う）。
+    そうでない処理は、同じ内容で2回実行されても問題ないように作ること。
+    """
+
+    def decorator(func):
+        registry[name] = Handler(name, func, max_attempts, atomic, batch_size)
+        return func
+
+    return decorator
+
+
+def enqueue(name, payload=None, key="", delay=0):
+    """ジョブを登録する。payload は JSON にできる値"""
+    if name not in registry:
+        raise LookupError(f"登録されていないジョブです: {name}")
+    if settings.JOBS_EAGER:
+        transaction.on_commit(partial(run_now, name, [payload]))
+        return None
+    return Job.objects.create(
+        name=name,
+        key=key,
+        payload=payload,
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def enqueue_many(name, items, delay=0):
+    """[(key, payload), ...] のジョブを1回の INSERT で登録する"""
+    if name not in registry:
+        raise LookupError(f"登録されていないジョブです: {name}")
+    if settings.JOBS_EAGER:
+        for _, payload in items:
+            transaction.on_commit(partial(run_now, name, [payload]))
+        return []
+    run_at = timezone.now() + timedelta(seconds=delay)
+    return Job.objects.bulk_create(
+        [Job(name=name, key=key, payload=payload, run_at=run_at) for key, payload in items]
+    )
+
+
+def run_now(name, payloads):
+    """ワーカーを通さずに実行する"""
+    job_handler = registry[name]
+    with transaction.atomic() if job_handler.atomic else contextlib.nullcontext():
+        job_handler.func(payloads)
+
+
+def pending(name):
+    """未実行（実行中を含む）のジョブ。失敗して諦めたものは含まない"""
+    return Job.objects.filter(name=name, failed_at__isnull=True)
+
+
+def _due(now):
+    return Job.objects.filter(
+        Q(locked_until__isnull=True) | Q(locked_until__lt=now),
+        failed_at__isnull=True,
+        run_at__lte=now,
+    )
+
+
+@retry_on_lock
+def claim(worker):
+    """実行するジョブを1組取り出す（最も古いジョブと同じ name・key のものをまとめて）"""
+    now = timezone.now()
+    with transaction.atomic():
+        first = _due(now).order_by("run_at", "pk").values_list("name", "key").first()
+        if first is None:
+            return []
+        name, key = first
+        job_handler = registry.get(name)
+        batch_size = job_handler.batch_size if job_handler else 1
+        ids = list(
+            _due(now)
+            .filter(name=name, key=key)
+            .order_by("run_at", "pk")
+            .select_for_update(skip_locked=True)
+            .values_list("pk", flat=True)[:batch_size]
+        )
+        Job.objects.filter(pk__in=ids).update(
+            locked_by=worker,
+            locked_until=now + timedelta(seconds=settings.JOB_LOCK_TIMEOUT),
+            attempts=F("attempts") + 1,
+        )
+    return list(Job.objects.filter(pk__in=ids).order_by("pk"))
+
+
+def run(jobs, worker):
+    """取り出したジョブを実行する。成功したら削除し、失敗したら再試行を予約する"""
+    name = jobs[0].name
+    job_handler = registry.get(name)
+    try:
+        if job_handler is None:
+            raise LookupError(f"登録されていないジョブです: {name}")
+        payloads = [job.payload for job in jobs]
+        if job_handler.atomic:
+            with transaction.atomic():
+                job_handler.func(payloads)
+                _finish(jobs, worker, strict=True)
+        else:
+            job_handler.func(payloads)
+            _finish(jobs, worker)
+    except Exception:
+        logger.exception("ジョブ %s（%d件）が失敗しました", name, len(jobs))
+        _retry_later(jobs, worker, job_handler, traceback.format_exc())
+        return False
+    return True
+
+
+@retry_on_lock
+def _finish(jobs, worker, strict=False):
+    deleted, _ = Job.objects.filter(
+        pk__in=[job.pk for job in jobs], locked_by=worker
+    ).delete()
+    if strict and deleted != len(jobs):
+        # 別のワーカーも実行しているので、この実行は取り消す
+        raise LockLost(f"{jobs[0].name} の実行期限が切れました")
+
+
+def backoff(attempts):
+    """attempts 回失敗した後、次に実行するまでの秒数"""
+    delay = min(
+        settings.JOB_RETRY_DELAY * 2 ** (attempts - 1), settings.JOB_RETRY_MAX_DELAY
+    )
+    # 同時に失敗したジョブが揃って実行されないように揺らぎを入れる
+    return delay * random.uniform(0.5, 1.5)
+
+
+@retry_on_lock
+@transaction.atomic
+def _retry_later(jobs, worker, job_handler, error):
+    # 期限が切れて別のワーカーが取り出したジョブには触れない
+    owned = set(
+        Job.objects.filter(
+            pk__in=[job.pk for job in jobs], locked_by=worker
+        ).values_list("pk", flat=True)
+    )
+    jobs = [job for job in jobs if job.pk in owned]
+    now = timezone.now()
+    max_attempts = job_handler.max_attempts if job_handler else 1
+    for job in jobs:
+        job.locked_by = ""
+        job.locked_until = None
+        job.last_error = error
+        if job.attempts >= max_attempts:
+            job.failed_at = now
+        else:
+            job.run_at = now + timedelta(seconds=backoff(job.attempts))
+    Job.objects.bulk_update(
+        jobs, ["locked_by", "locked_until", "last_error", "failed_at", "run_at"]
+    )
+
+
+def work(stop, poll_interval, once=False):
+    """stop（threading.Event 互換）が設定されるまでジョブを実行し続ける
+
+    once の場合は、実行できるジョブがなくなった時点で終わる。実行したジョブ数を返す。
+    """
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    count = 0
+    while not stop.is_set():
+        jobs = claim(worker)
+        if not jobs:
+            if once:
+                break
+            connection.close_if_unusable_or_obsolete()
+            stop.wait(poll_interval)
+            continue
+        run(jobs, worker)
+        count += len(jobs)
+    connection.close()
+    return count
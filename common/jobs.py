@@ -0,0 +1,9 @@
+from .jobqueue import handler
+from .previews import PROCESS_JOB, process_blob
+
+
+@handler(PROCESS_JOB)
+def process_blobs(payloads):
+    """同じ Blob のジョブはまとめて取り出されるので、処理は1回で済む"""
+    payload = payloads[0]
+    process_blob(payload["blob"], payload.get("content_type", ""))
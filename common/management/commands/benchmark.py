@@ -0,0 +1,308 @@
+import json
+import math
+import platform
+import random
+import subprocess
+import time
+from dataclasses import dataclass
+from pathlib import Path
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Max, Min
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from inquiry.models import Inquiry, Response
+from knowledge.models import Knowledge
+
+User = get_user_model()
+
+SEARCH_TERMS = ["ログイン", "請求書", "パスワード 再設定", "エラー"]
+
+
+@dataclass
+class Scenario:
+    name: str
+    method: str
+    path: object  # サンプルを受け取って URL を返す関数
+    data: object = None  # POST の場合に送る値を返す関数
+    writes: bool = False
+
+
+SCENARIOS = [
+    Scenario("dashboard", "get", lambda s: reverse("common:dashboard")),
+    Scenario("inquiry_list", "get", lambda s: reverse("inquiry:inquiry_list")),
+    Scenario(
+        "inquiry_list_filtered",
+        "get",
+        lambda s: reverse("inquiry:inquiry_list") + "?status=in_progress&priority=high",
+    ),
+    Scenario(
+        "inquiry_list_search",
+        "get",
+        lambda s: reverse("inquiry:inquiry_list") + f"?q={s.term()}",
+    ),
+    Scenario(
+        "inquiry_detail",
+        "get",
+        lambda s: reverse("inquiry:inquiry_detail", args=[s.inquiry()]),
+    ),
+    Scenario(
+        "inquiry_facets",
+        "get",
+        lambda s: reverse("inquiry:inquiry_facets") + "?status=new",
+    ),
+    Scenario("knowledge_list", "get", lambda s: reverse("knowledge:knowledge_list")),
+    Scenario(
+        "knowledge_list_search",
+        "get",
+        lambda s: reverse("knowledge:knowledge_list") + f"?q={s.term()}",
+    ),
+    Scenario(
+        "knowledge_detail",
+        "get",
+        lambda s: reverse("knowledge:knowledge_detail", args=[s.knowledge()]),
+    ),
+    Scenario(
+        "inquiry_status_update",
+        "post",
+        lambda s: reverse("inquiry:inquiry_status_update", args=[s.inquiry()]),
+        data=lambda s: {"status": s.choice(dict(Inquiry.STATUS_CHOICES))},
+        writes=True,
+    ),
+    Scenario(
+        "inquiry_assign",
+        "post",
+        lambda s: reverse("inquiry:inquiry_assign", args=[s.inquiry()]),
+        data=lambda s: {"assignee_id": s.assignee()},
+        writes=True,
+    ),
+]
+
+
+class Samples:
+    """シナリオで使う ID や検索語を乱数で選ぶ"""
+
+    def __init__(self, seed):
+        self.random = random.Random(seed)
+        self.inquiry_ids = self._sample_ids(Inquiry)
+        self.knowledge_ids = self._sample_ids(Knowledge)
+        self.assignee_ids = list(
+            User.objects.filter(is_staff=True).values_list("pk", flat=True)[:100]
+        )
+
+    def _sample_ids(self, model, size=200):
+        """ID の範囲から乱数で選ぶ（全件を読まずに済むように）"""
+        bounds = model.objects.aggregate(low=Min("pk"), high=Max("pk"))
+        if bounds["low"] is None:
+            return []
+        candidates = {
+            self.random.randint(bounds["low"], bounds["high"]) for _ in range(size)
+        }
+        return list(
+            model.objects.filter(pk__in=candidates).values_list("pk", flat=True)
+        ) or [bounds["low"]]
+
+    def choice(self, values):
+        return self.random.choice(list(values))
+
+    def term(self):
+        return self.choice(SEARCH_TERMS)
+
+    def inquiry(self):
+        return self.choice(self.inquiry_ids)
+
+    def knowledge(self):
+        return self.choice(self.knowledge_ids)
+
+    def assignee(self):
+        return self.choice(self.assignee_ids)
+
+
+def percentile(values, fraction):
+    """最近傍順位法による分位点"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def summarize(latencies, queries, errors):
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "mean_ms": round(sum(latencies) / len(latencies), 2) if latencies else None,
+        "p50_ms": round(percentile(latencies, 0.50), 2) if latencies else None,
+        "p95_ms": round(percentile(latencies, 0.95), 2) if latencies else None,
+        "p99_ms": round(percentile(latencies, 0.99), 2) if latencies else None,
+        "max_ms": round(max(latencies), 2) if latencies else None,
+        "queries_mean": round(sum(queries) / len(queries), 2) if queries else None,
+        "queries_max": max(queries) if queries else None,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = "主要な画面と AJAX エンドポイントの応答時間とクエリ数を計測します"
+
+    # --compare で比べる値
+    compare_keys = ("p50_ms", "p95_ms", "queries_mean")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--iterations", type=int, default=30, help="シナリオごとの計測回数"
+        )
+        parser.add_argument(
+            "--warmup", type=int, default=3, help="計測前に捨てるリクエストの回数"
+        )
+        parser.add_argument(
+            "--scenario",
+            action="append",
+            choices=[scenario.name for scenario in SCENARIOS],
+            help="計測するシナリオ（複数指定可。省略時はすべて）",
+        )
+        parser.add_argument(
+            "--read-only", action="store_true", help="データを更新するシナリオを除く"
+        )
+        parser.add_argument(
+            "--cold-cache",
+            action="store_true",
+            help="リクエストごとにキャッシュを消してから計測する",
+        )
+        parser.add_argument("--username", help="ログインするユーザー（省略時は最初のスタッフ）")
+        parser.add_argument("--seed", type=int, default=0, help="乱数のシード")
+        parser.add_argument("--output", help="結果を保存する JSON ファイル")
+        parser.add_argument("--compare", help="比較する過去の結果の JSON ファイル")
+
+    def handle(self, *args, **options):
+        user = self.get_user(options["username"])
+        client = Client(raise_request_exception=False)
+        client.force_login(user)
+        samples = Samples(options["seed"])
+        if not samples.inquiry_ids or not samples.knowledge_ids:
+            raise CommandError("データがありません。先に seed_data を実行してください。")
+
+        scenarios = [
+            scenario
+            for scenario in SCENARIOS
+            if (not options["scenario"] or scenario.name in options["scenario"])
+            and not (options["read_only"] and scenario.writes)
+        ]
+
+        results = {}
+        for scenario in scenarios:
+            results[scenario.name] = self.run_scenario(
+                client, scenario, samples, options
+            )
+            self.write_result(scenario.name, results[scenario.name])
+
+        report = {
+            "revision": git_revision(),
+            "created_at": timezone.now().isoformat(),
+            "environment": {
+                "python": platform.python_version(),
+                "django": django.get_version(),
+                "database": connection.vendor,
+                "cache": settings.CACHES["default"]["BACKEND"],
+            },
+            "dataset": {
+                "inquiries": Inquiry.objects.count(),
+                "responses": Response.objects.count(),
+                "knowledge": Knowledge.objects.count(),
+            },
+            "options": {
+                name: options[name]
+                for name in ("iterations", "warmup", "read_only", "cold_cache", "seed")
+            },
+            "results": results,
+        }
+        if options["output"]:
+            Path(options["output"]).write_text(
+                json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8"
+            )
+            self.stdout.write(self.style.SUCCESS(f"{options['output']} に保存しました。"))
+        if options["compare"]:
+            self.compare(report, options["compare"])
+
+    def get_user(self, username):
+        users = User.objects.filter(is_staff=True, is_active=True)
+        if username:
+            users = users.filter(username=username)
+        user = users.order_by("pk").first()
+        if user is None:
+            raise CommandError("ログインするスタッフユーザーが見つかりません。")
+        return user
+
+    def request(self, client, scenario, samples):
+        method = getattr(client, scenario.method)
+        path = scenario.path(samples)
+        if scenario.data:
+            return method(path, scenario.data(samples))
+        return method(path)
+
+    def run_scenario(self, client, scenario, samples, options):
+        for _ in range(options["warmup"]):
+            self.request(client, scenario, samples)
+
+        latencies, queries, errors = [], [], 0
+        for _ in range(options["iterations"]):
+            if options["cold_cache"]:
+                cache.clear()
+            with CaptureQueriesContext(connection) as context:
+                start = time.perf_counter()
+                response = self.request(client, scenario, samples)
+                elapsed = time.perf_counter() - start
+            latencies.append(elapsed * 1000)
+            queries.append(len(context.captured_queries))
+            if response.status_code >= 400:
+                errors += 1
+        return summarize(latencies, queries, errors)
+
+    def write_result(self, name, result):
+        if not result["requests"]:
+            self.stdout.write(f"{name:<24} なし")
+            return
+        line = (
+            f"{name:<24} p50 {result['p50_ms']:>8.2f}ms  p95 {result['p95_ms']:>8.2f}ms  "
+            f"p99 {result['p99_ms']:>8.2f}ms  クエリ {result['queries_mean']:>6.1f}"
+        )
+        if result["errors"]:
+            line += self.style.ERROR(f"  エラー {result['errors']}件")
+        self.stdout.write(line)
+
+    def compare(self, report, path):
+        try:
+            previous = json.loads(Path(path).read_text(encoding="utf-8"))
+        except (OSError, ValueError) as e:
+            raise CommandError(f"{path} を読み込めませんでした: {e}")
+
+        self.stdout.write(f"\n{previous.get('revision')} との比較")
+        for name, result in report["results"].items():
+            before = previous.get("results", {}).get(name)
+            if not before:
+                continue
+            changes = []
+            for key in self.compare_keys:
+                if before.get(key):
+                    ratio = (result[key] - before[key]) / before[key] * 100
+                    changes.append(f"{key} {before[key]} → {result[key]} ({ratio:+.1f}%)")
+            self.stdout.write(f"{name:<24} " + "  ".join(changes))
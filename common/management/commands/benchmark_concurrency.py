@@ -0,0 +1,219 @@
+import json
+import logging
+import multiprocessing
+import queue as queue_module
+import random
+import sys
+import time
+import traceback
+from pathlib import Path
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.core.signals import got_request_exception
+from django.db import OperationalError, connection, connections
+from django.test import Client
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from common.db import is_lock_error
+from .benchmark import Command as BenchmarkCommand
+from .benchmark import SCENARIOS, Samples, git_revision, percentile
+
+READ_SCENARIOS = [
+    "inquiry_list",
+    "inquiry_list_filtered",
+    "inquiry_detail",
+    "knowledge_detail",
+]
+WRITE_SCENARIOS = ["inquiry_status_update", "inquiry_assign"]
+
+
+def use_baseline():
+    """このプロセスの接続設定を Django の既定（ロールバックジャーナル・DEFERRED）に戻す
+
+    ジャーナルモードはファイルに残るが、通常の設定で次に接続したときに WAL に戻る。
+    """
+    settings_dict = connection.settings_dict
+    settings_dict["OPTIONS"] = {}
+    settings_dict["CONN_MAX_AGE"] = 0
+    connection.close()
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA journal_mode=DELETE")
+    connection.close()
+
+
+def run_worker(number, user_id, options, queue):
+    """1プロセス分の負荷をかけ、結果（失敗したときは {"error": トレースバック}）をキューに入れる"""
+    try:
+        output = measure(number, user_id, options)
+    except BaseException:
+        output = {"error": traceback.format_exc()}
+    finally:
+        connection.close()
+        # 親プロセスは全ワーカーの結果を待つので、失敗しても必ず返す
+        queue.put(output)
+
+
+def measure(number, user_id, options):
+    """1プロセス分の負荷をかけ、読み込み・書き込みごとの応答時間を返す"""
+    logging.getLogger("django.request").setLevel(logging.CRITICAL)
+    logging.getLogger("common.db").setLevel(logging.ERROR)
+
+    lock_errors = []
+
+    def record_lock_error(sender, **kwargs):
+        # got_request_exception は except 節の中で送られる
+        error = sys.exc_info()[1]
+        if isinstance(error, OperationalError) and is_lock_error(error):
+            lock_errors.append(error)
+
+    got_request_exception.connect(record_lock_error, weak=False)
+
+    scenarios = {scenario.name: scenario for scenario in SCENARIOS}
+    rng = random.Random(options["seed"] + number)
+    samples = Samples(options["seed"] + number)
+    client = Client(raise_request_exception=False)
+    client.force_login(get_user_model().objects.get(pk=user_id))
+
+    result = {
+        kind: {"latencies": [], "errors": 0, "lock_errors": 0}
+        for kind in ("read", "write")
+    }
+    retries = {"DATABASE_LOCK_RETRIES": 0} if options["baseline"] else {}
+    with override_settings(**retries):
+        deadline = time.monotonic() + options["duration"]
+        while time.monotonic() < deadline:
+            kind = "write" if rng.random() < options["write_ratio"] else "read"
+            scenario = scenarios[
+                rng.choice(WRITE_SCENARIOS if kind == "write" else READ_SCENARIOS)
+            ]
+            before = len(lock_errors)
+            start = time.perf_counter()
+            path = scenario.path(samples)
+            if scenario.data:
+                response = client.post(path, scenario.data(samples))
+            else:
+                response = client.get(path)
+            result[kind]["latencies"].append((time.perf_counter() - start) * 1000)
+            if response.status_code >= 400:
+                result[kind]["errors"] += 1
+            result[kind]["lock_errors"] += len(lock_errors) - before
+    return result
+
+
+def collect_outputs(processes, queue, poll_interval=1):
+    """全ワーカーの結果を集める。結果を返さずに終わったワーカーがあれば CommandError"""
+    outputs = []
+    while len(outputs) < len(processes):
+        try:
+            outputs.append(queue.get(timeout=poll_interval))
+        except queue_module.Empty:
+            # 強制終了されたワーカーは結果を返さない
+            crashed = [
+                process.exitcode
+                for process in processes
+                if process.exitcode not in (None, 0)
+            ]
+            if crashed or all(process.exitcode is not None for process in processes):
+                for process in processes:
+                    process.terminate()
+                raise CommandError(
+                    f"ワーカーが結果を返さずに終了しました（終了コード: {crashed}）。"
+                )
+    return outputs
+
+
+class Command(BaseCommand):
+    help = "複数プロセスから同時に読み書きしたときのスループットと応答時間を計測します"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--workers", type=int, default=6, help="同時に動かすプロセス数")
+        parser.add_argument("--duration", type=float, default=10, help="計測する秒数")
+        parser.add_argument(
+            "--write-ratio", type=float, default=0.2, help="書き込みの割合（0〜1）"
+        )
+        parser.add_argument(
+            "--baseline",
+            action="store_true",
+            help="WAL・BEGIN IMMEDIATE・再試行を使わない既定の設定で計測する",
+        )
+        parser.add_argument("--username", help="ログインするユーザー（省略時は最初のスタッフ）")
+        parser.add_argument("--seed", type=int, default=0, help="乱数のシード")
+        parser.add_argument("--output", help="結果を保存する JSON ファイル")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("SQLite 以外のデータベースでは計測できません。")
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise CommandError("fork を使えない環境では計測できません。")
+
+        user = BenchmarkCommand().get_user(options["username"])
+        if not Samples(options["seed"]).inquiry_ids:
+            raise CommandError("データがありません。先に seed_data を実行してください。")
+
+        if options["baseline"]:
+            use_baseline()
+        connections.close_all()
+
+        context = multiprocessing.get_context("fork")
+        queue = context.Queue()
+        processes = [
+            context.Process(target=run_worker, args=(i, user.pk, options, queue))
+            for i in range(options["workers"])
+        ]
+        start = time.monotonic()
+        for process in processes:
+            process.start()
+        # プロセスの終了を待つ前に取り出さないと、キューが詰まって終わらない
+        outputs = collect_outputs(processes, queue)
+        for process in processes:
+            process.join()
+        elapsed = time.monotonic() - start
+        errors = [output["error"] for output in outputs if "error" in output]
+        if errors:
+            raise CommandError(f"{len(errors)}個のワーカーが失敗しました:\n{errors[0]}")
+
+        report = {
+            "revision": git_revision(),
+            "created_at": timezone.now().isoformat(),
+            "options": {
+                name: options[name]
+                for name in ("workers", "duration", "write_ratio", "baseline", "seed")
+            },
+            "results": {},
+        }
+        for kind in ("read", "write"):
+            latencies = [ms for output in outputs for ms in output[kind]["latencies"]]
+            result = {
+                "requests": len(latencies),
+                "throughput": round(len(latencies) / elapsed, 1),
+                "errors": sum(output[kind]["errors"] for output in outputs),
+                "lock_errors": sum(output[kind]["lock_errors"] for output in outputs),
+                "p50_ms": round(percentile(latencies, 0.50), 2) if latencies else None,
+                "p95_ms": round(percentile(latencies, 0.95), 2) if latencies else None,
+                "p99_ms": round(percentile(latencies, 0.99), 2) if latencies else None,
+            }
+            report["results"][kind] = result
+            self.write_result(kind, result)
+
+        if options["output"]:
+            Path(options["output"]).write_text(
+                json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8"
+            )
+            self.stdout.write(self.style.SUCCESS(f"{options['output']} に保存しました。"))
+
+    def write_result(self, kind, result):
+        label = "読み込み" if kind == "read" else "書き込み"
+        if not result["requests"]:
+            self.stdout.write(f"{label}: なし")
+            return
+        line = (
+            f"{label}  {result['throughput']:>8.1f}件/秒  p50 {result['p50_ms']:>8.2f}ms  "
+            f"p95 {result['p95_ms']:>8.2f}ms  p99 {result['p99_ms']:>8.2f}ms"
+        )
+        if result["errors"]:
+            line += self.style.ERROR(
+                f"  エラー {result['errors']}件（うちロック {result['lock_errors']}件）"
+            )
+        self.stdout.write(line)
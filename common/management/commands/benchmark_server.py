@@ -0,0 +1,156 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import CommandError
+from django.test import Client
+from django.utils import timezone
+from django.utils.crypto import get_random_string
+
+from .benchmark import SCENARIOS, Samples, git_revision, percentile
+from .benchmark import Command as BenchmarkCommand
+
+# 非同期ビューにしたエンドポイント
+DEFAULT_SCENARIOS = ["dashboard", "inquiry_status_update", "inquiry_assign"]
+
+
+class Command(BenchmarkCommand):
+    help = (
+        "起動中のサーバーに同時にリクエストを送り、スループットと応答時間を計測します"
+        "（WSGI と ASGI の比較用）"
+    )
+
+    compare_keys = ("throughput", "p50_ms", "p95_ms")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--url", default="http://127.0.0.1:8000", help="サーバーの URL"
+        )
+        parser.add_argument(
+            "--concurrency", type=int, default=50, help="同時に送るリクエスト数"
+        )
+        parser.add_argument("--duration", type=float, default=10, help="計測する秒数")
+        parser.add_argument(
+            "--scenario",
+            action="append",
+            choices=[scenario.name for scenario in SCENARIOS],
+            help=f"送るリクエスト（複数指定可。省略時は {', '.join(DEFAULT_SCENARIOS)}）",
+        )
+        parser.add_argument("--username", help="ログインするユーザー（省略時は最初のスタッフ）")
+        parser.add_argument("--seed", type=int, default=0, help="乱数のシード")
+        parser.add_argument("--output", help="結果を保存する JSON ファイル")
+        parser.add_argument("--compare", help="比較する過去の結果の JSON ファイル")
+
+    def handle(self, *args, **options):
+        samples = Samples(options["seed"])
+        if not samples.inquiry_ids:
+            raise CommandError("データがありません。先に seed_data を実行してください。")
+        names = options["scenario"] or DEFAULT_SCENARIOS
+        scenarios = [scenario for scenario in SCENARIOS if scenario.name in names]
+        headers = self.login_headers(options["username"])
+        base_url = options["url"].rstrip("/")
+
+        # Samples の乱数はスレッド間で共有するので、選ぶときだけロックする
+        lock = threading.Lock()
+        latencies = {scenario.name: [] for scenario in scenarios}
+        errors = {scenario.name: 0 for scenario in scenarios}
+
+        def next_request():
+            with lock:
+                scenario = samples.choice(scenarios)
+                path = scenario.path(samples)
+                data = scenario.data(samples) if scenario.data else None
+            return scenario, path, data
+
+        def run(deadline):
+            while time.monotonic() < deadline:
+                scenario, path, data = next_request()
+                start = time.perf_counter()
+                ok = self.send(base_url + path, data, headers)
+                elapsed = (time.perf_counter() - start) * 1000
+                with lock:
+                    latencies[scenario.name].append(elapsed)
+                    if not ok:
+                        errors[scenario.name] += 1
+
+        start = time.monotonic()
+        deadline = start + options["duration"]
+        with ThreadPoolExecutor(max_workers=options["concurrency"]) as executor:
+            for future in [
+                executor.submit(run, deadline) for _ in range(options["concurrency"])
+            ]:
+                future.result()
+        elapsed = time.monotonic() - start
+
+        results = {}
+        for name in latencies:
+            values = latencies[name]
+            results[name] = {
+                "requests": len(values),
+                "errors": errors[name],
+                "throughput": round(len(values) / elapsed, 1),
+                "p50_ms": round(percentile(values, 0.50), 2) if values else None,
+                "p95_ms": round(percentile(values, 0.95), 2) if values else None,
+                "p99_ms": round(percentile(values, 0.99), 2) if values else None,
+            }
+            self.write_result(name, results[name])
+
+        report = {
+            "revision": git_revision(),
+            "created_at": timezone.now().isoformat(),
+            "url": base_url,
+            "options": {
+                name: options[name] for name in ("concurrency", "duration", "seed")
+            },
+            "results": results,
+        }
+        if options["output"]:
+            Path(options["output"]).write_text(
+                json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8"
+            )
+            self.stdout.write(self.style.SUCCESS(f"{options['output']} に保存しました。"))
+        if options["compare"]:
+            self.compare(report, options["compare"])
+
+    def login_headers(self, username):
+        """ログイン済みのセッションと CSRF トークンのヘッダー"""
+        client = Client()
+        client.force_login(self.get_user(username))
+        session_id = client.cookies[settings.SESSION_COOKIE_NAME].value
+        csrf_token = get_random_string(32)
+        return {
+            "Cookie": (
+                f"{settings.SESSION_COOKIE_NAME}={session_id}; "
+                f"{settings.CSRF_COOKIE_NAME}={csrf_token}"
+            ),
+            "X-CSRFToken": csrf_token,
+        }
+
+    def send(self, url, data, headers):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        request = urllib.request.Request(url, data=body, headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                response.read()
+                # ログイン画面へのリダイレクトは失敗として数える
+                return response.status < 400 and response.url == url
+        except (urllib.error.URLError, TimeoutError, ConnectionError):
+            return False
+
+    def write_result(self, name, result):
+        if not result["requests"]:
+            self.stdout.write(f"{name:<24} なし")
+            return
+        line = (
+            f"{name:<24} {result['throughput']:>8.1f}件/秒  p50 {result['p50_ms']:>8.2f}ms  "
+            f"p95 {result['p95_ms']:>8.2f}ms  p99 {result['p99_ms']:>8.2f}ms"
+        )
+        if result["errors"]:
+            line += self.style.ERROR(f"  エラー {result['errors']}件")
+        self.stdout.write(line)
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+
+from common import previews
+from common.models import Blob
+
+
+class Command(BaseCommand):
+    help = "プレビューが作られていないファイルを処理します"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all", action="store_true", help="処理済みのファイルも作り直す"
+        )
+
+    def handle(self, *args, **options):
+        if options["all"]:
+            Blob.objects.update(processed_at=None)
+
+        processed = 0
+        blobs = Blob.objects.filter(processed_at__isnull=True).order_by("pk")
+        # 添付ファイルで申告された形式は、内容から判定できない場合に使う
+        targets = list(
+            blobs.values_list("pk", "attachments__content_type").distinct()
+        )
+        for blob_id, content_type in targets:
+            if previews.process_blob(blob_id, content_type or ""):
+                processed += 1
+        self.stdout.write(self.style.SUCCESS(f"{processed}件のファイルを処理しました。"))
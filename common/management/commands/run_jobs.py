@@ -0,0 +1,68 @@
+import multiprocessing
+import signal
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from common import jobqueue
+
+
+def run_worker(stop, options):
+    # 停止は親プロセスが stop で知らせるので、Ctrl+C で処理の途中に止まらないようにする
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    jobqueue.work(stop, options["poll_interval"], once=options["once"])
+
+
+class Command(BaseCommand):
+    help = "登録されたジョブを実行するワーカーを起動します"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--processes",
+            type=int,
+            default=settings.JOB_WORKER_PROCESSES,
+            help="同時に動かすプロセス数",
+        )
+        parser.add_argument(
+            "--poll-interval",
+            type=float,
+            default=settings.JOB_POLL_INTERVAL,
+            help="ジョブがないときに待つ秒数",
+        )
+        parser.add_argument(
+            "--once", action="store_true", help="実行できるジョブがなくなったら終了する"
+        )
+
+    def handle(self, *args, **options):
+        if options["processes"] < 1:
+            raise CommandError("--processes には 1 以上を指定してください。")
+        if "fork" not in multiprocessing.get_all_start_methods():
+            raise CommandError("fork を使えない環境では起動できません。")
+
+        # 親プロセスの接続を子プロセスに引き継がない
+        connections.close_all()
+        context = multiprocessing.get_context("fork")
+        stop = context.Event()
+
+        def request_stop(signum, frame):
+            self.stdout.write("実行中のジョブが終わったら停止します…")
+            stop.set()
+
+        signal.signal(signal.SIGINT, request_stop)
+        signal.signal(signal.SIGTERM, request_stop)
+
+        processes = [
+            context.Process(target=run_worker, args=(stop, options), daemon=True)
+            for _ in range(options["processes"])
+        ]
+        for process in processes:
+            process.start()
+        self.stdout.write(f"{len(processes)}プロセスでジョブを実行しています。")
+        for process in processes:
+            process.join()
+        failed = [process for process in processes if process.exitcode]
+        if failed:
+            raise CommandError(f"{len(failed)}個のワーカーが異常終了しました。")
+        self.stdout.write(self.style.SUCCESS("停止しました。"))
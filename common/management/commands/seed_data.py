@@ -0,0 +1,321 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils import timezone
+
+from common.categories import invalidate_tree
+from common.importers import preserve_timestamps
+from common.models import Category, Tag
+from common.stats import invalidate_dashboard_stats
+from inquiry import duplicates
+from inquiry import search as inquiry_search
+from inquiry.models import Inquiry, InquiryCounter, Response
+from knowledge import search as knowledge_search
+from knowledge import similarity
+from knowledge.models import Knowledge
+
+User = get_user_model()
+
+FAMILY_NAMES = ["佐藤", "鈴木", "高橋", "田中", "伊藤", "渡辺", "山本", "中村", "小林", "加藤"]
+GIVEN_NAMES = ["太郎", "花子", "翔", "陽菜", "蓮", "結衣", "大輝", "美咲", "健太", "彩"]
+PRODUCTS = ["会員サイト", "請求システム", "スマホアプリ", "管理画面", "予約サービス", "API"]
+TOPICS = [
+    "ログインできない",
+    "パスワードの再設定",
+    "請求書の再発行",
+    "支払い方法の変更",
+    "データのエクスポート",
+    "通知メールが届かない",
+    "画面が表示されない",
+    "アカウントの削除",
+    "料金プランの変更",
+    "エラーメッセージが表示される",
+]
+SENTENCES = [
+    "{product}で{topic}状態が続いています。",
+    "昨日から{topic}ため、業務に支障が出ています。",
+    "手順を確認しましたが解決しませんでした。",
+    "ブラウザのキャッシュを削除して再度試しました。",
+    "至急対応をお願いします。",
+    "同じ部署の他のメンバーでも発生しています。",
+    "エラーコードは E{code} と表示されています。",
+    "マニュアルの該当箇所を教えてください。",
+]
+REPLIES = [
+    "ご連絡ありがとうございます。確認いたします。",
+    "ログを確認したところ、設定に誤りがありました。",
+    "再現手順を教えていただけますでしょうか。",
+    "修正版をリリースしましたのでご確認ください。",
+    "担当部署に確認中です。今しばらくお待ちください。",
+    "ご案内の手順で解決したとのこと、承知しました。",
+]
+TAG_WORDS = ["障害", "要望", "請求", "認証", "性能", "UI", "連携", "データ", "契約", "緊急"]
+CATEGORY_WORDS = ["製品", "請求", "技術", "契約", "運用", "導入", "保守", "その他"]
+
+STATUS_WEIGHTS = {"new": 15, "in_progress": 20, "waiting": 10, "resolved": 35, "closed": 20}
+PRIORITY_WEIGHTS = {"low": 25, "medium": 45, "high": 22, "urgent": 8}
+
+
+class Command(BaseCommand):
+    help = "性能測定用の合成データを一括投入します"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--inquiries", type=int, default=10000, help="問い合わせの件数")
+        parser.add_argument(
+            "--responses", type=int, default=40000, help="対応履歴の件数（目安）"
+        )
+        parser.add_argument("--knowledge", type=int, default=1000, help="ナレッジの件数")
+        parser.add_argument("--tags", type=int, default=1000, help="タグの件数")
+        parser.add_argument("--users", type=int, default=20, help="担当者の人数")
+        parser.add_argument(
+            "--category-roots", type=int, default=8, help="最上位カテゴリの数"
+        )
+        parser.add_argument(
+            "--category-depth", type=int, default=4, help="カテゴリの階層の深さ"
+        )
+        parser.add_argument(
+            "--category-branching", type=int, default=3, help="カテゴリごとの子の数"
+        )
+        parser.add_argument(
+            "--days", type=int, default=730, help="作成日時を散らばらせる日数"
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=2000, help="一度に登録する件数"
+        )
+        parser.add_argument("--seed", type=int, default=0, help="乱数のシード")
+        parser.add_argument(
+            "--skip-index",
+            action="store_true",
+            help="全文検索インデックスを作り直さない",
+        )
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options["seed"])
+        self.now = timezone.now()
+        self.days = options["days"]
+        self.batch_size = options["batch_size"]
+
+        users = self.create_users(options["users"])
+        tags = self.create_tags(options["tags"])
+        categories = self.create_categories(
+            options["category_roots"],
+            options["category_depth"],
+            options["category_branching"],
+        )
+        with preserve_timestamps(Inquiry, Response, Knowledge):
+            self.create_inquiries(
+                options["inquiries"], options["responses"], users, tags, categories
+            )
+            self.create_knowledge(options["knowledge"], users, tags, categories)
+
+        self.stdout.write("件数の集計を修正しています…")
+        InquiryCounter.objects.reconcile()
+        if not options["skip_index"]:
+            self.stdout.write("全文検索インデックスを作り直しています…")
+            inquiry_search.rebuild_index()
+            knowledge_search.rebuild_index()
+        self.stdout.write("関連ナレッジのベクトルと重複検出の署名を作っています…")
+        similarity.rebuild()
+        duplicates.rebuild()
+        invalidate_dashboard_stats()
+        invalidate_tree()
+        self.stdout.write(self.style.SUCCESS("データを登録しました。"))
+
+    def create_users(self, count):
+        password = make_password(None)
+        User.objects.bulk_create(
+            [
+                User(
+                    username=f"seed_user_{i:04d}",
+                    first_name=self.random.choice(GIVEN_NAMES),
+                    last_name=self.random.choice(FAMILY_NAMES),
+                    email=f"seed_user_{i:04d}@example.com",
+                    password=password,
+                    is_staff=True,
+                )
+                for i in range(count)
+            ],
+            ignore_conflicts=True,
+        )
+        users = list(User.objects.filter(is_staff=True).values_list("pk", flat=True))
+        if not users:
+            raise CommandError("担当者となるスタッフユーザーがいません。--users を指定してください。")
+        self.stdout.write(f"担当者: {len(users)}人")
+        return users
+
+    def create_tags(self, count):
+        Tag.objects.bulk_create(
+            [Tag(name=f"{self.random.choice(TAG_WORDS)}{i:05d}") for i in range(count)],
+            batch_size=self.batch_size,
+            ignore_conflicts=True,
+        )
+        tags = list(Tag.objects.values_list("pk", flat=True))
+        self.stdout.write(f"タグ: {len(tags)}件")
+        return tags
+
+    def create_categories(self, roots, depth, branching):
+        """階層ごとにまとめて登録し、最後に MPTT の lft/rght を組み直す"""
+        parents = [None]
+        for level in range(depth):
+            width = roots if level == 0 else branching
+            nodes = [
+                Category(
+                    name=f"{self.random.choice(CATEGORY_WORDS)} {level + 1}-{i + 1}",
+                    parent=parent,
+                    lft=0,
+                    rght=0,
+                    tree_id=0,
+                    level=0,
+                )
+                for parent in parents
+                for i in range(width)
+            ]
+            parents = Category.objects.bulk_create(nodes, batch_size=self.batch_size)
+        if depth:
+            Category.objects.rebuild()
+        categories = list(Category.objects.values_list("pk", flat=True))
+        self.stdout.write(f"カテゴリ: {len(categories)}件")
+        return categories
+
+    def random_datetime(self, start=None):
+        """start（省略時は --days 日前）から現在までのランダムな日時"""
+        start = start or self.now - timedelta(days=self.days)
+        span = (self.now - start).total_seconds()
+        return start + timedelta(seconds=self.random.uniform(0, span))
+
+    def random_text(self, count):
+        return "".join(
+            self.random.choice(SENTENCES).format(
+                product=self.random.choice(PRODUCTS),
+                topic=self.random.choice(TOPICS),
+                code=self.random.randint(100, 999),
+            )
+            for _ in range(count)
+        )
+
+    def pick_tags(self, tags, limit=3):
+        if not tags:
+            return []
+        return self.random.sample(tags, min(len(tags), self.random.randint(0, limit)))
+
+    def create_inquiries(self, count, responses, users, tags, categories):
+        average = responses / count if count else 0
+        created_inquiries = created_responses = 0
+        for start in range(0, count, self.batch_size):
+            inquiries = []
+            inquiry_responses = []
+            inquiry_tags = []
+            for _ in range(min(self.batch_size, count - start)):
+                inquiry, planned = self.build_inquiry(average, users, categories)
+                inquiries.append(inquiry)
+                inquiry_responses.append(planned)
+                inquiry_tags.append(self.pick_tags(tags))
+
+            with transaction.atomic():
+                Inquiry.objects.bulk_create(inquiries)
+                response_objects = [
+                    Response(
+                        inquiry_id=inquiry.pk,
+                        responder_id=responder_id,
+                        content=self.random.choice(REPLIES),
+                        is_internal=self.random.random() < 0.2,
+                        created_at=created_at,
+                    )
+                    for inquiry, planned in zip(inquiries, inquiry_responses)
+                    for created_at, responder_id in planned
+                ]
+                Response.objects.bulk_create(
+                    response_objects, batch_size=self.batch_size
+                )
+                Inquiry.tags.through.objects.bulk_create(
+                    [
+                        Inquiry.tags.through(inquiry_id=inquiry.pk, tag_id=tag_id)
+                        for inquiry, tag_ids in zip(inquiries, inquiry_tags)
+                        for tag_id in tag_ids
+                    ],
+                    batch_size=self.batch_size,
+                )
+            created_inquiries += len(inquiries)
+            created_responses += len(response_objects)
+            self.stdout.write(f"問い合わせ: {created_inquiries}/{count}")
+        self.stdout.write(f"対応履歴: {created_responses}件")
+
+    def build_inquiry(self, average, users, categories):
+        created_at = self.random_datetime()
+        response_count = round(self.random.expovariate(1 / average)) if average else 0
+        # 対応履歴は (日時, 対応者) の組で作り、最終対応の集計もこれに合わせる
+        responses = sorted(
+            (self.random_datetime(created_at), self.random.choice(users))
+            for _ in range(response_count)
+        )
+        response_times = [created for created, _ in responses]
+        status = self.random.choices(
+            list(STATUS_WEIGHTS), weights=STATUS_WEIGHTS.values()
+        )[0]
+        resolved_at = None
+        if status in ("resolved", "closed"):
+            resolved_at = response_times[-1] if response_times else created_at
+        last_response_at = response_times[-1] if response_times else None
+        family, given = self.random.choice(FAMILY_NAMES), self.random.choice(GIVEN_NAMES)
+        inquiry = Inquiry(
+            title=f"{self.random.choice(PRODUCTS)}で{self.random.choice(TOPICS)}",
+            content=self.random_text(self.random.randint(2, 6)),
+            customer_name=f"{family} {given}",
+            customer_email=f"customer{self.random.randint(1, 10**6)}@example.com",
+            customer_phone=f"090-{self.random.randint(0, 9999):04d}-{self.random.randint(0, 9999):04d}",
+            status=status,
+            priority=self.random.choices(
+                list(PRIORITY_WEIGHTS), weights=PRIORITY_WEIGHTS.values()
+            )[0],
+            category_id=self.random.choice(categories) if categories else None,
+            assigned_to_id=(
+                self.random.choice(users)
+                if users and status != "new" and self.random.random() < 0.9
+                else None
+            ),
+            created_at=created_at,
+            updated_at=max(filter(None, [created_at, last_response_at, resolved_at])),
+            resolved_at=resolved_at,
+            response_count=response_count,
+            last_response_at=last_response_at,
+            last_responder_id=responses[-1][1] if responses else None,
+        )
+        return inquiry, responses
+
+    def create_knowledge(self, count, users, tags, categories):
+        created = 0
+        for start in range(0, count, self.batch_size):
+            knowledge_list = []
+            knowledge_tags = []
+            for _ in range(min(self.batch_size, count - start)):
+                created_at = self.random_datetime()
+                knowledge_list.append(
+                    Knowledge(
+                        title=f"{self.random.choice(PRODUCTS)}で{self.random.choice(TOPICS)}場合の対処方法",
+                        content=self.random_text(self.random.randint(5, 15)),
+                        category_id=self.random.choice(categories) if categories else None,
+                        author_id=self.random.choice(users),
+                        is_public=self.random.random() < 0.9,
+                        view_count=int(self.random.paretovariate(1.2)) - 1,
+                        created_at=created_at,
+                        updated_at=self.random_datetime(created_at),
+                    )
+                )
+                knowledge_tags.append(self.pick_tags(tags, limit=5))
+
+            with transaction.atomic():
+                Knowledge.objects.bulk_create(knowledge_list)
+                Knowledge.tags.through.objects.bulk_create(
+                    [
+                        Knowledge.tags.through(knowledge_id=knowledge.pk, tag_id=tag_id)
+                        for knowledge, tag_ids in zip(knowledge_list, knowledge_tags)
+                        for tag_id in tag_ids
+                    ],
+                    batch_size=self.batch_size,
+                )
+            created += len(knowledge_list)
+            self.stdout.write(f"ナレッジ: {created}/{count}")
@@ -0,0 +1,211 @@
+"""リクエストごとの計測値の集計
+
+URL 名ごとに処理時間・DB 時間・テンプレート描画時間・クエリ数の
+ヒストグラムをワーカー内で集計し、一定間隔で共有キャッシュに書き出す。
+メトリクス画面では全ワーカーの分を読み出して合算する。
+
+各ワーカーは番号（MAX_WORKERS 個の枠のうち空いているもの）を cache.add で取り、
+その番号のキーにだけ書き込む。ワーカー一覧のような共有の値は読み書きしないので、
+同時に書き出しても他のワーカーの分を消さない。
+"""
+
+import copy
+import logging
+import os
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import cache
+
+logger = logging.getLogger(__name__)
+
+METRICS_KEY_PREFIX = "common:metrics:"
+
+# 書き出しが途絶えたワーカーの集計を残しておく秒数
+WORKER_TTL = 24 * 60 * 60
+
+# ワーカーの番号の数（再起動したワーカーの分も WORKER_TTL の間は枠を使う）
+MAX_WORKERS = 256
+
+# ヒストグラムの区切り（上限値）
+TIME_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)  # ミリ秒
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100)
+
+HISTOGRAMS = {
+    "total_ms": TIME_BUCKETS,
+    "view_ms": TIME_BUCKETS,
+    "template_ms": TIME_BUCKETS,
+    "db_ms": TIME_BUCKETS,
+    "queries": QUERY_BUCKETS,
+}
+
+# N+1 と判定した SQL を URL 名ごとに残す件数
+MAX_N_PLUS_ONE_SAMPLES = 5
+
+
+def _empty_histogram(bounds):
+    return {"buckets": [0] * (len(bounds) + 1), "sum": 0, "count": 0}
+
+
+def _empty_view():
+    view = {"requests": 0, "errors": 0, "n_plus_one": 0, "n_plus_one_sql": {}}
+    for name, bounds in HISTOGRAMS.items():
+        view[name] = _empty_histogram(bounds)
+    return view
+
+
+def _observe(histogram, bounds, value):
+    index = len(bounds)
+    for i, bound in enumerate(bounds):
+        if value <= bound:
+            index = i
+            break
+    histogram["buckets"][index] += 1
+    histogram["sum"] += value
+    histogram["count"] += 1
+
+
+class MetricsStore:
+    """ワーカー内の集計（起動時からの累計）"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._views = {}
+        self._started_at = time.time()
+        self._last_flush = time.monotonic()
+        # 別のホストで pid が重なっても区別できるように
+        self._token = uuid.uuid4().hex
+        self._slot = None
+
+    def record(self, view_name, status_code, values, n_plus_one_sql=()):
+        with self._lock:
+            view = self._views.setdefault(view_name, _empty_view())
+            view["requests"] += 1
+            if status_code >= 500:
+                view["errors"] += 1
+            for name, bounds in HISTOGRAMS.items():
+                _observe(view[name], bounds, values[name])
+            if n_plus_one_sql:
+                view["n_plus_one"] += 1
+                samples = view["n_plus_one_sql"]
+                for sql, count in n_plus_one_sql:
+                    samples[sql] = max(samples.get(sql, 0), count)
+                if len(samples) > MAX_N_PLUS_ONE_SAMPLES:
+                    view["n_plus_one_sql"] = dict(
+                        sorted(samples.items(), key=lambda item: -item[1])[
+                            :MAX_N_PLUS_ONE_SAMPLES
+                        ]
+                    )
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                "token": self._token,
+                "pid": os.getpid(),
+                "started_at": self._started_at,
+                "views": copy.deepcopy(self._views),
+            }
+
+    def is_due(self):
+        elapsed = time.monotonic() - self._last_flush
+        return elapsed >= settings.REQUEST_METRICS_FLUSH_INTERVAL
+
+    def flush(self):
+        """累計を共有キャッシュの自分の番号のキーに書き出す"""
+        self._last_flush = time.monotonic()
+        snapshot = self.snapshot()
+        if self._slot is not None:
+            current = cache.get(_worker_key(self._slot))
+            # 期限切れなどで番号を別のワーカーに取られていたら取り直す
+            if current is None or current["token"] == self._token:
+                cache.set(_worker_key(self._slot), snapshot, WORKER_TTL)
+                return
+            self._slot = None
+        for slot in range(MAX_WORKERS):
+            if cache.add(_worker_key(slot), snapshot, WORKER_TTL):
+                self._slot = slot
+                return
+        logger.warning("メトリクスを書き出すワーカーの番号が空いていません")
+
+
+def _worker_key(slot):
+    return f"{METRICS_KEY_PREFIX}worker:{slot}"
+
+
+def _merge_histogram(target, source):
+    target["buckets"] = [a + b for a, b in zip(target["buckets"], source["buckets"])]
+    target["sum"] += source["sum"]
+    target["count"] += source["count"]
+
+
+def _percentile(histogram, bounds, fraction):
+    """ヒストグラムから分位点を求める（該当する区切りの上限値。最後の区切りを超える場合は None）"""
+    if not histogram["count"]:
+        return None
+    threshold = histogram["count"] * fraction
+    seen = 0
+    for i, n in enumerate(histogram["buckets"]):
+        seen += n
+        if seen >= threshold:
+            return bounds[i] if i < len(bounds) else None
+    return None
+
+
+def _summarize_histogram(histogram, bounds):
+    count = histogram["count"]
+    return {
+        "count": count,
+        "mean": round(histogram["sum"] / count, 2) if count else None,
+        "p50": _percentile(histogram, bounds, 0.5),
+        "p95": _percentile(histogram, bounds, 0.95),
+        "p99": _percentile(histogram, bounds, 0.99),
+        "buckets": dict(
+            zip([f"<={bound}" for bound in bounds] + [f">{bounds[-1]}"], histogram["buckets"])
+        ),
+    }
+
+
+def collect():
+    """全ワーカーの集計を URL 名ごとに合算する"""
+    store.flush()
+    snapshots = cache.get_many(
+        [_worker_key(slot) for slot in range(MAX_WORKERS)]
+    ).values()
+
+    views = {}
+    for snapshot in snapshots:
+        for view_name, source in snapshot["views"].items():
+            view = views.setdefault(view_name, _empty_view())
+            view["requests"] += source["requests"]
+            view["errors"] += source["errors"]
+            view["n_plus_one"] += source["n_plus_one"]
+            for sql, count in source["n_plus_one_sql"].items():
+                view["n_plus_one_sql"][sql] = max(
+                    view["n_plus_one_sql"].get(sql, 0), count
+                )
+            for name in HISTOGRAMS:
+                _merge_histogram(view[name], source[name])
+
+    summary = {}
+    for view_name, view in sorted(views.items()):
+        summary[view_name] = {
+            "requests": view["requests"],
+            "errors": view["errors"],
+            "n_plus_one": view["n_plus_one"],
+            "n_plus_one_sql": [
+                {"sql": sql, "count": count}
+                for sql, count in sorted(
+                    view["n_plus_one_sql"].items(), key=lambda item: -item[1]
+                )
+            ],
+            **{
+                name: _summarize_histogram(view[name], bounds)
+                for name, bounds in HISTOGRAMS.items()
+            },
+        }
+    return {"workers": len(snapshots), "views": summary}
+
+
+store = MetricsStore()
@@ -0,0 +1,136 @@
+import logging
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+
+from .metrics import store
+
+logger = logging.getLogger(__name__)
+
+# N+1 の例として記録する SQL の長さ
+MAX_SQL_LENGTH = 300
+
+
+class QueryRecorder:
+    """connection.execute_wrapper() に渡して、実行したクエリの件数と時間を数える"""
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.duration += time.perf_counter() - start
+            self.count += 1
+            # パラメータを除いた SQL が同じなら同じクエリとみなす
+            self.statements[sql] += 1
+
+    def repeated(self, threshold):
+        return [
+            (sql[:MAX_SQL_LENGTH], count)
+            for sql, count in self.statements.most_common()
+            if count >= threshold
+        ]
+
+
+class RequestMetricsMiddleware:
+    """URL 名ごとにクエリ数・DB 時間・テンプレート描画時間・ビュー時間を記録する
+
+    同じ SQL が REQUEST_METRICS_N_PLUS_ONE_THRESHOLD 回以上実行されたリクエストは
+    N+1 の疑いとして記録し、ログにも出す。集計は common.metrics を参照。
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder = QueryRecorder()
+        request._metrics_template_seconds = 0.0
+        start = time.perf_counter()
+        with self.recording(recorder):
+            response = self.get_response(request)
+        total = time.perf_counter() - start
+
+        self.record(request, response, recorder, total)
+        if store.is_due():
+            self.flush()
+        return response
+
+    async def __acall__(self, request):
+        recorder = QueryRecorder()
+        request._metrics_template_seconds = 0.0
+        start = time.perf_counter()
+        with self.recording(recorder):
+            response = await self.get_response(request)
+        total = time.perf_counter() - start
+
+        self.record(request, response, recorder, total)
+        if store.is_due():
+            await sync_to_async(self.flush)()
+        return response
+
+    @staticmethod
+    def recording(recorder):
+        stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(recorder))
+        return stack
+
+    @staticmethod
+    def flush():
+        try:
+            store.flush()
+        except Exception:
+            logger.exception("リクエスト計測値を書き出せませんでした")
+
+    def process_template_response(self, request, response):
+        # 最も外側のミドルウェアなので、この直後に描画される
+        start = time.perf_counter()
+
+        def finish(response):
+            request._metrics_template_seconds += time.perf_counter() - start
+
+        response.add_post_render_callback(finish)
+        return response
+
+    def record(self, request, response, recorder, total):
+        match = request.resolver_match
+        view_name = match.view_name if match else "<unresolved>"
+        template = request._metrics_template_seconds
+        repeated = recorder.repeated(settings.REQUEST_METRICS_N_PLUS_ONE_THRESHOLD)
+        if repeated:
+            sql, count = repeated[0]
+            logger.warning(
+                "N+1 の疑い: %s %s で同じクエリを %d 回実行しました: %s",
+                request.method,
+                view_name,
+                count,
+                sql,
+            )
+        store.record(
+            view_name,
+            response.status_code,
+            {
+                "total_ms": total * 1000,
+                "view_ms": (total - template) * 1000,
+                "template_ms": template * 1000,
+                "db_ms": recorder.duration * 1000,
+                "queries": recorder.count,
+            },
+            n_plus_one_sql=repeated,
+        )
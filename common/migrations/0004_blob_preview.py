@@ -0,0 +1,43 @@
+# Generated by Django 5.2.6 on 2026-10-18 21:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0003_blob'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blob',
+            name='height',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='高さ'),
+        ),
+        migrations.AddField(
+            model_name='blob',
+            name='mime_type',
+            field=models.CharField(blank=True, max_length=100, verbose_name='MIME タイプ'),
+        ),
+        migrations.AddField(
+            model_name='blob',
+            name='preview',
+            field=models.FileField(blank=True, max_length=255, upload_to='', verbose_name='プレビュー'),
+        ),
+        migrations.AddField(
+            model_name='blob',
+            name='processed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='処理日時'),
+        ),
+        migrations.AddField(
+            model_name='blob',
+            name='text',
+            field=models.TextField(blank=True, verbose_name='抽出したテキスト'),
+        ),
+        migrations.AddField(
+            model_name='blob',
+            name='width',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='幅'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-18 21:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0004_blob_preview'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, verbose_name='処理名')),
+                ('key', models.CharField(blank=True, max_length=200, verbose_name='まとめるキー')),
+                ('payload', models.JSONField(blank=True, null=True, verbose_name='引数')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='実行回数')),
+                ('run_at', models.DateTimeField(verbose_name='実行予定日時')),
+                ('locked_by', models.CharField(blank=True, max_length=100, verbose_name='実行中のワーカー')),
+                ('locked_until', models.DateTimeField(blank=True, null=True, verbose_name='実行期限')),
+                ('failed_at', models.DateTimeField(blank=True, null=True, verbose_name='失敗日時')),
+                ('last_error', models.TextField(blank=True, verbose_name='最後のエラー')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='作成日時')),
+            ],
+            options={
+                'verbose_name': 'ジョブ',
+                'verbose_name_plural': 'ジョブ',
+                'indexes': [models.Index(condition=models.Q(('failed_at__isnull', True)), fields=['run_at'], name='common_job_due'), models.Index(condition=models.Q(('failed_at__isnull', True)), fields=['name', 'key', 'run_at'], name='common_job_name_key')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-18 22:18
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0005_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='blob',
+            name='preview_failed',
+            field=models.BooleanField(default=False, verbose_name='プレビュー作成失敗'),
+        ),
+    ]
@@ -1,13 +1,32 @@
+from django.conf import settings
 from django.db import models
 from mptt.models import MPTTModel, TreeForeignKey
 
 
+class TagManager(models.Manager):
+    def from_names(self, names):
+        """タグ名のリストからタグを返す。未登録のタグ名は作成する"""
+        names = list(dict.fromkeys(names))
+        if not names:
+            return []
+        tags = {tag.name: tag for tag in self.filter(name__in=names)}
+        missing = [name for name in names if name not in tags]
+        if missing:
+            self.bulk_create(
+                [self.model(name=name) for name in missing], ignore_conflicts=True
+            )
+            tags.update((tag.name, tag) for tag in self.filter(name__in=missing))
+        return [tags[name] for name in names]
+
+
 class Tag(models.Model):
     """タグ"""
 
     name = models.CharField("タグ名", max_length=50, unique=True)
     created_at = models.DateTimeField("作成日時", auto_now_add=True)
 
+    objects = TagManager()
+
     class Meta:
         verbose_name = "タグ"
         verbose_name_plural = "タグ"
@@ -33,6 +52,100 @@ class Category(MPTTModel):
     class Meta:
         verbose_name = "カテゴリ"
         verbose_name_plural = "カテゴリ"
+        indexes = [
+            # 下位カテゴリを含む絞り込み（tree_id が同じで lft が範囲内）に使う
+            models.Index(fields=["tree_id", "lft"], name="common_category_tree_lft"),
+        ]
 
     def __str__(self):
         return self.name
+
+
+class Blob(models.Model):
+    """内容の SHA-256 で保存するファイル
+
+    同じ内容のファイルは1つだけ保存し、添付ファイルなどから参照する。
+    保存・配信は common.blobs、プレビューの作成は common.previews を使う。
+    """
+
+    sha256 = models.CharField("SHA-256", max_length=64, unique=True)
+    size = models.PositiveBigIntegerField("サイズ")
+    file = models.FileField("ファイル", max_length=255)
+    created_at = models.DateTimeField("作成日時", auto_now_add=True)
+
+    # 以下は保存後にバックグラウンドで設定する（processed_at が空なら未処理）
+    mime_type = models.CharField("MIME タイプ", max_length=100, blank=True)
+    width = models.PositiveIntegerField("幅", null=True, blank=True)
+    height = models.PositiveIntegerField("高さ", null=True, blank=True)
+    preview = models.FileField("プレビュー", max_length=255, blank=True)
+    text = models.TextField("抽出したテキスト", blank=True)
+    preview_failed = models.BooleanField("プレビュー作成失敗", default=False)
+    processed_at = models.DateTimeField("処理日時", null=True, blank=True)
+
+    class Meta:
+        verbose_name = "ファイル"
+        verbose_name_plural = "ファイル"
+
+    def __str__(self):
+        return self.sha256
+
+    @property
+    def is_image(self):
+        return self.mime_type.startswith("image/")
+
+    @property
+    def is_text(self):
+        return self.mime_type.startswith("text/")
+
+    @property
+    def preview_size(self):
+        """縮小版の (幅, 高さ)。元の大きさが分からないもの（PDF など）は縮小版の枠の大きさ"""
+        size = settings.BLOB_THUMBNAIL_SIZE
+        if not self.width or not self.height:
+            return size, size
+        # Pillow の thumbnail() と同じく、長辺を size に合わせ、拡大はしない
+        scale = min(size / max(self.width, self.height), 1)
+        return (
+            max(round(self.width * scale), 1),
+            max(round(self.height * scale), 1),
+        )
+
+
+class Job(models.Model):
+    """バックグラウンドで実行する処理（run_jobs コマンドのワーカーが実行する）
+
+    name と key が同じ未実行のジョブは、まとめて1回の処理で実行する。
+    登録と実行は common.jobqueue を使う。
+    """
+
+    name = models.CharField("処理名", max_length=100)
+    key = models.CharField("まとめるキー", max_length=200, blank=True)
+    payload = models.JSONField("引数", null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField("実行回数", default=0)
+    run_at = models.DateTimeField("実行予定日時")
+    locked_by = models.CharField("実行中のワーカー", max_length=100, blank=True)
+    locked_until = models.DateTimeField("実行期限", null=True, blank=True)
+    failed_at = models.DateTimeField("失敗日時", null=True, blank=True)
+    last_error = models.TextField("最後のエラー", blank=True)
+    created_at = models.DateTimeField("作成日時", auto_now_add=True)
+
+    class Meta:
+        verbose_name = "ジョブ"
+        verbose_name_plural = "ジョブ"
+        indexes = [
+            # 実行するジョブを古い順に探す（失敗して諦めたものは除く）
+            models.Index(
+                fields=["run_at"],
+                name="common_job_due",
+                condition=models.Q(failed_at__isnull=True),
+            ),
+            # 同じ処理・キーのジョブをまとめて取り出す
+            models.Index(
+                fields=["name", "key", "run_at"],
+                name="common_job_name_key",
+                condition=models.Q(failed_at__isnull=True),
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.name}:{self.key}" if self.key else self.name
@@ -0,0 +1,163 @@
+"""キーセット（カーソル）ページネーション
+
+OFFSET を使わず、並び順のキー（例: created_at, id）の値を境界にして
+次・前のページを取得するため、何ページ目でも取得コストが変わらない。
+"""
+
+from django.core import signing
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+CURSOR_SALT = "common.pagination"
+
+
+class KeysetPaginator:
+    """並び順のキーを境界にしてページを切り出す
+
+    件数は count_limit 件までしか数えないので、それ以上は
+    count_is_capped が True になる。
+    """
+
+    def __init__(self, queryset, per_page, ordering, count_limit=1000):
+        self.queryset = queryset.order_by(*ordering)
+        self.per_page = per_page
+        self.ordering = ordering
+        self.count_limit = count_limit
+        self._count = None
+
+    @property
+    def count(self):
+        if self._count is None:
+            # id だけを数えるので、絞り込みに使うインデックスだけで数えられる
+            self._count = (
+                self.queryset.order_by().values("pk")[: self.count_limit + 1].count()
+            )
+        return min(self._count, self.count_limit)
+
+    @property
+    def count_is_capped(self):
+        return self.count and self._count > self.count_limit
+
+    def page(self, cursor=None):
+        position = self.decode_cursor(cursor)
+        if position is None:
+            return self._forward(self.queryset, has_previous=False)
+
+        direction, values = position
+        if direction == "next":
+            queryset = self.queryset.filter(self._boundary(values, reverse=False))
+            return self._forward(queryset, has_previous=True)
+
+        queryset = self.queryset.filter(self._boundary(values, reverse=True))
+        queryset = queryset.order_by(*[self._flip(field) for field in self.ordering])
+        rows = list(queryset[: self.per_page + 1])
+        has_previous = len(rows) > self.per_page
+        rows = rows[: self.per_page]
+        rows.reverse()
+        return KeysetPage(self, rows, has_previous=has_previous, has_next=True)
+
+    def _forward(self, queryset, has_previous):
+        rows = list(queryset[: self.per_page + 1])
+        has_next = len(rows) > self.per_page
+        return KeysetPage(
+            self, rows[: self.per_page], has_previous=has_previous, has_next=has_next
+        )
+
+    def _boundary(self, values, reverse):
+        """(a, b) の並びで境界値より後ろ（reverse なら前）にある行の条件"""
+        condition = Q()
+        for i, field in enumerate(self.ordering):
+            name = field.lstrip("-")
+            descending = field.startswith("-") != reverse
+            step = Q(**{f"{name}__{'lt' if descending else 'gt'}": values[i]})
+            for prev_field, value in zip(self.ordering[:i], values):
+                step &= Q(**{prev_field.lstrip("-"): value})
+            condition |= step
+        # 先頭のキーの範囲の条件も付けて、インデックスを範囲で引けるようにする
+        first = self.ordering[0]
+        lookup = "lte" if first.startswith("-") != reverse else "gte"
+        return Q(**{f"{first.lstrip('-')}__{lookup}": values[0]}) & condition
+
+    @staticmethod
+    def _flip(field):
+        return field[1:] if field.startswith("-") else f"-{field}"
+
+    def encode_cursor(self, obj, direction):
+        values = []
+        for field in self.ordering:
+            value = getattr(obj, field.lstrip("-"))
+            values.append(value.isoformat() if hasattr(value, "isoformat") else value)
+        return signing.dumps([direction, values], salt=CURSOR_SALT, compress=True)
+
+    def decode_cursor(self, cursor):
+        """(方向, 境界値) を返す。不正なカーソルは None（先頭ページ）"""
+        if not cursor:
+            return None
+        try:
+            direction, values = signing.loads(cursor, salt=CURSOR_SALT)
+            values = [
+                (parse_datetime(value) or value) if isinstance(value, str) else value
+                for value in values
+            ]
+        except (signing.BadSignature, TypeError, ValueError):
+            return None
+        if direction not in ("next", "previous") or len(values) != len(self.ordering):
+            return None
+        return direction, values
+
+
+class KeysetPage:
+    is_keyset = True
+
+    def __init__(self, paginator, object_list, has_previous, has_next):
+        self.paginator = paginator
+        self.object_list = object_list
+        self._has_previous = has_previous and bool(object_list)
+        self._has_next = has_next and bool(object_list)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    @property
+    def next_cursor(self):
+        if self._has_next:
+            return self.paginator.encode_cursor(self.object_list[-1], "next")
+
+    @property
+    def previous_cursor(self):
+        if self._has_previous:
+            return self.paginator.encode_cursor(self.object_list[0], "previous")
+
+
+class KeysetPaginationMixin:
+    """ListView をキーセットページネーションにする
+
+    関連度順の検索結果など、keyset_ordering 以外で並べた一覧は
+    従来どおりページ番号で切り替える。BM25 の関連度は MATCH した全行について
+    計算してから並べるので、キーセットにしても読み飛ばす行の取得しか減らない。
+    """
+
+    keyset_ordering = ("-created_at", "-pk")
+    count_limit = 1000
+    cursor_kwarg = "cursor"
+
+    def paginate_queryset(self, queryset, page_size):
+        if queryset.query.order_by:
+            return super().paginate_queryset(queryset, page_size)
+        paginator = KeysetPaginator(
+            queryset, page_size, self.keyset_ordering, self.count_limit
+        )
+        page = paginator.page(self.request.GET.get(self.cursor_kwarg))
+        return (paginator, page, page.object_list, page.has_other_pages())
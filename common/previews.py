@@ -0,0 +1,198 @@
+"""ファイル（Blob）のプレビュー作成とメタデータの記録
+
+保存後にジョブとして MIME タイプを内容から判定し、画像の縮小版、
+PDF の1ページ目の画像、検索用のテキストを作る。Blob は内容ごとに1つなので、
+同じ内容のファイルを何度添付しても処理は1回で済む。
+
+画像の縮小には Pillow、PDF には poppler-utils（pdftoppm / pdftotext）を使い、
+入っていない環境ではその処理だけを省く。ジョブを登録する前からある Blob などは
+process_blobs コマンドで処理する。
+"""
+
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.dispatch import Signal
+from django.utils import timezone
+
+from . import jobqueue
+from .db import retry_on_lock
+from .models import Blob
+
+try:
+    from PIL import Image
+
+    DecompressionBombError = Image.DecompressionBombError
+except ImportError:
+    Image = None
+    DecompressionBombError = ()
+
+logger = logging.getLogger(__name__)
+
+# 処理を終えた Blob（blob_id）。検索インデックスの更新などに使う
+blob_processed = Signal()
+
+PROCESS_JOB = "common.process_blob"
+
+# 先頭のバイト列 → MIME タイプ
+SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"%PDF-", "application/pdf"),
+    (b"PK\x03\x04", "application/zip"),
+]
+
+TEXT_ENCODINGS = ("utf-8", "cp932")
+
+# テキストとして読み込む上限（バイト）
+TEXT_LIMIT = 256 * 1024
+
+# PDF からテキストを取り出すページ数と、外部コマンドを待つ秒数
+PDF_TEXT_PAGES = 20
+COMMAND_TIMEOUT = 60
+
+
+def preview_name(sha256):
+    return f"previews/{sha256[:2]}/{sha256[2:4]}/{sha256}.png"
+
+
+def decode_text(data):
+    """テキストファイルとして読めれば文字列、読めなければ None"""
+    if b"\x00" in data:
+        return None
+    for encoding in TEXT_ENCODINGS:
+        try:
+            return data.decode(encoding)
+        except UnicodeDecodeError as e:
+            # 読み込んだ範囲の末尾で文字が切れている場合は、その手前までを使う
+            if e.start < len(data) - 3:
+                continue
+            try:
+                return data[: e.start].decode(encoding)
+            except UnicodeDecodeError:
+                continue
+    return None
+
+
+def detect_mime_type(head, declared=""):
+    """内容の先頭から MIME タイプを判定する。判定できなければ申告された値を使う"""
+    for signature, mime_type in SIGNATURES:
+        if head.startswith(signature):
+            return mime_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    if head and decode_text(head) is not None:
+        return declared if declared.startswith("text/") else "text/plain"
+    return declared or "application/octet-stream"
+
+
+def image_preview(path, target):
+    """画像の縮小版を作り、(幅, 高さ) を返す"""
+    if Image is None:
+        return None, None
+    size = settings.BLOB_THUMBNAIL_SIZE
+    with Image.open(path) as image:
+        width, height = image.size
+        image.thumbnail((size, size))
+        if image.mode not in ("RGB", "RGBA", "L", "LA"):
+            image = image.convert("RGBA")
+        image.save(target, "PNG")
+    return width, height
+
+
+def pdf_preview(path, target):
+    """PDF の1ページ目を画像にする"""
+    if not shutil.which("pdftoppm"):
+        return False
+    prefix = target[: -len(".png")]
+    subprocess.run(
+        [
+            "pdftoppm", "-png", "-f", "1", "-l", "1", "-singlefile",
+            "-scale-to", str(settings.BLOB_THUMBNAIL_SIZE), path, prefix,
+        ],
+        check=True,
+        capture_output=True,
+        timeout=COMMAND_TIMEOUT,
+    )
+    return os.path.exists(target)
+
+
+def pdf_text(path):
+    if not shutil.which("pdftotext"):
+        return ""
+    result = subprocess.run(
+        ["pdftotext", "-l", str(PDF_TEXT_PAGES), "-enc", "UTF-8", path, "-"],
+        check=True,
+        capture_output=True,
+        timeout=COMMAND_TIMEOUT,
+    )
+    return decode_text(result.stdout[:TEXT_LIMIT]) or ""
+
+
+def process_blob(blob_id, declared_type=""):
+    """MIME タイプ・プレビュー・テキストを作って記録する（処理済みなら何もしない）"""
+    blob = Blob.objects.filter(pk=blob_id, processed_at__isnull=True).first()
+    if blob is None:
+        return False
+    path = blob.file.path
+    with open(path, "rb") as f:
+        head = f.read(TEXT_LIMIT)
+
+    fields = {"mime_type": detect_mime_type(head, declared_type)}
+    name = preview_name(blob.sha256)
+    target = default_storage.path(name)
+    os.makedirs(os.path.dirname(target), exist_ok=True)
+    # 途中で失敗しても壊れた画像が残らないよう、一時ファイルに作ってから置き換える
+    fd, work = tempfile.mkstemp(suffix=".png", dir=os.path.dirname(target))
+    os.close(fd)
+    try:
+        if fields["mime_type"].startswith("image/"):
+            fields["width"], fields["height"] = image_preview(path, work)
+            has_preview = fields["width"] is not None
+        elif fields["mime_type"] == "application/pdf":
+            has_preview = pdf_preview(path, work)
+            fields["text"] = pdf_text(path)
+        else:
+            has_preview = False
+            if fields["mime_type"].startswith("text/"):
+                fields["text"] = decode_text(head) or ""
+        if has_preview:
+            os.replace(work, target)
+            fields["preview"] = name
+    except DecompressionBombError:
+        # 画素数が Image.MAX_IMAGE_PIXELS の2倍を超える画像は展開せずに諦める
+        logger.warning("画素数が多すぎるためプレビューを作成しません: %s", blob.sha256)
+        fields["preview_failed"] = True
+    except Exception:
+        # 壊れたファイルなどは MIME タイプだけを記録し、再処理しない
+        logger.exception("プレビューを作成できませんでした: %s", blob.sha256)
+        fields["preview_failed"] = True
+    finally:
+        if os.path.exists(work):
+            os.remove(work)
+
+    fields["processed_at"] = timezone.now()
+    save_metadata(blob_id, fields)
+    blob_processed.send(sender=Blob, blob_id=blob_id)
+    return True
+
+
+@retry_on_lock
+def save_metadata(blob_id, fields):
+    Blob.objects.filter(pk=blob_id).update(**fields)
+
+
+def schedule(blob, declared_type=""):
+    """未処理の Blob の処理をジョブに回す（同じ Blob のジョブはまとめて1回で処理する）"""
+    if blob.processed_at is not None:
+        return
+    jobqueue.enqueue(
+        PROCESS_JOB, {"blob": blob.pk, "content_type": declared_type}, key=str(blob.pk)
+    )
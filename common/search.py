@@ -0,0 +1,200 @@
+"""SQLite FTS5 を使った全文検索の共通部品
+
+trigram トークナイザを使うため、分かち書きのない日本語でも
+3文字以上の語であればインデックスで検索できる。
+2文字以下の語は、2文字ずつに区切った補助インデックス（BigramTable）で引く。
+記号を含む2文字以下の語だけは、どちらのインデックスも使えないので部分一致（全件走査）になる。
+"""
+
+import unicodedata
+
+from django.db import connection, models
+from django.db.models import Func, Lookup, Value
+
+# highlight()/snippet() が一致箇所に付けるマーカー（私用領域の文字）
+MARK_START = "\ue000"
+MARK_END = "\ue001"
+
+# trigram トークナイザがインデックスを使える最短の語長
+MIN_TERM_LENGTH = 3
+
+
+def fts5_available():
+    """全文検索インデックスを使えるデータベースかどうか"""
+    return connection.vendor == "sqlite"
+
+
+def normalize_text(text):
+    """全角・半角の揺れを吸収する（インデックスと検索語の両方に適用）"""
+    return unicodedata.normalize("NFKC", text or "")
+
+
+def normalize_query(q):
+    """検索語を正規化して語のリストに分割する"""
+    return normalize_text(q).split()
+
+
+def build_match_query(terms):
+    """FTS5 の MATCH 式を組み立てる
+
+    3文字以上の語はフレーズとして AND 結合し、MATCH 式として返す。
+    trigram で引けない短い語は別に返すので、呼び出し側で部分一致検索する。
+    """
+    phrases = []
+    short_terms = []
+    for term in terms:
+        if len(term) >= MIN_TERM_LENGTH:
+            phrases.append('"{}"'.format(term.replace('"', '""')))
+        else:
+            short_terms.append(term)
+    return " AND ".join(phrases), short_terms
+
+
+def build_bigram_query(terms):
+    """2文字以下の語から、補助インデックス（BigramTable）の MATCH 式を組み立てる
+
+    2文字の語はその語、1文字の語はその文字で始まる語（前方一致）を AND 結合する。
+    文字・数字以外を含む語は補助インデックスにないので別に返す（呼び出し側で部分一致検索する）。
+    """
+    phrases = []
+    rest = []
+    for term in terms:
+        if not term.isalnum():
+            rest.append(term)
+        elif len(term) == 1:
+            phrases.append(f'"{term}"*')
+        else:
+            phrases.append(f'"{term}"')
+    return " AND ".join(phrases), rest
+
+
+def bigrams(text):
+    """文字・数字の連なりを2文字ずつの語に分ける（連なりの最後の1文字も1語にする）"""
+    words = []
+    run = []
+    for char in text + " ":
+        if char.isalnum():
+            run.append(char)
+            continue
+        words.extend("".join(run[i : i + 2]) for i in range(len(run)))
+        run = []
+    return " ".join(words)
+
+
+class FTS5Table:
+    """FTS5 仮想テーブルへの書き込み
+
+    行は [rowid, カラム値...] のリストで渡す。カラム値は normalize_text() で正規化する。
+    """
+
+    def __init__(self, table, columns):
+        self.table = table
+        self.columns = list(columns)
+
+    def replace(self, rows):
+        rows = [
+            [rowid, *(normalize_text(value) for value in values)]
+            for rowid, *values in rows
+        ]
+        if not rows or not fts5_available():
+            return 0
+        self.delete([row[0] for row in rows])
+        columns = ", ".join(["rowid", *self.columns])
+        placeholders = ", ".join(["%s"] * (len(self.columns) + 1))
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"INSERT INTO {self.table} ({columns}) VALUES ({placeholders})", rows
+            )
+        return len(rows)
+
+    def delete(self, rowids):
+        rowids = list(rowids)
+        if not rowids or not fts5_available():
+            return
+        with connection.cursor() as cursor:
+            cursor.executemany(
+                f"DELETE FROM {self.table} WHERE rowid = %s",
+                [[rowid] for rowid in rowids],
+            )
+
+    def clear(self):
+        if not fts5_available():
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {self.table}")
+
+    def optimize(self):
+        if not fts5_available():
+            return
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {self.table} ({self.table}) VALUES ('optimize')"
+            )
+
+
+class BigramTable(FTS5Table):
+    """trigram で引けない2文字以下の語のための補助インデックス
+
+    行の全カラムを bigrams() で2文字ずつの語にし、unicode61 トークナイザの
+    FTS5 仮想テーブルの1カラムに入れる。行は FTS5Table と同じ形で渡す。
+    """
+
+    TOKENIZE = "unicode61 remove_diacritics 0"
+
+    def __init__(self, table):
+        super().__init__(table, ["bigrams"])
+
+    def replace(self, rows):
+        return super().replace(
+            [
+                [rowid, bigrams(normalize_text(" ".join(filter(None, values))))]
+                for rowid, *values in rows
+            ]
+        )
+
+
+class FullTextField(models.TextField):
+    """FTS5 仮想テーブルのテーブル名と同名の隠しカラム
+
+    MATCH 条件や highlight()/snippet() の第1引数として使う。
+    """
+
+
+@FullTextField.register_lookup
+class Match(Lookup):
+    lookup_name = "match"
+
+    def as_sql(self, compiler, connection):
+        lhs, lhs_params = self.process_lhs(compiler, connection)
+        rhs, rhs_params = self.process_rhs(compiler, connection)
+        return f"{lhs} MATCH {rhs}", lhs_params + rhs_params
+
+
+class Highlight(Func):
+    """一致箇所をマーカーで囲んだカラム全体"""
+
+    function = "highlight"
+    output_field = models.TextField()
+
+    def __init__(self, document, column, **extra):
+        super().__init__(
+            document, Value(column), Value(MARK_START), Value(MARK_END), **extra
+        )
+
+
+class Snippet(Func):
+    """一致箇所の前後を切り出した抜粋"""
+
+    function = "snippet"
+    output_field = models.TextField()
+
+    def __init__(self, document, column, tokens=32, **extra):
+        super().__init__(
+            document,
+            Value(column),
+            Value(MARK_START),
+            Value(MARK_END),
+            Value("…"),
+            Value(tokens),
+            **extra,
+        )
@@ -0,0 +1,59 @@
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from mptt.signals import node_moved
+
+from inquiry.models import Inquiry
+from knowledge.models import Knowledge
+from .categories import invalidate_tree
+from .fragments import invalidate_fragments
+from .models import Category, Tag
+from .stats import invalidate_dashboard_stats
+
+
+# 問い合わせの削除は必ず件数を減らすジョブを登録し、そのジョブが統計を破棄するので受け取らない
+@receiver(post_save, sender=Inquiry)
+@receiver(post_save, sender=Knowledge)
+@receiver(post_delete, sender=Knowledge)
+def invalidate_dashboard(sender, instance, update_fields=None, **kwargs):
+    # 閲覧回数の更新はダッシュボードの表示に影響しない
+    if update_fields is not None and set(update_fields) <= {"view_count"}:
+        return
+    # 確定前に他のワーカーが集計し直すと、古い統計を TTL の間保持し続けるので、確定後に破棄する
+    transaction.on_commit(partial(_invalidate_dashboard, instance))
+
+
+def _invalidate_dashboard(instance):
+    # 件数が変わった問い合わせは、件数を反映するジョブの後で破棄する
+    # （先に破棄すると、次の表示で古い件数がキャッシュされる）
+    if not getattr(instance, "_counters_recorded", False):
+        invalidate_dashboard_stats()
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(node_moved, sender=Category)
+def invalidate_category_tree(sender, **kwargs):
+    # 確定前に他のワーカーが読み直すと古いツリーを保持し続けるので、確定後に更新する
+    transaction.on_commit(invalidate_tree)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+@receiver(node_moved, sender=Category)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=get_user_model())
+@receiver(post_delete, sender=get_user_model())
+def invalidate_fragment_cache(sender, created=False, update_fields=None, **kwargs):
+    """一覧などに表示しているカテゴリ名・タグ名・ユーザー名の変更を部分キャッシュに反映する"""
+    # 追加されたものはまだどこにも表示されていない
+    if created:
+        return
+    # ログイン日時などの更新は表示に影響しない
+    if update_fields is not None and set(update_fields) <= {"last_login", "password"}:
+        return
+    transaction.on_commit(invalidate_fragments)
@@ -0,0 +1,135 @@
+"""ダッシュボード統計の集計とキャッシュ"""
+
+import hashlib
+import json
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+
+from inquiry.models import Inquiry, InquiryCounter
+from knowledge.models import Knowledge
+from .models import Category
+
+DASHBOARD_STATS_KEY = "common:dashboard_stats"
+
+
+async def alist(queryset):
+    return [obj async for obj in queryset]
+
+
+def display_name(first_name, last_name, username):
+    """User.get_full_name() が空ならユーザー名"""
+    return f"{first_name} {last_name}".strip() or username
+
+
+async def recent_inquiries():
+    statuses = dict(Inquiry.STATUS_CHOICES)
+    rows = await alist(
+        Inquiry.objects.values("pk", "title", "customer_name", "status", "created_at")[:10]
+    )
+    for row in rows:
+        row["status_display"] = statuses.get(row["status"], row["status"])
+    return rows
+
+
+async def recent_knowledge():
+    rows = await alist(
+        Knowledge.objects.values(
+            "pk", "title", "is_public", "updated_at",
+            "author__first_name", "author__last_name", "author__username",
+        )[:5]
+    )
+    return [
+        {
+            "pk": row["pk"],
+            "title": row["title"],
+            "is_public": row["is_public"],
+            "updated_at": row["updated_at"],
+            "author_name": display_name(
+                row["author__first_name"], row["author__last_name"], row["author__username"]
+            ),
+        }
+        for row in rows
+    ]
+
+
+async def category_stats():
+    """問い合わせの多いカテゴリ（上位10件）"""
+    category_counts = await alist(
+        InquiryCounter.objects.filter(dimension="category", count__gt=0)
+        .exclude(key="")
+        .order_by("-count")[:10]
+    )
+    names = {
+        pk: name
+        async for pk, name in Category.objects.filter(
+            pk__in=[c.key for c in category_counts]
+        ).values_list("pk", "name")
+    }
+    return [
+        {"name": names[int(counter.key)], "inquiry_count": counter.count}
+        for counter in category_counts
+        if int(counter.key) in names
+    ]
+
+
+async def assignee_stats():
+    """担当している問い合わせの多いスタッフ（上位10件）"""
+    User = get_user_model()
+    assignee_counts = await InquiryCounter.objects.acounts("assignee")
+    assignees = [
+        {
+            "name": display_name(first_name, last_name, username),
+            "assigned_count": assignee_counts.get(str(pk), 0),
+        }
+        async for pk, first_name, last_name, username in User.objects.filter(
+            is_staff=True
+        ).values_list("pk", "first_name", "last_name", "username")
+    ]
+    assignees.sort(key=lambda assignee: -assignee["assigned_count"])
+    return assignees[:10]
+
+
+def stats_version(stats):
+    """統計の内容から作る版。内容が同じなら集計し直しても描画済みの一覧を使い回せる"""
+    content = json.dumps(stats, cls=DjangoJSONEncoder, sort_keys=True)
+    return hashlib.sha256(content.encode()).hexdigest()[:32]
+
+
+async def acompute_dashboard_stats():
+    """ダッシュボードの統計を集計する
+
+    件数は InquiryCounter から読むので、問い合わせの件数に依存しない。
+    キャッシュに入れるので、モデルのインスタンスではなく値（dict・list）だけを返す。
+    非同期の ORM はリクエストごとに1つのスレッド・接続で実行されるので、集計は順に行われる
+    （並行はしないが、DB を待つ間イベントループは他のリクエストを処理できる）。
+    """
+    stats = {
+        **await InquiryCounter.objects.aheadline(),
+        "recent_inquiries": await recent_inquiries(),
+        "recent_knowledge": await recent_knowledge(),
+        "category_stats": await category_stats(),
+        "assignee_stats": await assignee_stats(),
+    }
+    # 描画した一覧の部分キャッシュのキーに使う
+    stats["stats_version"] = stats_version(stats)
+    return stats
+
+
+async def aget_dashboard_stats():
+    """キャッシュ済みの統計を返す
+
+    問い合わせ・ナレッジの保存と削除で破棄されるほか、
+    DASHBOARD_STATS_TTL 秒を過ぎたものは集計し直す。
+    """
+    stats = await cache.aget(DASHBOARD_STATS_KEY)
+    if stats is None:
+        stats = await acompute_dashboard_stats()
+        await cache.aset(DASHBOARD_STATS_KEY, stats, settings.DASHBOARD_STATS_TTL)
+    return stats
+
+
+def invalidate_dashboard_stats():
+    cache.delete(DASHBOARD_STATS_KEY)
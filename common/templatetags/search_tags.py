@@ -0,0 +1,18 @@
+from django import template
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from common.search import MARK_END, MARK_START
+
+register = template.Library()
+
+
+@register.filter
+def highlight(value):
+    """検索インデックスのマーカーを <mark> に置き換える"""
+    if not value:
+        return ""
+    html = escape(value)
+    html = html.replace(MARK_START, '<mark class="bg-yellow-200">')
+    html = html.replace(MARK_END, "</mark>")
+    return mark_safe(html)
@@ -0,0 +1,91 @@
+"""テストの共通部品"""
+
+from django.conf import settings
+from django.db import connection
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext, override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """テストではプロセス内のキャッシュを使う（共有キャッシュを読み書き・全消去しない）"""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._caches = override_settings(
+            CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}},
+            # 共有キャッシュを求める警告は、テストでは意図どおりなので出さない
+            SILENCED_SYSTEM_CHECKS=[*settings.SILENCED_SYSTEM_CHECKS, "common.W001"],
+        )
+        self._caches.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self._caches.disable()
+        super().teardown_test_environment(**kwargs)
+
+
+def query_plan(sql, params=()):
+    """EXPLAIN QUERY PLAN の各行の説明"""
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params)
+        return [row[3] for row in cursor.fetchall()]
+
+
+class QueryPlanTestMixin:
+    """一覧のクエリがインデックスで引けているかを実行計画で確かめる"""
+
+    def capture_plans(self, func):
+        """func の中で実行された SELECT の (SQL, 実行計画) のリスト"""
+        with CaptureQueriesContext(connection) as context:
+            func()
+        return [
+            (query["sql"], query_plan(query["sql"]))
+            for query in context.captured_queries
+            if query["sql"].startswith("SELECT")
+        ]
+
+    def assertIndexedPlans(
+        self, plans, table, indexes, search=False, sorted_by_index=True
+    ):
+        """どのテーブルも全件走査せず、table は indexes のいずれかで読んでいること
+
+        indexes が None のときはインデックスの名前を問わない。search のときは
+        インデックスを順にたどるのではなく、条件で範囲を絞って引いていること。
+        sorted_by_index のときは、並べ替えにもインデックスの順序を使っていること。
+        """
+        self.assertTrue(plans)
+        for sql, plan in plans:
+            message = f"\n{sql}\n" + "\n".join(plan)
+            # サブクエリの結果を読むのは全件走査ではない
+            subqueries = {
+                line.split()[1]
+                for line in plan
+                if line.startswith(("CO-ROUTINE ", "MATERIALIZE "))
+            }
+            for line in plan:
+                if (
+                    line.startswith("SCAN ")
+                    and " USING " not in line
+                    and line.split()[1] not in subqueries
+                ):
+                    self.fail(f"全件走査になっています:{message}")
+                if sorted_by_index and line.startswith("USE TEMP B-TREE FOR ORDER BY"):
+                    self.fail(f"インデックスの順序で並べ替えていません:{message}")
+            used = [
+                line
+                for line in plan
+                if line.startswith((f"SEARCH {table} ", f"SCAN {table} "))
+            ]
+            self.assertTrue(used, f"{table} を読んでいません:{message}")
+            if search:
+                for line in used:
+                    self.assertTrue(
+                        line.startswith("SEARCH "),
+                        f"{table} を条件で絞らずに読んでいます:{message}",
+                    )
+            if indexes is None:
+                continue
+            for line in used:
+                self.assertTrue(
+                    any(f" INDEX {index} " in f"{line} " for index in indexes),
+                    f"{table} を {', '.join(indexes)} で読んでいません:{message}",
+                )
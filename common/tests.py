@@ -1,3 +1,454 @@
-from django.test import TestCase
+import io
+import os
+import pickle
+import shutil
+import subprocess
+import tempfile
+import unittest
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.core import signing
+from django.core.cache import cache
+from django.db import OperationalError, connection, transaction
+from django.test import (
+    SimpleTestCase,
+    TestCase,
+    TransactionTestCase,
+    override_settings,
+)
+from django.urls import reverse
+from django.utils import timezone
+
+from inquiry import search as inquiry_search
+from inquiry.models import Inquiry, InquiryCounter
+from . import checks, db, jobqueue, metrics, previews
+from .blobs import store_file
+from .models import Blob, Job
+from .pagination import CURSOR_SALT, KeysetPaginator
+from .stats import DASHBOARD_STATS_KEY, acompute_dashboard_stats
+
+calls = []
+
+
+@jobqueue.handler("test.record", batch_size=2)
+def record(payloads):
+    calls.append(payloads)
+
+
+@jobqueue.handler("test.fail", max_attempts=2)
+def fail(payloads):
+    raise ValueError("失敗")
+
+
+@jobqueue.handler("test.count", atomic=True)
+def count(payloads):
+    InquiryCounter.objects.apply({("total", ""): sum(payloads)})
+
+
+class JobQueueTests(TestCase):
+    """ジョブのまとめ方・再試行・ちょうど1回の反映を確かめる"""
+
+    worker = "test:1"
+
+    def setUp(self):
+        calls.clear()
+
+    def run_all(self):
+        while jobs := jobqueue.claim(self.worker):
+            jobqueue.run(jobs, self.worker)
+
+    def test_batches_by_name_and_key(self):
+        jobqueue.enqueue("test.record", 1, key="a")
+        jobqueue.enqueue("test.record", 2, key="b")
+        jobqueue.enqueue("test.record", 3, key="a")
+        jobqueue.enqueue("test.record", 4, key="a")
+        self.run_all()
+        # 古いジョブの name・key から順に、batch_size 件ずつ取り出す
+        self.assertEqual(calls, [[1, 3], [2], [4]])
+        self.assertFalse(Job.objects.exists())
+
+    def test_delayed_job_waits(self):
+        jobqueue.enqueue("test.record", 1, delay=60)
+        self.run_all()
+        self.assertEqual(calls, [])
+
+    def test_retries_with_backoff_then_gives_up(self):
+        jobqueue.enqueue("test.fail")
+        with self.assertLogs("common.jobqueue", "ERROR"):
+            self.run_all()
+        job = Job.objects.get()
+        self.assertEqual(job.attempts, 1)
+        self.assertIsNone(job.failed_at)
+        self.assertGreater(job.run_at, timezone.now())
+        self.assertIn("ValueError", job.last_error)
+
+        Job.objects.update(run_at=timezone.now())
+        with self.assertLogs("common.jobqueue", "ERROR"):
+            self.run_all()
+        job = Job.objects.get()
+        self.assertEqual(job.attempts, 2)
+        self.assertIsNotNone(job.failed_at)
+        self.assertEqual(jobqueue.claim(self.worker), [])
+
+    def test_expired_lock_is_claimed_again(self):
+        jobqueue.enqueue("test.record", 1)
+        self.assertEqual(len(jobqueue.claim("other:1")), 1)
+        self.assertEqual(jobqueue.claim(self.worker), [])
+        Job.objects.update(locked_until=timezone.now() - timedelta(seconds=1))
+        self.run_all()
+        self.assertEqual(calls, [[1]])
+
+    def test_atomic_job_is_undone_when_lock_is_lost(self):
+        jobqueue.enqueue("test.count", 5)
+        jobs = jobqueue.claim(self.worker)
+        # 期限が切れて別のワーカーが取り出した
+        Job.objects.update(locked_by="other:1")
+        with self.assertLogs("common.jobqueue", "ERROR"):
+            jobqueue.run(jobs, self.worker)
+        self.assertEqual(InquiryCounter.objects.counts("total"), {})
+        self.assertEqual(Job.objects.get().locked_by, "other:1")
+
+    @override_settings(JOBS_EAGER=True)
+    def test_eager_runs_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            jobqueue.enqueue("test.record", 1)
+            self.assertEqual(calls, [])
+        self.assertEqual(calls, [[1]])
+        self.assertFalse(Job.objects.exists())
+
+    def test_counter_drift_counts_pending_jobs(self):
+        with mock.patch("inquiry.jobs.send_mail"):
+            Inquiry.objects.create(
+                title="問い合わせ", content="本文", customer_name="佐藤 太郎",
+                customer_email="sato@example.com",
+            )
+            self.assertEqual(InquiryCounter.objects.drift(), {})
+            self.run_all()
+        self.assertEqual(InquiryCounter.objects.counts("total"), {"": 1})
+        self.assertEqual(InquiryCounter.objects.drift(), {})
+
+
+@override_settings(BLOB_THUMBNAIL_SIZE=320)
+class StartupCheckTests(TestCase):
+    """ワーカーが動いていない・キャッシュが共有されていない設定を警告する"""
+
+    def test_overdue_jobs_warn_without_a_runner(self):
+        jobqueue.enqueue("test.record", 1)
+        self.assertEqual(checks.check_job_runner(None, databases=["default"]), [])
+        Job.objects.update(run_at=timezone.now() - timedelta(hours=1))
+        warnings = checks.check_job_runner(None, databases=["default"])
+        self.assertEqual([w.id for w in warnings], ["common.W002"])
+        with override_settings(JOBS_EAGER=True):
+            self.assertEqual(checks.check_job_runner(None, databases=["default"]), [])
+
+    def test_per_process_cache_warns_with_a_worker(self):
+        locmem = {"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}}
+        with override_settings(CACHES=locmem, JOBS_EAGER=False):
+            self.assertEqual([w.id for w in checks.check_shared_cache(None)], ["common.W001"])
+        with override_settings(CACHES=locmem, JOBS_EAGER=True):
+            self.assertEqual(checks.check_shared_cache(None), [])
+
+
+class KeysetPaginatorTests(TestCase):
+    """カーソルでの前後の移動・同じ日時の行・不正なカーソル・ページ番号への切り替えを確かめる"""
+
+    ordering = ("-created_at", "-pk")
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = get_user_model().objects.create_user("staff", is_staff=True)
+        for i in range(5):
+            Inquiry.objects.create(
+                title=f"問い合わせ{i}",
+                content="ログインできません",
+                customer_name="佐藤 太郎",
+                customer_email="sato@example.com",
+            )
+        # 3件を同じ日時にして、主キーで順番が決まることを確かめる
+        now = timezone.now()
+        pks = list(Inquiry.objects.order_by("pk").values_list("pk", flat=True))
+        Inquiry.objects.filter(pk__in=pks[1:4]).update(created_at=now)
+        Inquiry.objects.filter(pk=pks[0]).update(created_at=now - timedelta(days=1))
+        Inquiry.objects.filter(pk=pks[4]).update(created_at=now + timedelta(days=1))
+        cls.expected = list(Inquiry.objects.order_by(*cls.ordering))
+        inquiry_search.rebuild_index()
+
+    def paginator(self):
+        return KeysetPaginator(Inquiry.objects.all(), 2, self.ordering)
+
+    def test_walks_forward_and_back_across_ties(self):
+        pages = [self.paginator().page()]
+        self.assertFalse(pages[0].has_previous())
+        while pages[-1].has_next():
+            pages.append(self.paginator().page(pages[-1].next_cursor))
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual([row for page in pages for row in page], self.expected)
+        self.assertIsNone(pages[-1].next_cursor)
+
+        back = [pages[-1]]
+        while back[-1].has_previous():
+            back.append(self.paginator().page(back[-1].previous_cursor))
+        self.assertEqual(
+            [list(page) for page in reversed(back)], [list(page) for page in pages]
+        )
+        self.assertTrue(back[-1].has_next())
+
+    def test_invalid_cursor_returns_first_page(self):
+        first = list(self.paginator().page())
+        second = self.paginator().page(self.paginator().page().next_cursor)
+        forged = [
+            second.paginator.encode_cursor(self.expected[1], "next")[:-1] + "x",
+            signing.dumps(["next", ["2026-01-01T00:00:00+00:00", 1]], salt="other"),
+            signing.dumps(
+                ["sideways", ["2026-01-01T00:00:00+00:00", 1]], salt=CURSOR_SALT
+            ),
+            signing.dumps(["next", [1]], salt=CURSOR_SALT),
+            "not-a-cursor",
+        ]
+        for cursor in forged:
+            with self.subTest(cursor=cursor):
+                page = self.paginator().page(cursor)
+                self.assertEqual(list(page), first)
+                self.assertFalse(page.has_previous())
+
+    def test_count_is_capped(self):
+        paginator = KeysetPaginator(Inquiry.objects.all(), 2, self.ordering, count_limit=3)
+        self.assertEqual(paginator.count, 3)
+        self.assertTrue(paginator.count_is_capped)
+        paginator = KeysetPaginator(Inquiry.objects.all(), 2, self.ordering, count_limit=5)
+        self.assertEqual(paginator.count, 5)
+        self.assertFalse(paginator.count_is_capped)
+
+    def test_relevance_ordered_search_uses_page_numbers(self):
+        # 一覧の表示でキャッシュされるカテゴリのツリーを残さない
+        self.addCleanup(cache.clear)
+        self.client.force_login(self.staff)
+        url = reverse("inquiry:inquiry_list")
+        page = self.client.get(url).context["page_obj"]
+        self.assertTrue(page.is_keyset)
+        # 関連度順の検索結果はキーセットにできないので、ページ番号で切り替える
+        page = self.client.get(url, {"q": "ログインできません"}).context["page_obj"]
+        self.assertFalse(getattr(page, "is_keyset", False))
+        self.assertEqual(page.paginator.count, 5)
+
+
+@override_settings(DATABASE_LOCK_RETRIES=3, DATABASE_LOCK_RETRY_DELAY=0)
+class RetryOnLockTests(TransactionTestCase):
+    """トランザクションの外で呼ばれた書き込みが、ロック待ちの失敗からやり直すことを確かめる"""
+
+    def setUp(self):
+        # 別の接続で書き込みロックを取っておく
+        self.other = connection.copy()
+        self.other.cursor().execute("BEGIN IMMEDIATE")
+        # メモリ上のテスト用データベースでは close() が接続を閉じないので、直接閉じてロックを外す
+        self.addCleanup(self.other.connection.close)
+
+    def release_lock(self, delay):
+        self.other.connection.commit()
+
+    @db.retry_on_lock
+    def write(self):
+        with transaction.atomic():
+            Job.objects.create(name="test.record", run_at=timezone.now())
+
+    def test_retries_after_the_lock_is_released(self):
+        with (
+            mock.patch.object(db.time, "sleep", side_effect=self.release_lock) as sleep,
+            self.assertLogs("common.db", "WARNING"),
+        ):
+            self.write()
+        self.assertEqual(sleep.call_count, 1)
+        self.assertEqual(Job.objects.count(), 1)
+
+    def test_gives_up_after_the_retries(self):
+        with (
+            mock.patch.object(db.time, "sleep") as sleep,
+            self.assertLogs("common.db", "WARNING"),
+            self.assertRaises(OperationalError),
+        ):
+            self.write()
+        self.assertEqual(sleep.call_count, 3)
+
+    def test_does_not_retry_inside_a_transaction(self):
+        self.release_lock(0)
+        failing = mock.Mock(side_effect=OperationalError("database is locked"))
+        # 外側のトランザクションごとやり直す必要があるので、その場では再試行しない
+        with (
+            mock.patch.object(db.time, "sleep") as sleep,
+            self.assertRaises(OperationalError),
+            transaction.atomic(),
+        ):
+            db.retry_on_lock(failing)()
+        failing.assert_called_once_with()
+        sleep.assert_not_called()
+
+
+class BlobPreviewSizeTests(SimpleTestCase):
+    def test_fits_the_longer_side(self):
+        self.assertEqual(Blob(width=1600, height=900).preview_size, (320, 180))
+        self.assertEqual(Blob(width=300, height=1200).preview_size, (80, 320))
+
+    def test_does_not_enlarge_small_images(self):
+        self.assertEqual(Blob(width=100, height=50).preview_size, (100, 50))
+
+    def test_unknown_size_uses_the_thumbnail_bounds(self):
+        self.assertEqual(Blob(mime_type="application/pdf").preview_size, (320, 320))
+
+
+class ProcessBlobTests(TestCase):
+    def setUp(self):
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        settings_override = override_settings(MEDIA_ROOT=media_root)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.media_root = media_root
+
+    def store(self, data):
+        fd, path = tempfile.mkstemp(dir=self.media_root)
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        return store_file(path)
+
+    @unittest.skipUnless(previews.Image, "Pillow が入っていない")
+    def test_decompression_bomb_marks_preview_failed(self):
+        buffer = io.BytesIO()
+        previews.Image.new("RGB", (100, 100)).save(buffer, "PNG")
+        blob = self.store(buffer.getvalue())
+        # 2倍の 200 画素を超えるので、開いた時点で DecompressionBombError になる
+        with mock.patch.object(previews.Image, "MAX_IMAGE_PIXELS", 100):
+            with self.assertLogs("common.previews", "WARNING"):
+                self.assertTrue(previews.process_blob(blob.pk))
+        blob.refresh_from_db()
+        self.assertEqual(blob.mime_type, "image/png")
+        self.assertTrue(blob.preview_failed)
+        self.assertFalse(blob.preview)
+        self.assertIsNotNone(blob.processed_at)
+
+    def test_failed_command_marks_preview_failed(self):
+        blob = self.store(b"%PDF-1.4\n")
+        error = subprocess.CalledProcessError(1, "pdftoppm")
+        with mock.patch.object(previews, "pdf_preview", side_effect=error):
+            with self.assertLogs("common.previews", "ERROR"):
+                self.assertTrue(previews.process_blob(blob.pk))
+        blob.refresh_from_db()
+        self.assertEqual(blob.mime_type, "application/pdf")
+        self.assertTrue(blob.preview_failed)
+        self.assertIsNotNone(blob.processed_at)
+        # 処理済みなので再処理しない
+        self.assertFalse(previews.process_blob(blob.pk))
+
+
+class MetricsStoreTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def record(self, store, view_name):
+        values = dict.fromkeys(metrics.HISTOGRAMS, 1)
+        store.record(view_name, 200, values)
+        store.flush()
+
+    def test_workers_flush_to_their_own_keys(self):
+        first, second = metrics.MetricsStore(), metrics.MetricsStore()
+        self.record(first, "a")
+        self.record(second, "a")
+        self.record(first, "b")
+        with mock.patch.object(metrics, "store", first):
+            summary = metrics.collect()
+        self.assertEqual(summary["workers"], 2)
+        self.assertEqual(summary["views"]["a"]["requests"], 2)
+        self.assertEqual(summary["views"]["b"]["requests"], 1)
+
+    def test_reclaims_a_slot_taken_by_another_worker(self):
+        first, second = metrics.MetricsStore(), metrics.MetricsStore()
+        self.record(first, "a")
+        # first の番号が期限切れになり、second が取った
+        cache.delete(metrics._worker_key(first._slot))
+        self.record(second, "a")
+        self.record(first, "a")
+        self.assertNotEqual(first._slot, second._slot)
+        with mock.patch.object(metrics, "store", first):
+            self.assertEqual(metrics.collect()["views"]["a"]["requests"], 3)
+
+
+class DashboardInvalidationTests(TestCase):
+    """件数が変わる保存では、件数を反映したジョブの後で統計を破棄することを確かめる"""
+
+    worker = "test:1"
+
+    def setUp(self):
+        cache.set(DASHBOARD_STATS_KEY, {"total_inquiries": 0})
+        self.addCleanup(cache.delete, DASHBOARD_STATS_KEY)
+
+    def run_all(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            while jobs := jobqueue.claim(self.worker):
+                jobqueue.run(jobs, self.worker)
+
+    def test_counter_job_invalidates_after_applying(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            inquiry = Inquiry.objects.create(
+                title="問い合わせ", content="本文", customer_name="佐藤 太郎",
+                customer_email="sato@example.com",
+            )
+        # 件数はまだ反映されていないので、ここで破棄すると古い件数が再びキャッシュされる
+        self.assertIsNotNone(cache.get(DASHBOARD_STATS_KEY))
+        self.run_all()
+        self.assertIsNone(cache.get(DASHBOARD_STATS_KEY))
+
+        # 件数の変わらない保存は確定後にすぐ破棄する
+        cache.set(DASHBOARD_STATS_KEY, {"total_inquiries": 1})
+        inquiry.title = "件名の変更"
+        with self.captureOnCommitCallbacks(execute=True):
+            inquiry.save()
+        self.assertIsNone(cache.get(DASHBOARD_STATS_KEY))
+
+
+class DashboardViewTests(TestCase):
+    """非同期のダッシュボードが InquiryCounter の件数を表示し、キャッシュすることを確かめる"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_user("staff", is_staff=True)
+        with mock.patch("inquiry.jobs.send_mail"):
+            for status in ["new", "in_progress"]:
+                Inquiry.objects.create(
+                    title="問い合わせ", content="本文", customer_name="佐藤 太郎",
+                    customer_email="sato@example.com", status=status,
+                    assigned_to=cls.user,
+                )
+            while jobs := jobqueue.claim("test:1"):
+                jobqueue.run(jobs, "test:1")
+
+    def setUp(self):
+        cache.delete(DASHBOARD_STATS_KEY)
+        self.addCleanup(cache.delete, DASHBOARD_STATS_KEY)
+
+    async def test_dashboard(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(reverse("common:dashboard"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["total_inquiries"], 2)
+        self.assertEqual(response.context["in_progress_inquiries"], 1)
+        self.assertEqual(len(response.context["recent_inquiries"]), 2)
+        self.assertEqual(response.context["assignee_stats"][0]["assigned_count"], 2)
+        self.assertContains(response, "対応中")
+        self.assertIsNotNone(await cache.aget(DASHBOARD_STATS_KEY))
+
+    async def test_stats_are_plain_values(self):
+        stats = await acompute_dashboard_stats()
+        # キャッシュから読み出すときにモデルを組み立て直さないよう、値だけを入れる
+        self.assertEqual(pickle.loads(pickle.dumps(stats)), stats)
+        self.assertNotIn(b"django.db.models", pickle.dumps(stats))
+        self.assertEqual(stats["recent_inquiries"][0]["status_display"], "対応中")
+
+    async def test_stats_version_follows_content(self):
+        first = await acompute_dashboard_stats()
+        second = await acompute_dashboard_stats()
+        self.assertEqual(first["stats_version"], second["stats_version"])
+        await Inquiry.objects.filter(status="new").aupdate(title="件名の変更")
+        third = await acompute_dashboard_stats()
+        self.assertNotEqual(first["stats_version"], third["stats_version"])
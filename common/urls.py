@@ -5,4 +5,5 @@ app_name = "common"
 
 urlpatterns = [
     path("", views.dashboard, name="dashboard"),
+    path("metrics/", views.metrics, name="metrics"),
 ]
@@ -1,5 +1,16 @@
 from django.conf import settings
+from django.utils.functional import SimpleLazyObject
+
+from common.fragments import fragment_version
 
 
 def debug_mode(request):
     return {"DEBUG": settings.DEBUG}
+
+
+def fragment_cache(request):
+    """{% cache %} の有効期間と、キーに含めるバージョン（使ったときだけ読み込む）"""
+    return {
+        "FRAGMENT_CACHE_TTL": settings.FRAGMENT_CACHE_TTL,
+        "fragment_version": SimpleLazyObject(fragment_version),
+    }
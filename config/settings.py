@@ -39,6 +39,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    "common.middleware.RequestMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -60,13 +61,24 @@ TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
         "DIRS": [os.path.join(BASE_DIR, "templates")],
-        "APP_DIRS": True,
         "OPTIONS": {
             "context_processors": [
                 "django.template.context_processors.request",
                 "django.contrib.auth.context_processors.auth",
                 "django.contrib.messages.context_processors.messages",
                 "config.context_processors.debug_mode",
+                "config.context_processors.fragment_cache",
+            ],
+            # コンパイルしたテンプレートをプロセス内に保持する
+            # （DEBUG のときもテンプレートの変更は自動で読み直される）
+            "loaders": [
+                (
+                    "django.template.loaders.cached.Loader",
+                    [
+                        "django.template.loaders.filesystem.Loader",
+                        "django.template.loaders.app_directories.Loader",
+                    ],
+                ),
             ],
         },
     },
@@ -78,13 +90,127 @@ WSGI_APPLICATION = "config.wsgi.application"
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
+# 複数ワーカーから SQLite を使うため、接続ごとに以下を設定する
+# - WAL: 読み込みが書き込みを待たない（synchronous=NORMAL でも WAL なら壊れない）
+# - mmap / cache_size: 読み込みをページキャッシュとメモリで済ませる
+# - BEGIN IMMEDIATE: 書き込みロックをトランザクションの開始時に取り、
+#   途中でロックを取り損ねて即座に失敗するのを防ぐ
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "mmap_size": env.int("SQLITE_MMAP_SIZE", default=256 * 1024 * 1024),
+    # 負の値は KiB 単位
+    "cache_size": -env.int("SQLITE_CACHE_SIZE_KB", default=32 * 1024),
+    "temp_store": "MEMORY",
+}
+
 DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # 接続を使い回す秒数。同じスレッドがリクエストを続けて処理する WSGI のワーカーでだけ
+        # 指定する（ASGI ではリクエストごとにスレッドが変わり、使い回されない接続が残る）
+        "CONN_MAX_AGE": env.int("DATABASE_CONN_MAX_AGE", default=0),
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": {
+            "init_command": ";".join(
+                f"PRAGMA {name}={value}" for name, value in SQLITE_PRAGMAS.items()
+            ),
+            "transaction_mode": "IMMEDIATE",
+            # 書き込みロックを待つ秒数
+            "timeout": env.int("SQLITE_BUSY_TIMEOUT", default=5),
+        },
     }
 }
 
+# ロック待ちで失敗した書き込みをやり直す回数と、最初の待ち時間（秒、毎回倍にする）
+DATABASE_LOCK_RETRIES = env.int("DATABASE_LOCK_RETRIES", default=3)
+DATABASE_LOCK_RETRY_DELAY = env.float("DATABASE_LOCK_RETRY_DELAY", default=0.05)
+
+
+# Cache
+# web の各ワーカーと run_jobs のワーカーで同じキャッシュを共有する
+# （ジョブでのダッシュボード統計などの破棄を web に反映する）。
+# プロセスごとの locmemcache:// を既定にするのは、ジョブをその場で実行する DEBUG のときだけ
+
+CACHES = {
+    "default": env.cache(
+        "CACHE_URL",
+        default="locmemcache://" if DEBUG else "filecache:///var/cache/django",
+    ),
+}
+
+# テストは CACHE_URL によらずプロセス内のキャッシュで実行する
+TEST_RUNNER = "common.testing.TestRunner"
+
+# ダッシュボード統計をキャッシュする秒数（他ワーカーでの更新が反映されるまでの上限）
+DASHBOARD_STATS_TTL = env.int("DASHBOARD_STATS_TTL", default=60)
+
+# 一覧の行などテンプレートの部分キャッシュを保持する秒数
+FRAGMENT_CACHE_TTL = env.int("FRAGMENT_CACHE_TTL", default=3600)
+
+# 問い合わせ一覧の絞り込み件数をキャッシュする秒数
+INQUIRY_FACETS_TTL = env.int("INQUIRY_FACETS_TTL", default=30)
+
+# ナレッジ一覧のタグ件数をキャッシュする秒数
+KNOWLEDGE_TAG_COUNTS_TTL = env.int("KNOWLEDGE_TAG_COUNTS_TTL", default=30)
+
+# ナレッジ閲覧回数をまとめて書き込む間隔（秒）
+KNOWLEDGE_VIEW_FLUSH_INTERVAL = env.int("KNOWLEDGE_VIEW_FLUSH_INTERVAL", default=10)
+
+# 問い合わせ詳細に表示する関連ナレッジの件数・類似度の下限と、問い合わせごとにキャッシュする秒数
+RELATED_KNOWLEDGE_LIMIT = env.int("RELATED_KNOWLEDGE_LIMIT", default=5)
+RELATED_KNOWLEDGE_MIN_SCORE = env.float("RELATED_KNOWLEDGE_MIN_SCORE", default=0.05)
+RELATED_KNOWLEDGE_TTL = env.int("RELATED_KNOWLEDGE_TTL", default=300)
+
+# 同じ顧客の問い合わせを重複とみなす類似度（文字 3-gram の Jaccard 係数の推定値）
+DUPLICATE_INQUIRY_THRESHOLD = env.float("DUPLICATE_INQUIRY_THRESHOLD", default=0.6)
+
+# 関連ナレッジの計算に使う、ナレッジ1件あたりの語数の上限（重みの大きいものから）
+RELATED_KNOWLEDGE_MAX_TERMS = env.int("RELATED_KNOWLEDGE_MAX_TERMS", default=200)
+
+# 公開ナレッジの詳細を nginx にキャッシュさせる秒数（同じユーザーの再読み込み用。0 で無効）
+# キャッシュから返した分は閲覧回数に数えないので、既定では無効にして毎回 Django で確認する
+KNOWLEDGE_MICRO_CACHE_SECONDS = env.int("KNOWLEDGE_MICRO_CACHE_SECONDS", default=0)
+
+# リクエスト計測値を共有キャッシュに書き出す間隔（秒）
+REQUEST_METRICS_FLUSH_INTERVAL = env.int("REQUEST_METRICS_FLUSH_INTERVAL", default=10)
+
+# 1リクエスト内で同じ SQL がこの回数以上実行されたら N+1 の疑いとして記録する
+REQUEST_METRICS_N_PLUS_ONE_THRESHOLD = env.int(
+    "REQUEST_METRICS_N_PLUS_ONE_THRESHOLD", default=5
+)
+
+
+# Jobs
+# 保存後の処理（検索インデックス・件数集計・通知など）は run_jobs コマンドのワーカーで実行する
+
+# ワーカーを使わず、トランザクション確定後にその場で実行する（開発・テスト用。既定は DEBUG と同じ）。
+# 無効のときに run_jobs が動いていないと、manage.py check --database default で警告する
+JOBS_EAGER = env.bool("JOBS_EAGER", default=DEBUG)
+
+# run_jobs で起動するプロセス数と、ジョブがないときに待つ秒数
+JOB_WORKER_PROCESSES = env.int("JOB_WORKER_PROCESSES", default=2)
+JOB_POLL_INTERVAL = env.float("JOB_POLL_INTERVAL", default=1.0)
+
+# ジョブを取り出してから、止まったとみなして別のワーカーに渡すまでの秒数
+JOB_LOCK_TIMEOUT = env.int("JOB_LOCK_TIMEOUT", default=300)
+
+# 失敗したジョブを再実行するまでの秒数（毎回倍にする）と、その上限
+JOB_RETRY_DELAY = env.int("JOB_RETRY_DELAY", default=5)
+JOB_RETRY_MAX_DELAY = env.int("JOB_RETRY_MAX_DELAY", default=3600)
+
+
+# Email
+# 担当者への通知に使う（既定はコンソールに出力するだけ）
+
+EMAIL_CONFIG = env.email_url("EMAIL_URL", default="consolemail://")
+vars().update(EMAIL_CONFIG)
+DEFAULT_FROM_EMAIL = env("DEFAULT_FROM_EMAIL", default="webmaster@localhost")
+
+# 通知メールに載せる URL の先頭（例: https://support.example.com）
+SITE_URL = env("SITE_URL", default="http://localhost:8000")
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -127,7 +253,26 @@ STATICFILES_DIRS = [
 ]
 
 MEDIA_URL = "media/"
-MEDIA_ROOT = "/var/media/"
+MEDIA_ROOT = env("MEDIA_ROOT", default="/var/media/")
+
+# 分割アップロード中のファイルを置く場所（Blob へ移動するだけで済むよう MEDIA_ROOT の中にする）
+BLOB_UPLOAD_DIR = os.path.join(MEDIA_ROOT, "uploads")
+
+# 分割アップロードの1回あたりの上限（nginx の client_max_body_size より小さくする）
+BLOB_UPLOAD_CHUNK_SIZE = env.int("BLOB_UPLOAD_CHUNK_SIZE", default=8 * 1024 * 1024)
+
+# 添付ファイル1件の上限
+ATTACHMENT_MAX_SIZE = env.int("ATTACHMENT_MAX_SIZE", default=10 * 1024**3)
+
+# 途中で止まった分割アップロードを削除するまでの時間（時間）
+BLOB_UPLOAD_EXPIRE_HOURS = env.int("BLOB_UPLOAD_EXPIRE_HOURS", default=24)
+
+# 縮小版の長辺（ピクセル）
+BLOB_THUMBNAIL_SIZE = env.int("BLOB_THUMBNAIL_SIZE", default=320)
+
+# nginx の internal location（例: /protected/）。設定すると X-Accel-Redirect で
+# nginx にファイルを送らせる。未設定の場合は Django がファイルを返す（開発用）
+BLOB_X_ACCEL_PREFIX = env("BLOB_X_ACCEL_PREFIX", default="")
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
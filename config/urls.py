@@ -11,6 +11,6 @@ urlpatterns = (
         path("knowledge/", include("knowledge.urls")),
         path("", include("common.urls")),
     ]
+    # 添付ファイルは公開せず、inquiry:attachment_download から権限を確認して返す
     + static(settings.STATIC_URL, document_root=settings.STATICFILES_DIRS)
-    + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
 )
@@ -1,7 +1,13 @@
+from django import forms
 from django.contrib import admin
+from django.template.defaultfilters import filesizeformat
+from django.utils.decorators import method_decorator
+from django.views.decorators.csrf import csrf_exempt
 from .models import Inquiry, Response, Attachment
 from django.utils import timezone
 
+from common.blobs import store_upload, use_hashing_upload_handler
+
 
 class ResponseInline(admin.TabularInline):
     model = Response
@@ -10,15 +16,71 @@ class ResponseInline(admin.TabularInline):
     readonly_fields = ["created_at"]
 
 
-class AttachmentInline(admin.TabularInline):
+class AttachmentForm(forms.ModelForm):
+    """アップロードされたファイルを Blob として保存する"""
+
+    upload = forms.FileField(label="ファイル", required=False)
+
+    class Meta:
+        model = Attachment
+        fields = ["filename"]
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields["filename"].required = False
+
+    def clean(self):
+        cleaned_data = super().clean()
+        upload = cleaned_data.get("upload")
+        if upload is None and not self.instance.pk:
+            self.add_error("upload", "ファイルを選択してください。")
+        if upload is not None and not cleaned_data.get("filename"):
+            cleaned_data["filename"] = upload.name
+            self.instance.filename = upload.name
+        return cleaned_data
+
+    def save(self, commit=True):
+        upload = self.cleaned_data.get("upload")
+        if upload is not None:
+            self.instance.blob = store_upload(upload)
+            self.instance.content_type = upload.content_type or ""
+        return super().save(commit)
+
+
+class HashingUploadAdminMixin:
+    """添付ファイルを受け取る画面では、アップロードを受信しながら SHA-256 を計算する
+
+    CSRF ミドルウェアが本文を読む前にハンドラーを入れるため、ここでは csrf_exempt にする
+    （changeform_view が csrf_protect で確認する）。
+    """
+
+    @method_decorator(csrf_exempt)
+    def add_view(self, request, *args, **kwargs):
+        use_hashing_upload_handler(request)
+        return super().add_view(request, *args, **kwargs)
+
+    @method_decorator(csrf_exempt)
+    def change_view(self, request, *args, **kwargs):
+        use_hashing_upload_handler(request)
+        return super().change_view(request, *args, **kwargs)
+
+
+class AttachmentSizeMixin:
+    @admin.display(description="サイズ")
+    def file_size(self, obj):
+        return filesizeformat(obj.blob.size) if obj.blob_id else ""
+
+
+class AttachmentInline(AttachmentSizeMixin, admin.TabularInline):
     model = Attachment
+    form = AttachmentForm
     extra = 0
-    fields = ["file", "filename", "uploaded_at"]
-    readonly_fields = ["uploaded_at"]
+    fields = ["upload", "filename", "file_size", "uploaded_at"]
+    readonly_fields = ["file_size", "uploaded_at"]
 
 
 @admin.register(Inquiry)
-class InquiryAdmin(admin.ModelAdmin):
+class InquiryAdmin(HashingUploadAdminMixin, admin.ModelAdmin):
     list_display = [
         "title",
         "customer_name",
@@ -29,15 +91,34 @@ class InquiryAdmin(admin.ModelAdmin):
         "created_at",
         "days_since_created",
     ]
-    list_filter = ["status", "priority", "category", "assigned_to", "created_at"]
+    list_filter = [
+        "status",
+        "priority",
+        "category",
+        "assigned_to",
+        "created_at",
+        ("duplicate_of", admin.EmptyFieldListFilter),
+    ]
     search_fields = ["title", "content", "customer_name", "customer_email", "tags"]
-    readonly_fields = ["created_at", "updated_at", "resolved_at"]
+    readonly_fields = [
+        "created_at",
+        "updated_at",
+        "resolved_at",
+        "response_count",
+        "last_response_at",
+        "last_responder",
+    ]
+    raw_id_fields = ["duplicate_of"]
     date_hierarchy = "created_at"
 
     fieldsets = (
         ("基本情報", {"fields": ("title", "content", "category", "tags")}),
         ("顧客情報", {"fields": ("customer_name", "customer_email", "customer_phone")}),
-        ("管理情報", {"fields": ("status", "priority", "assigned_to")}),
+        ("管理情報", {"fields": ("status", "priority", "assigned_to", "duplicate_of")}),
+        (
+            "対応状況",
+            {"fields": ("response_count", "last_response_at", "last_responder")},
+        ),
         (
             "日時情報",
             {
@@ -70,8 +151,12 @@ class ResponseAdmin(admin.ModelAdmin):
 
 
 @admin.register(Attachment)
-class AttachmentAdmin(admin.ModelAdmin):
-    list_display = ["filename", "inquiry", "uploaded_at"]
+class AttachmentAdmin(HashingUploadAdminMixin, AttachmentSizeMixin, admin.ModelAdmin):
+    form = AttachmentForm
+    list_display = ["filename", "inquiry", "file_size", "uploaded_at"]
     list_filter = ["uploaded_at"]
+    list_select_related = ["inquiry", "blob"]
     search_fields = ["filename", "inquiry__title"]
-    readonly_fields = ["uploaded_at"]
+    fields = ["inquiry", "upload", "filename", "file_size", "uploaded_at"]
+    readonly_fields = ["file_size", "uploaded_at"]
+    raw_id_fields = ["inquiry"]
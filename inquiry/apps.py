@@ -4,4 +4,7 @@ from django.apps import AppConfig
 class InquiryConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'inquiry'
-    verbose_name = '問い合わせ管理'
\ No newline at end of file
+    verbose_name = '問い合わせ管理'
+
+    def ready(self):
+        from . import signals  # noqa: F401
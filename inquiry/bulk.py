@@ -0,0 +1,74 @@
+"""問い合わせの一括変更
+
+選んだ問い合わせのステータス・優先度・担当者を1回の UPDATE で書き換える。
+Inquiry.save() とシグナルを通らないので、その後処理（解決日時の設定、件数の増減、
+担当者への通知、ダッシュボード統計の破棄）もここでまとめて行う。
+"""
+
+from django.db import transaction
+from django.db.models import Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from common import jobqueue
+from common.stats import invalidate_dashboard_stats
+from .models import COUNTER_FIELDS, NOTIFY_JOB, Inquiry, InquiryCounter
+
+# 一度に変更できる件数
+MAX_IDS = 500
+
+UPDATED = "updated"
+UNCHANGED = "unchanged"
+NOT_FOUND = "not_found"
+
+
+@transaction.atomic
+def bulk_update(ids, changes):
+    """ids の問い合わせに changes（{フィールド名: 値}）をまとめて反映する
+
+    フィールドは status・priority・assigned_to（ユーザー ID または None）。
+    {問い合わせ ID: UPDATED / UNCHANGED / NOT_FOUND} を返す。
+    """
+    ids = list(dict.fromkeys(ids))
+    # 書き込みロックを取った後の値と比べる（同時に保存された変更を二重に数えないように）
+    rows = (
+        Inquiry.objects.filter(pk__in=ids)
+        .order_by()
+        .select_for_update()
+        .values("pk", *COUNTER_FIELDS.values())
+    )
+    results = dict.fromkeys(ids, NOT_FOUND)
+    counter_changes = []
+    notify = []
+    for row in rows:
+        if all(row[field] == value for field, value in changes.items()):
+            results[row["pk"]] = UNCHANGED
+            continue
+        results[row["pk"]] = UPDATED
+        old = {dimension: row[field] for dimension, field in COUNTER_FIELDS.items()}
+        new = {
+            dimension: changes.get(field, row[field])
+            for dimension, field in COUNTER_FIELDS.items()
+        }
+        counter_changes.append((old, new))
+        if new["assignee"] is not None and old["assignee"] != new["assignee"]:
+            notify.append((str(row["pk"]), {"inquiry": row["pk"]}))
+
+    updated = [pk for pk, result in results.items() if result == UPDATED]
+    if not updated:
+        return results
+
+    now = timezone.now()
+    values = {**changes, "updated_at": now}
+    if changes.get("status") == "resolved":
+        # save() と同じく、解決日時はまだないものにだけ入れる
+        values["resolved_at"] = Coalesce("resolved_at", Value(now))
+    Inquiry.objects.filter(pk__in=updated).update(**values)
+
+    InquiryCounter.objects.record_many(counter_changes)
+    if notify:
+        jobqueue.enqueue_many(NOTIFY_JOB, notify)
+    # ダッシュボードの最近の問い合わせ一覧に出るステータス・担当者が変わる
+    # （件数は、反映したジョブがもう一度破棄する）
+    transaction.on_commit(invalidate_dashboard_stats)
+    return results
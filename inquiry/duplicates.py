@@ -0,0 +1,208 @@
+"""同じ顧客からの重複した問い合わせの検出（MinHash と LSH）
+
+件名と内容を文字 3-gram の集合にし、MINHASH_SIZE 個のハッシュ関数の最小値を
+署名として InquirySignature に保存する。署名を BANDS 個の帯に分け、
+顧客メールアドレスと帯の値から作ったバケットを InquiryBucket に登録する。
+バケットが1つでも一致した問い合わせだけを候補とし、署名の一致率（Jaccard 係数の推定値）が
+DUPLICATE_INQUIRY_THRESHOLD 以上のものを重複とみなすので、過去の問い合わせすべてと比べずに済む。
+
+帯 16 個 × 4 行の場合、類似度 0.5 で約 64%、0.7 で約 98% の組が候補になる。
+"""
+
+import hashlib
+import random
+import re
+import zlib
+from array import array
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from common import jobqueue
+from common.search import normalize_text
+from .models import Inquiry, InquiryBucket, InquirySignature
+
+UPDATE_JOB = "inquiry.update_signatures"
+
+MINHASH_SIZE = 64
+BANDS = 16
+ROWS = MINHASH_SIZE // BANDS
+SHINGLE_SIZE = 3
+
+# ハッシュ関数 (a * x + b) mod PRIME。値が変わると保存済みの署名と比べられなくなる
+PRIME = (1 << 61) - 1
+_random = random.Random(20240101)
+COEFFICIENTS = [
+    (_random.randrange(1, PRIME), _random.randrange(0, PRIME))
+    for _ in range(MINHASH_SIZE)
+]
+
+SPACES = re.compile(r"\s+")
+
+
+def shingles(text):
+    """空白を除いた文字 3-gram のハッシュ値の集合"""
+    text = SPACES.sub("", normalize_text(text).lower())
+    if len(text) < SHINGLE_SIZE:
+        return {zlib.crc32(text.encode())} if text else set()
+    return {
+        zlib.crc32(text[i : i + SHINGLE_SIZE].encode())
+        for i in range(len(text) - SHINGLE_SIZE + 1)
+    }
+
+
+def signature(title, content):
+    """MinHash の署名（MINHASH_SIZE 個の整数）。内容が空なら None"""
+    values = shingles(f"{title}\n{content}")
+    if not values:
+        return None
+    return [min((a * x + b) % PRIME for x in values) for a, b in COEFFICIENTS]
+
+
+def normalize_email(email):
+    return (email or "").strip().lower()
+
+
+def buckets(email, minhash):
+    """顧客メールアドレスと帯ごとの値から作るバケット（64 ビット符号付き整数）"""
+    email = normalize_email(email).encode()
+    result = []
+    for band in range(BANDS):
+        hasher = hashlib.blake2b(email, digest_size=8)
+        hasher.update(array("Q", [band, *minhash[band * ROWS : (band + 1) * ROWS]]).tobytes())
+        result.append(int.from_bytes(hasher.digest(), "big", signed=True))
+    return result
+
+
+def similarity(minhash, other):
+    """署名の一致率（Jaccard 係数の推定値）"""
+    return sum(x == y for x, y in zip(minhash, other)) / MINHASH_SIZE
+
+
+def load_signatures(ids):
+    signatures = {}
+    for inquiry_id, data in InquirySignature.objects.filter(
+        inquiry_id__in=ids
+    ).values_list("inquiry_id", "minhash"):
+        values = array("Q")
+        values.frombytes(data)
+        signatures[inquiry_id] = values
+    return signatures
+
+
+def find_duplicates(email, minhash, exclude=None):
+    """同じ顧客の似た問い合わせ [(問い合わせ ID, 類似度), ...] を類似度の高い順に返す"""
+    if minhash is None:
+        return []
+    candidates = InquiryBucket.objects.filter(bucket__in=buckets(email, minhash))
+    if exclude is not None:
+        candidates = candidates.exclude(inquiry_id=exclude)
+    ids = set(candidates.values_list("inquiry_id", flat=True))
+    scores = [
+        (inquiry_id, similarity(minhash, other))
+        for inquiry_id, other in load_signatures(ids).items()
+    ]
+    return sorted(
+        (
+            (inquiry_id, score)
+            for inquiry_id, score in scores
+            if score >= settings.DUPLICATE_INQUIRY_THRESHOLD
+        ),
+        key=lambda item: (-item[1], item[0]),
+    )
+
+
+def find_duplicate(inquiry):
+    """保存前の問い合わせに最も近い、同じ顧客の既存の問い合わせ（なければ None）"""
+    minhash = signature(inquiry.title, inquiry.content)
+    duplicates = find_duplicates(inquiry.customer_email, minhash, exclude=inquiry.pk)
+    if not duplicates:
+        return None
+    return Inquiry.objects.filter(pk=duplicates[0][0]).first()
+
+
+@transaction.atomic
+def update_signatures(ids):
+    """署名とバケットを作り直す。登録件数を返す"""
+    ids = set(ids)
+    signatures = []
+    entries = []
+    for pk, title, content, email in Inquiry.objects.filter(pk__in=ids).values_list(
+        "pk", "title", "content", "customer_email"
+    ):
+        minhash = signature(title, content)
+        if minhash is None:
+            continue
+        signatures.append(
+            InquirySignature(inquiry_id=pk, minhash=array("Q", minhash).tobytes())
+        )
+        entries.extend(
+            InquiryBucket(inquiry_id=pk, bucket=bucket)
+            for bucket in buckets(email, minhash)
+        )
+    InquiryBucket.objects.filter(inquiry_id__in=ids).delete()
+    InquirySignature.objects.filter(inquiry_id__in=ids).delete()
+    InquirySignature.objects.bulk_create(signatures)
+    InquiryBucket.objects.bulk_create(entries)
+    return len(signatures)
+
+
+def rebuild(batch_size=1000):
+    """すべての問い合わせの署名を作り直す。登録件数を返す"""
+    count = 0
+    batch = []
+    ids = Inquiry.objects.order_by("pk").values_list("pk", flat=True)
+    for pk in ids.iterator(chunk_size=batch_size):
+        batch.append(pk)
+        if len(batch) >= batch_size:
+            count += update_signatures(batch)
+            batch = []
+    count += update_signatures(batch)
+    return count
+
+
+def schedule_update(ids):
+    """署名の更新をジョブに回す"""
+    ids = sorted(set(ids))
+    if ids:
+        jobqueue.enqueue(UPDATE_JOB, ids)
+
+
+def sweep():
+    """保存済みの署名から重複の組を探す {問い合わせ ID: 重複元の ID}
+
+    バケットを共有する問い合わせの組だけを比べ、それぞれ最も古い（ID の小さい）
+    似た問い合わせを重複元とする。重複元がすでに他の問い合わせの重複なら、その重複元にそろえる。
+    """
+    shared = (
+        InquiryBucket.objects.values("bucket")
+        .annotate(n=Count("inquiry"))
+        .filter(n__gt=1)
+        .values("bucket")
+    )
+    groups = defaultdict(set)
+    for bucket, inquiry_id in InquiryBucket.objects.filter(
+        bucket__in=shared
+    ).values_list("bucket", "inquiry_id"):
+        groups[bucket].add(inquiry_id)
+
+    pairs = set()
+    for members in groups.values():
+        members = sorted(members)
+        pairs.update(
+            (first, second)
+            for i, first in enumerate(members)
+            for second in members[i + 1 :]
+        )
+    signatures = load_signatures({pk for pair in pairs for pk in pair})
+
+    originals = {}
+    for first, second in sorted(pairs):
+        if first not in signatures or second not in signatures:
+            continue
+        score = similarity(signatures[first], signatures[second])
+        if score >= settings.DUPLICATE_INQUIRY_THRESHOLD and second not in originals:
+            originals[second] = originals.get(first, first)
+    return originals
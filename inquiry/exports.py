@@ -0,0 +1,102 @@
+"""問い合わせ一覧の CSV / JSONL 出力
+
+モデルのインスタンスを作らずに values_list() で必要な列だけを読み、
+カテゴリ名・担当者名も JOIN で取得する。iterator() で少しずつ読みながら
+書き出すので、件数に関わらずメモリ使用量は一定で、すぐに送信が始まる。
+
+ASGI では、同期のイテレーターを渡した StreamingHttpResponse は全体を list() で
+読み込んでから送るので、streaming_response() で非同期のイテレーターに包んで渡す。
+"""
+
+import csv
+import json
+from datetime import datetime
+from itertools import islice
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .models import Inquiry
+
+# (見出し, JSONL のキー, values_list に渡すフィールド)
+EXPORT_COLUMNS = [
+    ("ID", "id", "pk"),
+    ("件名", "title", "title"),
+    ("ステータス", "status", "status"),
+    ("優先度", "priority", "priority"),
+    ("カテゴリ", "category", "category__name"),
+    ("担当者", "assigned_to", "assigned_to__username"),
+    ("顧客名", "customer_name", "customer_name"),
+    ("顧客メールアドレス", "customer_email", "customer_email"),
+    ("顧客電話番号", "customer_phone", "customer_phone"),
+    ("対応件数", "response_count", "response_count"),
+    ("最終対応日時", "last_response_at", "last_response_at"),
+    ("作成日時", "created_at", "created_at"),
+    ("更新日時", "updated_at", "updated_at"),
+    ("解決日時", "resolved_at", "resolved_at"),
+]
+
+CHUNK_SIZE = 2000
+
+STATUS_LABELS = dict(Inquiry.STATUS_CHOICES)
+PRIORITY_LABELS = dict(Inquiry.PRIORITY_CHOICES)
+
+
+class Echo:
+    """csv.writer の書き込み先。書き込んだ行をそのまま返す"""
+
+    def write(self, value):
+        return value
+
+
+def export_rows(queryset, labels=True):
+    """出力する行を1行ずつ返す。labels ならステータス・優先度を表示名にする"""
+    if not queryset.query.order_by:
+        queryset = queryset.order_by("-created_at", "-pk")
+    rows = queryset.values_list(*[field for _, _, field in EXPORT_COLUMNS])
+    for row in rows.iterator(chunk_size=CHUNK_SIZE):
+        row = list(row)
+        if labels:
+            row[2] = STATUS_LABELS.get(row[2], row[2])
+            row[3] = PRIORITY_LABELS.get(row[3], row[3])
+        yield [
+            timezone.localtime(value).isoformat(timespec="seconds")
+            if isinstance(value, datetime)
+            else value
+            for value in row
+        ]
+
+
+def stream_csv(queryset):
+    writer = csv.writer(Echo())
+    # Excel で文字化けしないように BOM を付ける
+    yield "\ufeff" + writer.writerow([header for header, _, _ in EXPORT_COLUMNS])
+    for row in export_rows(queryset):
+        yield writer.writerow(["" if value is None else value for value in row])
+
+
+def stream_jsonl(queryset):
+    """ステータス・優先度はコードのまま出力する"""
+    keys = [key for _, key, _ in EXPORT_COLUMNS]
+    for row in export_rows(queryset, labels=False):
+        yield json.dumps(dict(zip(keys, row)), ensure_ascii=False) + "\n"
+
+
+async def aiter_chunks(iterator, size=CHUNK_SIZE):
+    """同期のイテレーターを size 件ずつ進め、まとめた文字列を返す非同期イテレーター
+
+    読み出しはリクエストの同期処理と同じスレッド（同じ DB 接続）で行う。
+    """
+    iterator = iter(iterator)
+    next_chunk = sync_to_async(lambda: "".join(islice(iterator, size)))
+    while chunk := await next_chunk():
+        yield chunk
+
+
+def streaming_response(request, content, content_type):
+    """ASGI でも少しずつ送る StreamingHttpResponse"""
+    if isinstance(request, ASGIRequest):
+        content = aiter_chunks(content)
+    return StreamingHttpResponse(content, content_type=content_type)
@@ -0,0 +1,110 @@
+"""問い合わせ一覧の絞り込み件数（ファセット）の集計とキャッシュ
+
+ステータス・優先度・カテゴリ・担当者ごとに、そのファセット自身の条件だけを外して
+GROUP BY する。選択中の項目以外の件数も分かり、組み合わせの数だけ行が増えることもない。
+"""
+
+import hashlib
+import json
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db.models import Count
+
+from common.categories import get_tree
+from .models import Inquiry
+
+FACETS_KEY_PREFIX = "inquiry:facets:"
+
+# ファセット名と、集計行でその値を持つカラム
+FACET_COLUMNS = {
+    "status": "status",
+    "priority": "priority",
+    "category": "category_id",
+    "assigned_to": "assigned_to_id",
+}
+
+
+def cache_key(form):
+    """正規化した絞り込み条件からキャッシュキーを作る"""
+    data = {
+        name: getattr(value, "pk", value)
+        for name, value in form.cleaned_data.items()
+        if value
+    }
+    digest = hashlib.md5(
+        json.dumps(data, sort_keys=True, default=str).encode()
+    ).hexdigest()
+    return FACETS_KEY_PREFIX + digest
+
+
+def compute_facets(form):
+    counts = {}
+    for name, column in FACET_COLUMNS.items():
+        queryset = form.filter_queryset(Inquiry.objects.all(), exclude=[name])
+        counts[name] = Counter(
+            dict(
+                queryset.order_by()
+                .values(column)
+                .annotate(count=Count("pk"))
+                .values_list(column, "count")
+            )
+        )
+
+    # 全条件での件数は、ステータスのファセットのうち選択中のものを足せばよい
+    status = form.cleaned_data.get("status")
+    total = counts["status"][status] if status else sum(counts["status"].values())
+
+    return {
+        "total": total,
+        "facets": {
+            "status": _choice_facet(counts["status"], Inquiry.STATUS_CHOICES),
+            "priority": _choice_facet(counts["priority"], Inquiry.PRIORITY_CHOICES),
+            "category": _object_facet(
+                counts["category"], _category_names(counts["category"]), "未分類"
+            ),
+            "assigned_to": _object_facet(
+                counts["assigned_to"], _user_names(counts["assigned_to"]), "未割り当て"
+            ),
+        },
+    }
+
+
+def _choice_facet(counter, choices):
+    return [
+        {"value": value, "label": label, "count": counter[value]}
+        for value, label in choices
+    ]
+
+
+def _object_facet(counter, names, empty_label):
+    return [
+        {
+            "value": "" if pk is None else str(pk),
+            "label": empty_label if pk is None else names.get(pk, str(pk)),
+            "count": count,
+        }
+        for pk, count in counter.most_common()
+    ]
+
+
+def _category_names(counter):
+    tree = get_tree()
+    return {pk: tree.get(pk).name for pk in counter if tree.get(pk)}
+
+
+def _user_names(counter):
+    users = get_user_model().objects.filter(pk__in=[pk for pk in counter if pk])
+    return {user.pk: user.get_full_name() or user.username for user in users}
+
+
+def get_facets(form):
+    """絞り込み件数を返す。同じ条件の集計は INQUIRY_FACETS_TTL 秒キャッシュする"""
+    key = cache_key(form)
+    facets = cache.get(key)
+    if facets is None:
+        facets = compute_facets(form)
+        cache.set(key, facets, settings.INQUIRY_FACETS_TTL)
+    return facets
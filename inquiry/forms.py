@@ -1,14 +1,26 @@
+from datetime import datetime, time, timedelta
+
 from django import forms
 from django.contrib.auth import get_user_model
+from django.utils import timezone
 from .models import Inquiry, Response
-from common.models import Category
+from . import bulk, search
+from common.categories import filter_by_category
+from common.forms import CategoryChoiceField, TagNamesField, TagNamesFormMixin
 
 User = get_user_model()
 
 
-class InquiryForm(forms.ModelForm):
+def day_start(date):
+    """その日の 0 時（現在のタイムゾーン）"""
+    return timezone.make_aware(datetime.combine(date, time.min))
+
+
+class InquiryForm(TagNamesFormMixin, forms.ModelForm):
     """問い合わせフォーム"""
 
+    tags = TagNamesField(label="タグ")
+
     class Meta:
         model = Inquiry
         fields = [
@@ -29,15 +41,14 @@ class InquiryForm(forms.ModelForm):
             "customer_phone": forms.TextInput(attrs={"class": "form-control"}),
             "category": forms.Select(attrs={"class": "form-control"}),
             "priority": forms.Select(attrs={"class": "form-control"}),
-            "tags": forms.TextInput(
-                attrs={"class": "form-control", "placeholder": "カンマ区切りで入力"}
-            ),
         }
 
 
-class InquiryUpdateForm(forms.ModelForm):
+class InquiryUpdateForm(TagNamesFormMixin, forms.ModelForm):
     """問い合わせ更新フォーム"""
 
+    tags = TagNamesField(label="タグ")
+
     class Meta:
         model = Inquiry
         fields = [
@@ -62,9 +73,6 @@ class InquiryUpdateForm(forms.ModelForm):
             "status": forms.Select(attrs={"class": "form-control"}),
             "priority": forms.Select(attrs={"class": "form-control"}),
             "assigned_to": forms.Select(attrs={"class": "form-control"}),
-            "tags": forms.TextInput(
-                attrs={"class": "form-control", "placeholder": "カンマ区切りで入力"}
-            ),
         }
 
     def __init__(self, *args, **kwargs):
@@ -89,11 +97,12 @@ class InquirySearchForm(forms.Form):
 
     q = forms.CharField(
         label="キーワード検索",
+        max_length=200,
         required=False,
         widget=forms.TextInput(
             attrs={
                 "class": "form-control",
-                "placeholder": "タイトル、内容、顧客名で検索",
+                "placeholder": "タイトル、内容、顧客情報、タグ、対応履歴で検索",
             }
         ),
     )
@@ -109,12 +118,16 @@ class InquirySearchForm(forms.Form):
         required=False,
         widget=forms.Select(attrs={"class": "form-control"}),
     )
-    category = forms.ModelChoiceField(
+    category = CategoryChoiceField(
         label="カテゴリ",
-        queryset=Category.objects.all(),
         required=False,
         widget=forms.Select(attrs={"class": "form-control"}),
     )
+    include_subcategories = forms.BooleanField(
+        label="下位カテゴリを含む",
+        required=False,
+        widget=forms.CheckboxInput(attrs={"class": "form-check-input"}),
+    )
     assigned_to = forms.ModelChoiceField(
         label="担当者",
         queryset=User.objects.filter(is_staff=True),
@@ -131,3 +144,122 @@ class InquirySearchForm(forms.Form):
         required=False,
         widget=forms.DateInput(attrs={"class": "form-control", "type": "date"}),
     )
+
+    # 値をそのままモデルのフィールドと照合する絞り込み条件
+    FILTER_FIELDS = ("status", "priority", "assigned_to")
+
+    def clean_q(self):
+        return " ".join(self.cleaned_data["q"].split())
+
+    def filter_queryset(self, queryset, exclude=()):
+        """入力された条件で絞り込む。exclude に挙げたフィールドは条件に使わない"""
+        for name in self.FILTER_FIELDS:
+            value = self.cleaned_data.get(name)
+            if value and name not in exclude:
+                queryset = queryset.filter(**{name: value})
+
+        category = self.cleaned_data.get("category")
+        if category and "category" not in exclude:
+            queryset = filter_by_category(
+                queryset, category, self.cleaned_data.get("include_subcategories")
+            )
+
+        # created_at__date は列を日付に変換するのでインデックスが使えない。
+        # 日の境界の日時との比較にする
+        date_from = self.cleaned_data.get("date_from")
+        if date_from:
+            queryset = queryset.filter(created_at__gte=day_start(date_from))
+
+        date_to = self.cleaned_data.get("date_to")
+        if date_to:
+            queryset = queryset.filter(
+                created_at__lt=day_start(date_to + timedelta(days=1))
+            )
+
+        q = self.cleaned_data.get("q")
+        if q:
+            queryset = search.search(queryset, q)
+
+        return queryset
+
+
+class IdListField(forms.Field):
+    """同じ名前で送られた複数の ID（重複は除く）"""
+
+    widget = forms.MultipleHiddenInput
+    default_error_messages = {
+        "invalid": "ID が正しくありません。",
+        "max_count": "一度に変更できるのは %(max)d 件までです。",
+    }
+
+    def __init__(self, *, max_count=None, **kwargs):
+        super().__init__(**kwargs)
+        self.max_count = max_count
+
+    def to_python(self, value):
+        if not value:
+            return []
+        try:
+            return list(dict.fromkeys(int(pk) for pk in value))
+        except (TypeError, ValueError):
+            raise forms.ValidationError(self.error_messages["invalid"], code="invalid")
+
+    def validate(self, value):
+        super().validate(value)
+        if self.max_count is not None and len(value) > self.max_count:
+            raise forms.ValidationError(
+                self.error_messages["max_count"],
+                code="max_count",
+                params={"max": self.max_count},
+            )
+
+
+class InquiryBulkUpdateForm(forms.Form):
+    """問い合わせ一括変更フォーム（AJAX）。空欄の項目は変更しない"""
+
+    ids = IdListField(label="問い合わせ", max_count=bulk.MAX_IDS)
+    status = forms.ChoiceField(
+        label="ステータス",
+        choices=[("", "変更しない")] + Inquiry.STATUS_CHOICES,
+        required=False,
+        widget=forms.Select(attrs={"class": "form-control"}),
+    )
+    priority = forms.ChoiceField(
+        label="優先度",
+        choices=[("", "変更しない")] + Inquiry.PRIORITY_CHOICES,
+        required=False,
+        widget=forms.Select(attrs={"class": "form-control"}),
+    )
+    assigned_to = forms.ModelChoiceField(
+        label="担当者",
+        queryset=User.objects.filter(is_staff=True),
+        required=False,
+        empty_label="変更しない",
+        widget=forms.Select(attrs={"class": "form-control"}),
+    )
+    unassign = forms.BooleanField(
+        label="担当者を外す",
+        required=False,
+        widget=forms.CheckboxInput(attrs={"class": "form-check-input"}),
+    )
+
+    def clean(self):
+        cleaned_data = super().clean()
+        if cleaned_data.get("assigned_to") and cleaned_data.get("unassign"):
+            raise forms.ValidationError("担当者の指定と担当者を外す指定は同時にできません。")
+        if not self.errors and not self.changes():
+            raise forms.ValidationError("変更する項目を選んでください。")
+        return cleaned_data
+
+    def changes(self):
+        """{フィールド名: 値}。担当者はユーザー ID（外す場合は None）"""
+        changes = {
+            name: self.cleaned_data[name]
+            for name in ("status", "priority")
+            if self.cleaned_data.get(name)
+        }
+        if self.cleaned_data.get("unassign"):
+            changes["assigned_to"] = None
+        elif self.cleaned_data.get("assigned_to"):
+            changes["assigned_to"] = self.cleaned_data["assigned_to"].pk
+        return changes
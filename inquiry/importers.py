@@ -0,0 +1,123 @@
+"""問い合わせの一括取り込み
+
+1行が1件の問い合わせで、対応履歴は responses に配列で持たせる
+（CSV の場合は JSON 文字列の列）。タグはタグ名の配列かカンマ区切り、
+カテゴリは「親/子」形式のパス、担当者・対応者はユーザー名で指定する。
+"""
+
+from collections import Counter
+
+from django.utils import timezone
+
+from common.importers import (
+    BulkImporter,
+    CategoryMap,
+    RowError,
+    TagMap,
+    boolean,
+    choice,
+    datetime_value,
+    email,
+    json_list,
+    names,
+    preserve_timestamps,
+    text,
+)
+from common.stats import invalidate_dashboard_stats
+from .models import Inquiry, InquiryCounter, Response
+from . import duplicates, search
+
+
+class InquiryImporter(BulkImporter):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.tags = TagMap()
+        self.categories = CategoryMap()
+
+    def build(self, row):
+        now = timezone.now()
+        created_at = datetime_value(row, "created_at", now)
+        responses = []
+        for i, item in enumerate(json_list(row, "responses"), start=1):
+            if not isinstance(item, dict):
+                raise RowError(f"responses の{i}件目の形式が不正です。")
+            responses.append(
+                Response(
+                    responder_id=self.user(
+                        text(item, "responder"), f"responses の{i}件目の responder", True
+                    ),
+                    content=text(item, "content", required=True),
+                    is_internal=boolean(item, "is_internal"),
+                    created_at=datetime_value(item, "created_at", created_at),
+                )
+            )
+        responses.sort(key=lambda response: response.created_at)
+        last = responses[-1] if responses else None
+
+        status = choice(row, "status", Inquiry.STATUS_CHOICES, "new")
+        resolved_at = datetime_value(row, "resolved_at")
+        if resolved_at is None and status in ("resolved", "closed"):
+            resolved_at = last.created_at if last else created_at
+
+        inquiry = Inquiry(
+            title=text(row, "title", required=True, max_length=200),
+            content=text(row, "content", required=True),
+            customer_name=text(row, "customer_name", required=True, max_length=100),
+            customer_email=email(row, "customer_email", required=True),
+            customer_phone=text(row, "customer_phone", max_length=20),
+            status=status,
+            priority=choice(row, "priority", Inquiry.PRIORITY_CHOICES, "medium"),
+            assigned_to_id=self.user(text(row, "assigned_to"), "assigned_to"),
+            created_at=created_at,
+            updated_at=datetime_value(
+                row,
+                "updated_at",
+                max(filter(None, [created_at, last and last.created_at, resolved_at])),
+            ),
+            resolved_at=resolved_at,
+            # 対応履歴の集計は取り込む内容から直接設定する
+            response_count=len(responses),
+            last_response_at=last.created_at if last else None,
+            last_responder_id=last.responder_id if last else None,
+        )
+        category = self.categories.parse(text(row, "category"))
+        return inquiry, responses, names(row, "tags"), category
+
+    def save_batch(self, batch):
+        tag_ids = self.tags.resolve(
+            name for _, _, tag_names, _ in batch for name in tag_names
+        )
+        category_ids = self.categories.resolve(category for *_, category in batch)
+        inquiries = []
+        for inquiry, _, _, category in batch:
+            inquiry.category_id = category_ids.get(category)
+            inquiries.append(inquiry)
+        with preserve_timestamps(Inquiry, Response):
+            Inquiry.objects.bulk_create(inquiries)
+            for inquiry, responses, _, _ in batch:
+                for response in responses:
+                    response.inquiry_id = inquiry.pk
+            Response.objects.bulk_create(
+                [response for _, responses, _, _ in batch for response in responses],
+                batch_size=self.batch_size,
+            )
+        Inquiry.tags.through.objects.bulk_create(
+            [
+                Inquiry.tags.through(inquiry_id=inquiry.pk, tag_id=tag_ids[name])
+                for inquiry, _, tag_names, _ in batch
+                for name in tag_names
+            ],
+            batch_size=self.batch_size,
+        )
+        # bulk_create ではシグナルが呼ばれないので、件数の集計・検索インデックス・重複検出の署名をここで更新する
+        deltas = Counter()
+        for inquiry in inquiries:
+            deltas["total", ""] += 1
+            for dimension, value in inquiry.counter_values().items():
+                deltas[dimension, InquiryCounter.objects.key(value)] += 1
+        InquiryCounter.objects.apply(deltas)
+        search.update_index([inquiry.pk for inquiry in inquiries])
+        duplicates.update_signatures([inquiry.pk for inquiry in inquiries])
+
+    def finish(self):
+        invalidate_dashboard_stats()
@@ -0,0 +1,65 @@
+import logging
+from collections import Counter
+
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import transaction
+from django.template.loader import render_to_string
+from django.urls import reverse
+
+from common.jobqueue import handler
+from common.stats import invalidate_dashboard_stats
+from .models import COUNTER_JOB, NOTIFY_JOB, Inquiry, InquiryCounter
+from . import duplicates, search
+
+logger = logging.getLogger(__name__)
+
+
+@handler(search.UPDATE_JOB, batch_size=1000)
+def update_search_index(payloads):
+    """溜まった問い合わせ ID をまとめて1回で更新する"""
+    search.update_index(set().union(*payloads))
+
+
+@handler(duplicates.UPDATE_JOB, batch_size=1000)
+def update_signatures(payloads):
+    duplicates.update_signatures(set().union(*payloads))
+
+
+@handler(COUNTER_JOB, atomic=True, batch_size=1000)
+def apply_counters(payloads):
+    """[[集計軸, 値, 増減], ...] を足し合わせてから反映する"""
+    deltas = Counter()
+    for payload in payloads:
+        for dimension, key, delta in payload:
+            deltas[dimension, key] += delta
+    InquiryCounter.objects.apply(deltas)
+    transaction.on_commit(invalidate_dashboard_stats)
+
+
+@handler(NOTIFY_JOB)
+def notify_assignee(payloads):
+    """担当者に割り当てを知らせる。続けて変更された場合は最後の担当者にだけ送る"""
+    inquiry = (
+        Inquiry.objects.select_related("assigned_to")
+        .filter(pk=payloads[-1]["inquiry"])
+        .first()
+    )
+    if inquiry is None or inquiry.assigned_to is None:
+        return
+    user = inquiry.assigned_to
+    if not user.email:
+        logger.info("%s にメールアドレスがないため通知しません", user)
+        return
+    url = settings.SITE_URL.rstrip("/") + reverse(
+        "inquiry:inquiry_detail", args=[inquiry.pk]
+    )
+    send_mail(
+        f"[問い合わせ] {inquiry.title} の担当になりました",
+        render_to_string(
+            "inquiry/email/assigned.txt",
+            {"inquiry": inquiry, "user": user, "url": url},
+        ),
+        None,
+        [user.email],
+    )
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+
+from inquiry.models import Inquiry
+
+
+class Command(BaseCommand):
+    help = "問い合わせの対応件数・最終対応日時・最終対応者を対応履歴から集計し直します"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=10000, help="一度に更新する問い合わせの ID 範囲"
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options["batch_size"]
+        max_pk = Inquiry.objects.aggregate(max_pk=Max("pk"))["max_pk"] or 0
+        updated = 0
+        for start in range(0, max_pk + 1, batch_size):
+            updated += Inquiry.objects.filter(
+                pk__gte=start, pk__lt=start + batch_size
+            ).update(**Inquiry.response_stats())
+            self.stdout.write(f"{min(start + batch_size, max_pk + 1) - 1}/{max_pk}")
+        self.stdout.write(self.style.SUCCESS(f"{updated}件の問い合わせを更新しました。"))
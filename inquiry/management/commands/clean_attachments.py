@@ -0,0 +1,70 @@
+import os
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from common.blobs import delete_orphans, hash_file
+from common.models import Blob
+from inquiry import uploads
+from inquiry.models import AttachmentUpload
+
+
+# 内容のハッシュで保存する前の添付ファイルの置き場所
+LEGACY_DIR = "inquiry_attachments"
+
+
+def delete_legacy_files():
+    """Blob にコピー済みの古い添付ファイルを削除する。削除件数を返す
+
+    同じ内容の Blob のファイルがあるものだけを消す。
+    """
+    root = default_storage.path(LEGACY_DIR)
+    deleted = 0
+    for directory, _, filenames in os.walk(root):
+        for filename in filenames:
+            path = os.path.join(directory, filename)
+            sha256, _ = hash_file(path)
+            blob = Blob.objects.filter(sha256=sha256).first()
+            if blob is not None and default_storage.exists(blob.file.name):
+                os.remove(path)
+                deleted += 1
+    return deleted
+
+
+class Command(BaseCommand):
+    help = "途中で止まった添付ファイルのアップロードと、参照されていないファイルを削除します"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--hours",
+            type=int,
+            default=settings.BLOB_UPLOAD_EXPIRE_HOURS,
+            help="この時間以上更新されていないものを削除する",
+        )
+        parser.add_argument(
+            "--legacy",
+            action="store_true",
+            help=f"{LEGACY_DIR}/ に残っている、Blob にコピー済みの古い添付ファイルも削除する",
+        )
+
+    def handle(self, *args, **options):
+        before = timezone.now() - timedelta(hours=options["hours"])
+
+        expired = 0
+        for upload in AttachmentUpload.objects.filter(updated_at__lt=before):
+            uploads.cancel(upload)
+            expired += 1
+        expired += uploads.delete_stale_chunks(before)
+        blobs = delete_orphans(before)
+        if options["legacy"]:
+            legacy = delete_legacy_files()
+            self.stdout.write(f"コピー済みの古い添付ファイル{legacy}件を削除しました。")
+
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"アップロード途中のファイル{expired}件、参照されていないファイル{blobs}件を削除しました。"
+            )
+        )
@@ -0,0 +1,50 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from inquiry import duplicates
+from inquiry.models import Inquiry
+
+
+class Command(BaseCommand):
+    help = "同じ顧客からの重複した問い合わせを探し、重複元を記録します"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--rebuild", action="store_true", help="先にすべての署名を作り直す"
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true", help="見つかった組を表示するだけで記録しない"
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=1000, help="一度に署名を作る件数"
+        )
+
+    def handle(self, *args, **options):
+        if options["rebuild"]:
+            count = duplicates.rebuild(batch_size=options["batch_size"])
+            self.stdout.write(f"{count}件の署名を作りました。")
+
+        originals = duplicates.sweep()
+        # すでに重複元が記録されているものは変えない
+        unmarked = set(
+            Inquiry.objects.filter(
+                pk__in=originals, duplicate_of__isnull=True
+            ).values_list("pk", flat=True)
+        )
+        by_original = defaultdict(list)
+        for pk, original in sorted(originals.items()):
+            if pk in unmarked:
+                by_original[original].append(pk)
+
+        if options["dry_run"]:
+            for original, ids in sorted(by_original.items()):
+                self.stdout.write(f"{original} ← {', '.join(map(str, ids))}")
+            self.stdout.write(f"{len(unmarked)}件の重複が見つかりました。")
+            return
+
+        with transaction.atomic():
+            for original, ids in by_original.items():
+                Inquiry.objects.filter(pk__in=ids).update(duplicate_of=original)
+        self.stdout.write(self.style.SUCCESS(f"{len(unmarked)}件の重複を記録しました。"))
@@ -0,0 +1,7 @@
+from common.importers import ImportCommand
+from inquiry.importers import InquiryImporter
+
+
+class Command(ImportCommand):
+    help = "CSV / JSONL ファイルから問い合わせを対応履歴・タグとともに一括で取り込みます"
+    importer_class = InquiryImporter
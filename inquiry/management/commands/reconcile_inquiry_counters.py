@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from inquiry.models import InquiryCounter
+
+
+class Command(BaseCommand):
+    help = "問い合わせ件数の集計を実データと突き合わせ、ずれを修正します"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run", action="store_true", help="修正せずにずれだけを表示する"
+        )
+
+    def handle(self, *args, **options):
+        if options["dry_run"]:
+            drift = InquiryCounter.objects.drift()
+        else:
+            drift = InquiryCounter.objects.reconcile()
+
+        for (dimension, key), delta in sorted(drift.items()):
+            self.stdout.write(f"{dimension}:{key or '(なし)'} {delta:+d}")
+        if not drift:
+            self.stdout.write(self.style.SUCCESS("ずれはありません。"))
+        elif not options["dry_run"]:
+            self.stdout.write(self.style.SUCCESS(f"{len(drift)}件の集計を修正しました。"))
@@ -0,0 +1,85 @@
+# Generated by Django 5.2.6 on 2026-10-18 20:33
+
+import common.search
+import django.db.models.deletion
+import unicodedata
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS inquiry_fts "
+        "USING fts5(title, content, customer, tags, responses, tokenize='trigram')"
+    )
+    Inquiry = apps.get_model("inquiry", "Inquiry")
+    Response = apps.get_model("inquiry", "Response")
+
+    tags = defaultdict(list)
+    for inquiry_id, name in Inquiry.tags.through.objects.values_list(
+        "inquiry_id", "tag__name"
+    ).iterator():
+        tags[inquiry_id].append(name)
+    responses = defaultdict(list)
+    for inquiry_id, content in (
+        Response.objects.order_by("inquiry_id", "created_at")
+        .values_list("inquiry_id", "content")
+        .iterator()
+    ):
+        responses[inquiry_id].append(content)
+
+    rows = []
+    for pk, title, content, name, email, phone in Inquiry.objects.values_list(
+        "pk", "title", "content", "customer_name", "customer_email", "customer_phone"
+    ).iterator():
+        values = [
+            title,
+            content,
+            " ".join(filter(None, [name, email, phone])),
+            " ".join(tags[pk]),
+            "\n".join(responses[pk]),
+        ]
+        rows.append([pk] + [unicodedata.normalize("NFKC", value) for value in values])
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            "INSERT INTO inquiry_fts (rowid, title, content, customer, tags, responses) "
+            "VALUES (%s, %s, %s, %s, %s, %s)",
+            rows,
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS inquiry_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inquiry', '0003_remove_category_parent_alter_inquiry_category_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InquirySearchIndex',
+            fields=[
+                ('inquiry', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='inquiry.inquiry')),
+                ('document', common.search.FullTextField(db_column='inquiry_fts')),
+                ('title', models.TextField()),
+                ('content', models.TextField()),
+                ('customer', models.TextField()),
+                ('tags', models.TextField()),
+                ('responses', models.TextField()),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'inquiry_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.6 on 2026-10-18 20:35
+
+from collections import Counter
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_counters(apps, schema_editor):
+    Inquiry = apps.get_model("inquiry", "Inquiry")
+    InquiryCounter = apps.get_model("inquiry", "InquiryCounter")
+    counts = Counter()
+    groups = Inquiry.objects.values(
+        "status", "priority", "assigned_to", "category"
+    ).annotate(n=Count("pk"))
+    for row in groups:
+        n = row["n"]
+        counts["total", ""] += n
+        counts["status", row["status"]] += n
+        counts["priority", row["priority"]] += n
+        counts["assignee", "" if row["assigned_to"] is None else str(row["assigned_to"])] += n
+        counts["category", "" if row["category"] is None else str(row["category"])] += n
+    InquiryCounter.objects.bulk_create(
+        InquiryCounter(dimension=dimension, key=key, count=count)
+        for (dimension, key), count in counts.items()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inquiry', '0004_inquirysearchindex'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InquiryCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('dimension', models.CharField(choices=[('total', '合計'), ('status', 'ステータス'), ('priority', '優先度'), ('assignee', '担当者'), ('category', 'カテゴリ')], max_length=20, verbose_name='集計軸')),
+                ('key', models.CharField(blank=True, max_length=50, verbose_name='値')),
+                ('count', models.IntegerField(default=0, verbose_name='件数')),
+            ],
+            options={
+                'verbose_name': '問い合わせ件数',
+                'verbose_name_plural': '問い合わせ件数',
+                'constraints': [models.UniqueConstraint(fields=('dimension', 'key'), name='inquiry_counter_dimension_key')],
+            },
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.2.6 on 2026-10-18 20:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_response_stats(apps, schema_editor):
+    Inquiry = apps.get_model("inquiry", "Inquiry")
+    Response = apps.get_model("inquiry", "Response")
+    responses = Response.objects.filter(inquiry=OuterRef("pk"))
+    latest = responses.order_by("-created_at", "-pk")
+    Inquiry.objects.update(
+        response_count=Coalesce(
+            Subquery(
+                responses.order_by().values("inquiry").annotate(n=Count("pk")).values("n")
+            ),
+            0,
+        ),
+        last_response_at=Subquery(latest.values("created_at")[:1]),
+        last_responder=Subquery(latest.values("responder")[:1]),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inquiry', '0005_inquirycounter'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inquiry',
+            name='last_responder',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='最終対応者'),
+        ),
+        migrations.AddField(
+            model_name='inquiry',
+            name='last_response_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='最終対応日時'),
+        ),
+        migrations.AddField(
+            model_name='inquiry',
+            name='response_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='対応件数'),
+        ),
+        migrations.RunPython(backfill_response_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.6 on 2026-10-18 20:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0002_category_tree_index'),
+        ('inquiry', '0006_inquiry_response_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='inquiry',
+            index=models.Index(fields=['created_at'], name='inquiry_created'),
+        ),
+        migrations.AddIndex(
+            model_name='inquiry',
+            index=models.Index(fields=['status', 'created_at'], name='inquiry_status_created'),
+        ),
+        migrations.AddIndex(
+            model_name='inquiry',
+            index=models.Index(fields=['priority', 'created_at'], name='inquiry_priority_created'),
+        ),
+        migrations.AddIndex(
+            model_name='inquiry',
+            index=models.Index(fields=['assigned_to', 'created_at'], name='inquiry_assignee_created'),
+        ),
+        migrations.AddIndex(
+            model_name='inquiry',
+            index=models.Index(fields=['category', 'created_at'], name='inquiry_category_created'),
+        ),
+    ]
@@ -0,0 +1,104 @@
+# Generated by Django 5.2.6 on 2026-10-18 21:06
+
+import django.db.models.deletion
+import hashlib
+import mimetypes
+import os
+import shutil
+import uuid
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import migrations, models
+
+
+def copy_files_to_blobs(apps, schema_editor):
+    """既存の添付ファイルを内容のハッシュで保存し直す
+
+    元のファイルはコピーするだけで残す（マイグレーションが途中で失敗して
+    ロールバックされても、元の行が指すファイルは消えない）。確定した後に
+    clean_attachments --legacy で削除する。
+    ファイルが見つからない添付ファイルがあれば、行を消さずに一覧を出して止める。
+    """
+    Attachment = apps.get_model("inquiry", "Attachment")
+    Blob = apps.get_model("common", "Blob")
+    missing = [
+        f"#{attachment.pk} {attachment.filename}（{attachment.file.name or '未設定'}）"
+        for attachment in Attachment.objects.order_by("pk").iterator()
+        if not attachment.file.name or not default_storage.exists(attachment.file.name)
+    ]
+    if missing:
+        raise RuntimeError(
+            "ファイルが見つからない添付ファイルがあります。ファイルを戻すか、"
+            "添付ファイルを削除してからやり直してください:\n" + "\n".join(missing)
+        )
+
+    for attachment in Attachment.objects.iterator():
+        path = default_storage.path(attachment.file.name)
+        hasher = hashlib.sha256()
+        with open(path, "rb") as f:
+            while chunk := f.read(1024 * 1024):
+                hasher.update(chunk)
+        sha256 = hasher.hexdigest()
+        blob = Blob.objects.filter(sha256=sha256).first()
+        if blob is None:
+            blob_name = f"blobs/{sha256[:2]}/{sha256[2:4]}/{sha256}"
+            target = default_storage.path(blob_name)
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            # 前回の失敗で残ったコピーは書き直す（内容は同じ）
+            shutil.copyfile(path, target)
+            blob = Blob.objects.create(
+                sha256=sha256, size=os.path.getsize(target), file=blob_name
+            )
+        attachment.blob = blob
+        attachment.content_type = mimetypes.guess_type(attachment.filename)[0] or ""
+        attachment.save(update_fields=["blob", "content_type"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0003_blob'),
+        ('inquiry', '0007_list_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attachment',
+            name='blob',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='attachments', to='common.blob', verbose_name='ファイル'),
+        ),
+        migrations.AddField(
+            model_name='attachment',
+            name='content_type',
+            field=models.CharField(blank=True, max_length=100, verbose_name='ファイル形式'),
+        ),
+        migrations.RunPython(copy_files_to_blobs, migrations.RunPython.noop, elidable=True),
+        migrations.RemoveField(
+            model_name='attachment',
+            name='file',
+        ),
+        migrations.AlterField(
+            model_name='attachment',
+            name='blob',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='attachments', to='common.blob', verbose_name='ファイル'),
+        ),
+        migrations.CreateModel(
+            name='AttachmentUpload',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('filename', models.CharField(max_length=255, verbose_name='ファイル名')),
+                ('content_type', models.CharField(blank=True, max_length=100, verbose_name='ファイル形式')),
+                ('size', models.PositiveBigIntegerField(verbose_name='サイズ')),
+                ('offset', models.PositiveBigIntegerField(default=0, verbose_name='受信済みサイズ')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='開始日時')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新日時')),
+                ('inquiry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='uploads', to='inquiry.inquiry', verbose_name='問い合わせ')),
+                ('uploaded_by', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='アップロードしたユーザー')),
+            ],
+            options={
+                'verbose_name': 'アップロード中の添付ファイル',
+                'verbose_name_plural': 'アップロード中の添付ファイル',
+            },
+        ),
+    ]
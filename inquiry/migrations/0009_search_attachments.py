@@ -0,0 +1,39 @@
+from django.db import migrations
+
+OLD_COLUMNS = "title, content, customer, tags, responses"
+NEW_COLUMNS = OLD_COLUMNS + ", attachments"
+
+
+def rebuild_table(schema_editor, columns, copy_columns, values):
+    """FTS5 はカラムを追加できないので、作り直して既存の行を写す"""
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute("ALTER TABLE inquiry_fts RENAME TO inquiry_fts_old")
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE inquiry_fts USING fts5({columns}, tokenize='trigram')"
+    )
+    schema_editor.execute(
+        f"INSERT INTO inquiry_fts (rowid, {copy_columns}) "
+        f"SELECT rowid, {values} FROM inquiry_fts_old"
+    )
+    schema_editor.execute("DROP TABLE inquiry_fts_old")
+
+
+def add_attachments_column(apps, schema_editor):
+    # 添付ファイルの列は空で作る（rebuild_inquiry_index で埋める）
+    rebuild_table(schema_editor, NEW_COLUMNS, NEW_COLUMNS, OLD_COLUMNS + ", ''")
+
+
+def remove_attachments_column(apps, schema_editor):
+    rebuild_table(schema_editor, OLD_COLUMNS, OLD_COLUMNS, OLD_COLUMNS)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inquiry', '0008_attachment_blob'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_attachments_column, remove_attachments_column),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.6 on 2026-10-18 21:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inquiry', '0009_search_attachments'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InquirySignature',
+            fields=[
+                ('inquiry', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='signature', serialize=False, to='inquiry.inquiry', verbose_name='問い合わせ')),
+                ('minhash', models.BinaryField(verbose_name='署名')),
+            ],
+            options={
+                'verbose_name': '問い合わせの署名',
+                'verbose_name_plural': '問い合わせの署名',
+            },
+        ),
+        migrations.AddField(
+            model_name='inquiry',
+            name='duplicate_of',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='duplicates', to='inquiry.inquiry', verbose_name='重複元'),
+        ),
+        migrations.CreateModel(
+            name='InquiryBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.BigIntegerField(db_index=True, verbose_name='バケット')),
+                ('inquiry', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='inquiry.inquiry', verbose_name='問い合わせ')),
+            ],
+            options={
+                'verbose_name': '問い合わせのバケット',
+                'verbose_name_plural': '問い合わせのバケット',
+            },
+        ),
+    ]
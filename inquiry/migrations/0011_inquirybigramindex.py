@@ -0,0 +1,52 @@
+# Generated by Django 5.2.6 on 2026-10-18 22:08
+
+import common.search
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def create_bigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS inquiry_bigram "
+        f"USING fts5(bigrams, tokenize='{common.search.BigramTable.TOKENIZE}')"
+    )
+    # 正規化済みの全文検索インデックスの内容から作る
+    index = common.search.BigramTable("inquiry_bigram")
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT rowid, title, content, customer, tags, responses, attachments "
+            "FROM inquiry_fts"
+        )
+        while rows := cursor.fetchmany(1000):
+            index.replace(rows)
+
+
+def drop_bigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS inquiry_bigram")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inquiry', '0010_duplicates'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InquiryBigramIndex',
+            fields=[
+                ('inquiry', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='bigram_index', serialize=False, to='inquiry.inquiry')),
+                ('document', common.search.FullTextField(db_column='inquiry_bigram')),
+                ('bigrams', models.TextField()),
+            ],
+            options={
+                'db_table': 'inquiry_bigram',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_bigram_index, drop_bigram_index),
+    ]
@@ -1,7 +1,17 @@
-from django.db import models
+import os
+import uuid
+from collections import Counter
+
+from django.db import models, transaction
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.urls import reverse
 from django.utils import timezone
-from common.models import Category, Tag
+from common import jobqueue
+from common.models import Blob, Category, Job, Tag
+from common.search import FullTextField
 
 User = get_user_model()
 
@@ -54,18 +64,355 @@ class Inquiry(models.Model):
 
     tags = models.ManyToManyField(Tag, blank=True, verbose_name="タグ")
 
+    # 同じ顧客からの似た問い合わせ（inquiry.duplicates が検出する）
+    duplicate_of = models.ForeignKey(
+        "self",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="duplicates",
+        verbose_name="重複元",
+    )
+
+    # 対応履歴の集計（Response の保存・削除時に更新）
+    response_count = models.PositiveIntegerField("対応件数", default=0, editable=False)
+    last_response_at = models.DateTimeField(
+        "最終対応日時", null=True, blank=True, editable=False
+    )
+    last_responder = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        editable=False,
+        related_name="+",
+        verbose_name="最終対応者",
+    )
+
     class Meta:
         verbose_name = "問い合わせ"
         verbose_name_plural = "問い合わせ"
         ordering = ["-created_at"]
+        # 一覧は -created_at, -id の順なので、絞り込みの列の後ろに created_at を置く
+        # （末尾の id は SQLite が暗黙に持つ rowid で賄われる）
+        indexes = [
+            models.Index(fields=["created_at"], name="inquiry_created"),
+            models.Index(fields=["status", "created_at"], name="inquiry_status_created"),
+            models.Index(
+                fields=["priority", "created_at"], name="inquiry_priority_created"
+            ),
+            models.Index(
+                fields=["assigned_to", "created_at"], name="inquiry_assignee_created"
+            ),
+            models.Index(
+                fields=["category", "created_at"], name="inquiry_category_created"
+            ),
+        ]
 
     def __str__(self):
         return f"{self.title} - {self.customer_name}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_values()
+        instance._counter_snapshot = instance.counter_values()
+        return instance
+
+    def refresh_from_db(self, using=None, fields=None, from_queryset=None):
+        super().refresh_from_db(using, fields, from_queryset)
+        self._remember_values(fields)
+
+    def _remember_values(self, fields=None):
+        """読み込み・保存した時点の値を控える（次の保存で変更したフィールドだけを書き込む）"""
+        if not hasattr(self, "_saved_values"):
+            self._saved_values = {}
+        for field in self._meta.concrete_fields:
+            if field.attname not in self.__dict__:
+                continue
+            if fields is None or field.name in fields or field.attname in fields:
+                self._saved_values[field.attname] = getattr(self, field.attname)
+
+    def changed_fields(self):
+        """読み込み後に変更したフィールド名（更新日時は常に含める）"""
+        saved = getattr(self, "_saved_values", {})
+        return [
+            field.name
+            for field in self._meta.concrete_fields
+            if not field.primary_key
+            and field.name not in RESPONSE_STAT_FIELDS
+            and field.attname in self.__dict__
+            and (
+                getattr(field, "auto_now", False)
+                or field.attname not in saved
+                or getattr(self, field.attname) != saved[field.attname]
+            )
+        ]
+
+    def counter_values(self):
+        """件数集計に使う値"""
+        return {
+            "status": self.status,
+            "priority": self.priority,
+            "assignee": self.assigned_to_id,
+            "category": self.category_id,
+        }
+
+    @staticmethod
+    def response_stats():
+        """対応履歴から対応件数・最終対応を求める UPDATE 用の式"""
+        responses = Response.objects.filter(inquiry=OuterRef("pk"))
+        latest = responses.order_by("-created_at", "-pk")
+        return {
+            "response_count": Coalesce(
+                Subquery(
+                    responses.order_by()
+                    .values("inquiry")
+                    .annotate(n=Count("pk"))
+                    .values("n")
+                ),
+                0,
+            ),
+            "last_response_at": Subquery(latest.values("created_at")[:1]),
+            "last_responder": Subquery(latest.values("responder")[:1]),
+        }
+
     def save(self, *args, **kwargs):
         if self.status == "resolved" and not self.resolved_at:
             self.resolved_at = timezone.now()
-        super().save(*args, **kwargs)
+
+        if not self._state.adding and kwargs.get("update_fields") is None:
+            # 変更したフィールドだけを書き込む。同時に保存された他のフィールドを
+            # 読み込み時の値で戻さないので、件数の集計軸を変えない保存はロックも読み直しも要らない
+            # （対応件数などはシグナルで更新するため、通常の保存では上書きしない）
+            kwargs["update_fields"] = self.changed_fields()
+
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None:
+            # フィールド名でも列名（assigned_to_id など）でも指定できる
+            update_fields = {
+                self._meta.get_field(name).name for name in update_fields
+            }
+            if not update_fields & set(COUNTER_FIELDS.values()):
+                self._counters_recorded = False
+                super().save(*args, **kwargs)
+                self._remember_values(update_fields)
+                return
+
+        with transaction.atomic():
+            if self._state.adding:
+                old = None
+            else:
+                # 集計軸を変える保存だけ、読み込み時の値ではなく書き込みロックを取った後の値と比べる
+                # （同時に保存された変更を二重に数えないように）
+                old = (
+                    Inquiry.objects.filter(pk=self.pk)
+                    .select_for_update()
+                    .first()
+                )
+                old = old.counter_values() if old else None
+            super().save(*args, **kwargs)
+            new = self.counter_values()
+            if old is not None and update_fields is not None:
+                # 保存しなかったフィールドは DB の値のままなので、集計もそれに合わせる
+                new = {
+                    dimension: new[dimension]
+                    if field in update_fields
+                    else old[dimension]
+                    for dimension, field in COUNTER_FIELDS.items()
+                }
+            # 件数が変わる場合、ダッシュボード統計は件数を反映したジョブが破棄する
+            # （post_save は super().save() の中で送られるが、破棄は確定後に判断する）
+            self._counters_recorded = InquiryCounter.objects.record(old, new)
+            if new["assignee"] is not None and (
+                old is None or old["assignee"] != new["assignee"]
+            ):
+                jobqueue.enqueue(NOTIFY_JOB, {"inquiry": self.pk}, key=str(self.pk))
+        self._remember_values(update_fields)
+        self._counter_snapshot = new
+
+
+# 集計軸 → フィールド名
+COUNTER_FIELDS = {
+    "status": "status",
+    "priority": "priority",
+    "assignee": "assigned_to",
+    "category": "category",
+}
+RESPONSE_STAT_FIELDS = {"response_count", "last_response_at", "last_responder"}
+
+# 保存後にワーカーで実行するジョブ（inquiry/jobs.py）
+COUNTER_JOB = "inquiry.apply_counters"
+NOTIFY_JOB = "inquiry.notify_assignee"
+
+
+class InquiryCounterManager(models.Manager):
+    def record(self, old, new):
+        """保存前後の値から件数の増減をジョブに登録する（ワーカーが反映する）"""
+        return self.record_many([(old, new)])
+
+    def record_many(self, changes):
+        """[(保存前の値, 保存後の値), ...] の増減を足し合わせ、1件のジョブに登録する"""
+        deltas = Counter()
+        for old, new in changes:
+            if old is not None:
+                deltas["total", ""] -= 1
+                for dimension, value in old.items():
+                    deltas[dimension, self.key(value)] -= 1
+            if new is not None:
+                deltas["total", ""] += 1
+                for dimension, value in new.items():
+                    deltas[dimension, self.key(value)] += 1
+        return self.schedule(deltas)
+
+    def schedule(self, deltas):
+        """{(集計軸, 値): 増減} をジョブに登録する。登録した（件数が変わる）かどうかを返す"""
+        deltas = [[dim, key, delta] for (dim, key), delta in deltas.items() if delta]
+        if deltas:
+            jobqueue.enqueue(COUNTER_JOB, deltas)
+        return bool(deltas)
+
+    def apply(self, deltas):
+        """(集計軸, 値) ごとの増減をまとめて反映する"""
+        deltas = {key: delta for key, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        self.bulk_create(
+            [self.model(dimension=dim, key=key) for dim, key in deltas],
+            ignore_conflicts=True,
+        )
+        by_delta = {}
+        for (dimension, key), delta in deltas.items():
+            by_delta.setdefault(delta, Q())
+            by_delta[delta] |= Q(dimension=dimension, key=key)
+        for delta, condition in by_delta.items():
+            self.filter(condition).update(count=F("count") + delta)
+
+    @staticmethod
+    def key(value):
+        return "" if value is None else str(value)
+
+    def counts(self, dimension):
+        """集計軸ごとの {値: 件数}"""
+        return dict(
+            self.filter(dimension=dimension).values_list("key", "count")
+        )
+
+    async def acounts(self, dimension):
+        return {
+            key: count
+            async for key, count in self.filter(dimension=dimension).values_list(
+                "key", "count"
+            )
+        }
+
+    def _headline_rows(self):
+        return self.filter(
+            Q(dimension="total")
+            | Q(dimension="status", key__in=["new", "in_progress"])
+            | Q(dimension="priority", key="urgent")
+        ).values_list("dimension", "key", "count")
+
+    def headline(self):
+        """一覧・ダッシュボードの見出しに使う件数"""
+        return self._headline(self._headline_rows())
+
+    async def aheadline(self):
+        return self._headline([row async for row in self._headline_rows()])
+
+    @staticmethod
+    def _headline(rows):
+        counts = {(dimension, key): count for dimension, key, count in rows}
+        return {
+            "total_inquiries": counts.get(("total", ""), 0),
+            "new_inquiries": counts.get(("status", "new"), 0),
+            "in_progress_inquiries": counts.get(("status", "in_progress"), 0),
+            "urgent_inquiries": counts.get(("priority", "urgent"), 0),
+        }
+
+    def actual(self):
+        """問い合わせテーブルから数え直した件数"""
+        counts = Counter()
+        groups = Inquiry.objects.values(
+            "status", "priority", "assigned_to", "category"
+        ).annotate(n=Count("pk"))
+        for row in groups:
+            n = row["n"]
+            counts["total", ""] += n
+            counts["status", row["status"]] += n
+            counts["priority", row["priority"]] += n
+            counts["assignee", self.key(row["assigned_to"])] += n
+            counts["category", self.key(row["category"])] += n
+        return counts
+
+    def pending(self):
+        """まだ反映していない増減 {(集計軸, 値): 増減}"""
+        deltas = Counter()
+        for payload in jobqueue.pending(COUNTER_JOB).values_list("payload", flat=True):
+            for dimension, key, delta in payload:
+                deltas[dimension, key] += delta
+        return deltas
+
+    def drift(self):
+        """実データとのずれ {(集計軸, 値): 不足分}（反映待ちの増減は反映済みとみなす）"""
+        actual = self.actual()
+        stored = Counter(
+            {
+                (dimension, key): count
+                for dimension, key, count in self.values_list(
+                    "dimension", "key", "count"
+                )
+            }
+        )
+        stored.update(self.pending())
+        return {
+            key: actual.get(key, 0) - stored.get(key, 0)
+            for key in set(actual) | set(stored)
+            if actual.get(key, 0) != stored.get(key, 0)
+        }
+
+    @transaction.atomic
+    def reconcile(self):
+        """実データと突き合わせてずれを修正する。修正した分を返す"""
+        # 失敗して残ったジョブの分もここで修正されるので、再実行されないよう消しておく
+        Job.objects.filter(name=COUNTER_JOB, failed_at__isnull=False).delete()
+        drift = self.drift()
+        self.apply(drift)
+        return drift
+
+
+class InquiryCounter(models.Model):
+    """問い合わせ件数の集計（ステータス・優先度・担当者・カテゴリ別）
+
+    Inquiry の保存・削除と同じトランザクションで増減をジョブに登録し、
+    ワーカーがまとめて反映する。一覧やダッシュボードの件数を COUNT(*) なしで表示する。
+    """
+
+    DIMENSION_CHOICES = [
+        ("total", "合計"),
+        ("status", "ステータス"),
+        ("priority", "優先度"),
+        ("assignee", "担当者"),
+        ("category", "カテゴリ"),
+    ]
+
+    dimension = models.CharField("集計軸", max_length=20, choices=DIMENSION_CHOICES)
+    key = models.CharField("値", max_length=50, blank=True)
+    count = models.IntegerField("件数", default=0)
+
+    objects = InquiryCounterManager()
+
+    class Meta:
+        verbose_name = "問い合わせ件数"
+        verbose_name_plural = "問い合わせ件数"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["dimension", "key"], name="inquiry_counter_dimension_key"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.dimension}:{self.key} = {self.count}"
 
 
 class Response(models.Model):
@@ -102,8 +449,15 @@ class Attachment(models.Model):
         related_name="attachments",
         verbose_name="問い合わせ",
     )
-    file = models.FileField("ファイル", upload_to="inquiry_attachments/")
+    # 内容は Blob に保存し、同じ内容のファイルは問い合わせをまたいで共有する
+    blob = models.ForeignKey(
+        Blob,
+        on_delete=models.PROTECT,
+        related_name="attachments",
+        verbose_name="ファイル",
+    )
     filename = models.CharField("ファイル名", max_length=255)
+    content_type = models.CharField("ファイル形式", max_length=100, blank=True)
     uploaded_at = models.DateTimeField("アップロード日時", auto_now_add=True)
 
     class Meta:
@@ -112,3 +466,126 @@ class Attachment(models.Model):
 
     def __str__(self):
         return self.filename
+
+    def get_absolute_url(self):
+        return reverse("inquiry:attachment_download", kwargs={"pk": self.pk})
+
+
+class AttachmentUpload(models.Model):
+    """分割アップロード中の添付ファイル
+
+    受信した部分は BLOB_UPLOAD_DIR/<id>.part に書き出し、offset バイトまで受信済み。
+    すべて受信したら Blob に取り込んで Attachment を作り、このレコードは削除する。
+    """
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    inquiry = models.ForeignKey(
+        Inquiry,
+        on_delete=models.CASCADE,
+        related_name="uploads",
+        verbose_name="問い合わせ",
+    )
+    filename = models.CharField("ファイル名", max_length=255)
+    content_type = models.CharField("ファイル形式", max_length=100, blank=True)
+    size = models.PositiveBigIntegerField("サイズ")
+    offset = models.PositiveBigIntegerField("受信済みサイズ", default=0)
+    uploaded_by = models.ForeignKey(
+        User, on_delete=models.CASCADE, verbose_name="アップロードしたユーザー"
+    )
+    created_at = models.DateTimeField("開始日時", auto_now_add=True)
+    updated_at = models.DateTimeField("更新日時", auto_now=True)
+
+    class Meta:
+        verbose_name = "アップロード中の添付ファイル"
+        verbose_name_plural = "アップロード中の添付ファイル"
+
+    def __str__(self):
+        return self.filename
+
+    @property
+    def part_path(self):
+        return os.path.join(settings.BLOB_UPLOAD_DIR, f"{self.pk}.part")
+
+
+class InquirySignature(models.Model):
+    """重複検出に使う問い合わせの MinHash 署名（uint64 の配列）"""
+
+    inquiry = models.OneToOneField(
+        Inquiry,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name="signature",
+        verbose_name="問い合わせ",
+    )
+    minhash = models.BinaryField("署名")
+
+    class Meta:
+        verbose_name = "問い合わせの署名"
+        verbose_name_plural = "問い合わせの署名"
+
+    def __str__(self):
+        return str(self.inquiry_id)
+
+
+class InquiryBucket(models.Model):
+    """署名の帯と顧客メールアドレスから作ったバケット。一致したものが重複の候補になる"""
+
+    inquiry = models.ForeignKey(
+        Inquiry,
+        on_delete=models.CASCADE,
+        related_name="+",
+        verbose_name="問い合わせ",
+    )
+    bucket = models.BigIntegerField("バケット", db_index=True)
+
+    class Meta:
+        verbose_name = "問い合わせのバケット"
+        verbose_name_plural = "問い合わせのバケット"
+
+    def __str__(self):
+        return f"{self.inquiry_id}:{self.bucket}"
+
+
+class InquirySearchIndex(models.Model):
+    """問い合わせ全文検索インデックス（SQLite FTS5 仮想テーブル）
+
+    問い合わせ1件につき1行で、顧客情報・タグ名・対応履歴・添付ファイルもまとめて登録する。
+    """
+
+    inquiry = models.OneToOneField(
+        Inquiry,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_column="rowid",
+        related_name="search_index",
+    )
+    document = FullTextField(db_column="inquiry_fts")
+    title = models.TextField()
+    content = models.TextField()
+    customer = models.TextField()
+    tags = models.TextField()
+    responses = models.TextField()
+    attachments = models.TextField()
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = "inquiry_fts"
+
+
+class InquiryBigramIndex(models.Model):
+    """2文字以下の語を引くための補助インデックス（common.search.BigramTable）"""
+
+    inquiry = models.OneToOneField(
+        Inquiry,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_column="rowid",
+        related_name="bigram_index",
+    )
+    document = FullTextField(db_column="inquiry_bigram")
+    bigrams = models.TextField()
+
+    class Meta:
+        managed = False
+        db_table = "inquiry_bigram"
@@ -0,0 +1,165 @@
+"""問い合わせ全文検索インデックスの更新と検索"""
+
+from collections import defaultdict
+
+from django.db.models import Q
+
+from common import jobqueue
+from common.search import (
+    BigramTable,
+    FTS5Table,
+    Highlight,
+    Snippet,
+    build_bigram_query,
+    build_match_query,
+    fts5_available,
+    normalize_query,
+)
+from .models import (
+    Attachment,
+    Inquiry,
+    InquiryBigramIndex,
+    InquirySearchIndex,
+    Response,
+)
+
+index = FTS5Table(
+    InquirySearchIndex._meta.db_table,
+    ["title", "content", "customer", "tags", "responses", "attachments"],
+)
+bigram_index = BigramTable(InquiryBigramIndex._meta.db_table)
+
+
+def _rows(ids):
+    """問い合わせ・タグ・対応履歴・添付ファイルをそれぞれ1クエリで集めて行を組み立てる"""
+    tags = defaultdict(list)
+    for inquiry_id, name in Inquiry.tags.through.objects.filter(
+        inquiry_id__in=ids
+    ).values_list("inquiry_id", "tag__name"):
+        tags[inquiry_id].append(name)
+
+    responses = defaultdict(list)
+    for inquiry_id, content in (
+        Response.objects.filter(inquiry_id__in=ids)
+        .order_by("inquiry_id", "created_at")
+        .values_list("inquiry_id", "content")
+    ):
+        responses[inquiry_id].append(content)
+
+    # 添付ファイルはファイル名と、プレビュー作成時に取り出したテキスト
+    attachments = defaultdict(list)
+    for inquiry_id, filename, text in (
+        Attachment.objects.filter(inquiry_id__in=ids)
+        .order_by("inquiry_id", "pk")
+        .values_list("inquiry_id", "filename", "blob__text")
+    ):
+        attachments[inquiry_id].extend(filter(None, [filename, text]))
+
+    inquiries = Inquiry.objects.filter(pk__in=ids).values_list(
+        "pk", "title", "content", "customer_name", "customer_email", "customer_phone"
+    )
+    return [
+        [
+            pk,
+            title,
+            content,
+            " ".join(filter(None, [name, email, phone])),
+            " ".join(tags[pk]),
+            "\n".join(responses[pk]),
+            "\n".join(attachments[pk]),
+        ]
+        for pk, title, content, name, email, phone in inquiries
+    ]
+
+
+def update_index(ids):
+    """指定した問い合わせのインデックスを作り直す（削除済みのものは取り除く）"""
+    ids = set(ids)
+    if not ids or not fts5_available():
+        return
+    rows = _rows(ids)
+    removed = ids - {row[0] for row in rows}
+    for table in (index, bigram_index):
+        table.replace(rows)
+        table.delete(removed)
+
+
+UPDATE_JOB = "inquiry.update_search_index"
+
+
+def schedule_update(ids):
+    """インデックスの更新をジョブに回す
+
+    溜まったジョブはワーカーが ID をまとめて1回で処理するので、
+    一括削除などで同じ問い合わせが何度も通知されても、確定時点の内容で1回ずつ作り直すだけで済む。
+    """
+    ids = sorted(set(ids))
+    if ids:
+        jobqueue.enqueue(UPDATE_JOB, ids)
+
+
+def rebuild_index(batch_size=1000):
+    """インデックスを全件作り直す。登録件数を返す"""
+    if not fts5_available():
+        return 0
+    index.clear()
+    bigram_index.clear()
+    count = 0
+    ids = Inquiry.objects.order_by("pk").values_list("pk", flat=True)
+    batch = []
+    for pk in ids.iterator(chunk_size=batch_size):
+        batch.append(pk)
+        if len(batch) >= batch_size:
+            count += _replace(_rows(batch))
+            batch = []
+    count += _replace(_rows(batch))
+    index.optimize()
+    bigram_index.optimize()
+    return count
+
+
+def _replace(rows):
+    bigram_index.replace(rows)
+    return index.replace(rows)
+
+
+def search(queryset, q):
+    """キーワードで絞り込み、関連度（BM25）順に並べる"""
+    terms = normalize_query(q)
+    if not terms:
+        return queryset
+
+    if not fts5_available():
+        for term in terms:
+            queryset = queryset.filter(
+                Q(title__icontains=term)
+                | Q(content__icontains=term)
+                | Q(customer_name__icontains=term)
+                | Q(customer_email__icontains=term)
+                | Q(customer_phone__icontains=term)
+                | Q(tags__name__icontains=term)
+                | Q(responses__content__icontains=term)
+                | Q(attachments__filename__icontains=term)
+                | Q(attachments__blob__text__icontains=term)
+            ).distinct()
+        return queryset
+
+    match, short_terms = build_match_query(terms)
+    bigram_match, short_terms = build_bigram_query(short_terms)
+    if bigram_match:
+        queryset = queryset.filter(bigram_index__document__match=bigram_match)
+    for term in short_terms:
+        condition = Q()
+        for column in index.columns:
+            condition |= Q(**{f"search_index__{column}__contains": term})
+        queryset = queryset.filter(condition)
+    if match:
+        queryset = (
+            queryset.filter(search_index__document__match=match)
+            .annotate(
+                search_title=Highlight("search_index__document", 0),
+                search_snippet=Snippet("search_index__document", -1),
+            )
+            .order_by("search_index__rank", "-created_at")
+        )
+    return queryset
@@ -0,0 +1,145 @@
+from collections import Counter
+
+from django.contrib.auth import get_user_model
+from django.db.models import F
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from common import previews
+from common.models import Blob, Category, Tag
+from .models import Attachment, Inquiry, InquiryCounter, Response
+from . import duplicates, search
+
+SEARCH_FIELDS = {
+    "title",
+    "content",
+    "customer_name",
+    "customer_email",
+    "customer_phone",
+}
+
+
+@receiver(post_save, sender=Inquiry)
+def update_search_index(sender, instance, update_fields=None, **kwargs):
+    """検索対象のカラムが保存されたときだけインデックスを更新する"""
+    if update_fields is not None and not SEARCH_FIELDS & set(update_fields):
+        return
+    search.schedule_update([instance.pk])
+
+
+@receiver(post_save, sender=Inquiry)
+def update_signature(sender, instance, update_fields=None, **kwargs):
+    """重複検出に使う署名を作り直す（削除時は CASCADE で消える）"""
+    fields = {"title", "content", "customer_email"}
+    if update_fields is not None and not fields & set(update_fields):
+        return
+    # 作成画面では保存と同時に署名を登録している
+    if getattr(instance, "_signature_updated", False):
+        return
+    duplicates.schedule_update([instance.pk])
+
+
+@receiver(post_delete, sender=Inquiry)
+def remove_search_index(sender, instance, **kwargs):
+    search.schedule_update([instance.pk])
+
+
+@receiver(post_save, sender=Response)
+@receiver(post_delete, sender=Response)
+def update_search_index_for_response(sender, instance, **kwargs):
+    search.schedule_update([instance.inquiry_id])
+
+
+@receiver(post_save, sender=Attachment)
+def process_attachment(sender, instance, created, **kwargs):
+    """プレビューの作成をジョブに回す（処理後に検索インデックスも更新する）"""
+    if created:
+        previews.schedule(instance.blob, instance.content_type)
+    search.schedule_update([instance.inquiry_id])
+
+
+@receiver(post_delete, sender=Attachment)
+def update_search_index_for_attachment(sender, instance, **kwargs):
+    search.schedule_update([instance.inquiry_id])
+
+
+@receiver(previews.blob_processed, sender=Blob)
+def update_search_index_for_blob(sender, blob_id, **kwargs):
+    """ファイルから取り出したテキストを、添付している問い合わせに反映する"""
+    search.schedule_update(
+        Attachment.objects.filter(blob_id=blob_id).values_list("inquiry_id", flat=True)
+    )
+
+
+@receiver(m2m_changed, sender=Inquiry.tags.through)
+def update_search_index_for_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "pre_clear" and reverse:
+        # タグ側から clear() される場合は、外れる前に対象の問い合わせを控えておく
+        search.schedule_update(
+            Inquiry.objects.filter(tags=instance).values_list("pk", flat=True)
+        )
+    elif action in ("post_add", "post_remove", "post_clear"):
+        search.schedule_update((pk_set or []) if reverse else [instance.pk])
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def update_search_index_for_tag(sender, instance, created=False, **kwargs):
+    """タグ名の変更・削除を、そのタグが付いた問い合わせに反映する"""
+    if created:
+        return
+    search.schedule_update(
+        Inquiry.objects.filter(tags=instance).values_list("pk", flat=True)
+    )
+
+
+@receiver(post_delete, sender=Inquiry)
+def decrement_counters(sender, instance, **kwargs):
+    """QuerySet.delete() でも呼ばれるよう、削除分の件数はシグナルで減らす"""
+    old = getattr(instance, "_counter_snapshot", None) or instance.counter_values()
+    InquiryCounter.objects.record(old, None)
+
+
+def _move_to_unassigned(dimension, key, count):
+    """保存・削除と同じく、件数の移動はジョブで反映する（ダッシュボード統計もジョブが破棄する）"""
+    if count:
+        InquiryCounter.objects.schedule(
+            Counter({(dimension, str(key)): -count, (dimension, ""): count})
+        )
+
+
+@receiver(pre_delete, sender=Category)
+def release_category_counter(sender, instance, **kwargs):
+    """削除されたカテゴリの問い合わせは未分類（SET_NULL）になる"""
+    count = Inquiry.objects.filter(category=instance).count()
+    _move_to_unassigned("category", instance.pk, count)
+
+
+@receiver(pre_delete, sender=get_user_model())
+def release_assignee_counter(sender, instance, **kwargs):
+    """削除されたユーザーの担当分は未割り当て（SET_NULL）になる"""
+    count = Inquiry.objects.filter(assigned_to=instance).count()
+    _move_to_unassigned("assignee", instance.pk, count)
+
+
+@receiver(post_save, sender=Response)
+def update_response_stats(sender, instance, created, **kwargs):
+    """対応履歴の追加・変更を問い合わせの対応件数・最終対応に反映する"""
+    inquiries = Inquiry.objects.filter(pk=instance.inquiry_id)
+    if created:
+        # 追加された対応が最新なので、件数の加算だけで済む
+        inquiries.update(
+            response_count=F("response_count") + 1,
+            last_response_at=instance.created_at,
+            last_responder=instance.responder_id,
+        )
+    else:
+        inquiries.update(**Inquiry.response_stats())
+
+
+@receiver(post_delete, sender=Response)
+def refresh_response_stats(sender, instance, origin=None, **kwargs):
+    # 問い合わせごと削除される場合は集計し直す必要がない
+    if isinstance(origin, Inquiry) or getattr(origin, "model", None) is Inquiry:
+        return
+    Inquiry.objects.filter(pk=instance.inquiry_id).update(**Inquiry.response_stats())
@@ -1,3 +1,1017 @@
-from django.test import TestCase
+import asyncio
+import io
+import json
+import shutil
+import tempfile
+from datetime import timedelta
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import Client, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from common import jobqueue
+from common.models import Blob, Category, Job, Tag
+from common.pagination import KeysetPaginator
+from common.search import MARK_END, MARK_START
+from common.stats import DASHBOARD_STATS_KEY
+from common.testing import QueryPlanTestMixin
+from knowledge import similarity
+from .forms import InquirySearchForm
+from .models import (
+    NOTIFY_JOB,
+    AttachmentUpload,
+    Inquiry,
+    InquiryCounter,
+    InquirySignature,
+    Response,
+)
+from . import bulk, duplicates, exports, facets, search, uploads
+
+User = get_user_model()
+
+
+@skipUnless(connection.vendor == "sqlite", "SQLite の実行計画を確かめるテスト")
+class InquiryListQueryPlanTests(QueryPlanTestMixin, TestCase):
+    """問い合わせ一覧の絞り込みごとに、インデックスで引けていることを確かめる"""
+
+    ordering = ("-created_at", "-pk")
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("staff", is_staff=True)
+        cls.root = Category.objects.create(name="製品")
+        cls.child = Category.objects.create(name="会員サイト", parent=cls.root)
+        for i in range(3):
+            Inquiry.objects.create(
+                title=f"問い合わせ{i}",
+                content="ログインできません",
+                customer_name="佐藤 太郎",
+                customer_email="sato@example.com",
+                status="in_progress",
+                priority="high",
+                category=cls.child,
+                assigned_to=cls.user,
+            )
+
+    def paginator(self, data):
+        form = InquirySearchForm(data)
+        self.assertTrue(form.is_valid(), form.errors)
+        queryset = form.filter_queryset(
+            Inquiry.objects.select_related("category", "assigned_to")
+        )
+        return KeysetPaginator(queryset, 1, self.ordering)
+
+    def assertListUsesIndex(self, data, indexes, sorted_by_index=True):
+        paginator = self.paginator(data)
+        first = paginator.page()
+        self.assertTrue(first.has_next())
+        for func in (
+            paginator.page,
+            lambda: paginator.page(first.next_cursor),
+            lambda: paginator.page(paginator.page(first.next_cursor).previous_cursor),
+        ):
+            self.assertIndexedPlans(
+                self.capture_plans(func),
+                "inquiry_inquiry",
+                indexes,
+                search=bool(data),
+                sorted_by_index=sorted_by_index,
+            )
+        self.assertIndexedPlans(
+            self.capture_plans(lambda: paginator.count),
+            "inquiry_inquiry",
+            None,
+            search=bool(data),
+        )
+
+    def test_unfiltered(self):
+        self.assertListUsesIndex({}, ["inquiry_created"])
+
+    def test_status(self):
+        self.assertListUsesIndex({"status": "in_progress"}, ["inquiry_status_created"])
+
+    def test_priority(self):
+        self.assertListUsesIndex({"priority": "high"}, ["inquiry_priority_created"])
+
+    def test_assigned_to(self):
+        self.assertListUsesIndex(
+            {"assigned_to": self.user.pk}, ["inquiry_assignee_created"]
+        )
+
+    def test_category(self):
+        self.assertListUsesIndex(
+            {"category": self.child.pk}, ["inquiry_category_created"]
+        )
+
+    def test_category_with_subcategories(self):
+        # 複数カテゴリにまたがるので並べ替えは必要になるが、全件走査はしない
+        self.assertListUsesIndex(
+            {"category": self.root.pk, "include_subcategories": "on"},
+            ["inquiry_category_created"],
+            sorted_by_index=False,
+        )
+
+    def test_status_and_priority(self):
+        self.assertListUsesIndex(
+            {"status": "in_progress", "priority": "high"},
+            ["inquiry_status_created", "inquiry_priority_created"],
+        )
+
+    def test_status_and_assigned_to(self):
+        self.assertListUsesIndex(
+            {"status": "in_progress", "assigned_to": self.user.pk},
+            ["inquiry_status_created", "inquiry_assignee_created"],
+        )
+
+    def test_date_from(self):
+        self.assertListUsesIndex(
+            {"date_from": timezone.localdate().isoformat()}, ["inquiry_created"]
+        )
+
+    def test_date_range(self):
+        today = timezone.localdate().isoformat()
+        self.assertListUsesIndex(
+            {"date_from": today, "date_to": today}, ["inquiry_created"]
+        )
+
+    def test_status_and_date_range(self):
+        today = timezone.localdate().isoformat()
+        self.assertListUsesIndex(
+            {"status": "in_progress", "date_from": today, "date_to": today},
+            ["inquiry_status_created"],
+        )
+
+
+@skipUnless(connection.vendor == "sqlite", "FTS5 の全文検索を確かめるテスト")
+class InquirySearchTests(TestCase):
+    """全文検索の並び順・一致箇所と、ジョブでのインデックスの更新を確かめる"""
+
+    worker = "test:1"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user("staff", is_staff=True)
+
+    def run_jobs(self):
+        while jobs := jobqueue.claim(self.worker):
+            jobqueue.run(jobs, self.worker)
+
+    def create(self, title, content, customer_name="佐藤 太郎"):
+        inquiry = Inquiry.objects.create(
+            title=title,
+            content=content,
+            customer_name=customer_name,
+            customer_email="sato@example.com",
+        )
+        self.run_jobs()
+        return inquiry
+
+    def search(self, q):
+        with CaptureQueriesContext(connection) as queries:
+            results = list(search.search(Inquiry.objects.all(), q))
+        return results, queries[-1]["sql"]
+
+    def test_ranks_and_highlights_matches(self):
+        once = self.create("請求書の再発行", "パスワードの再設定ができません")
+        twice = self.create("パスワードの再設定", "パスワードを再設定するメールが届きません")
+
+        results, sql = self.search("パスワード 再設定")
+        self.assertEqual(results, [twice, once])
+        self.assertNotIn("LIKE", sql)
+        self.assertEqual(
+            results[0].search_title,
+            f"{MARK_START}パスワード{MARK_END}の{MARK_START}再設定{MARK_END}",
+        )
+
+    def test_short_terms_use_the_bigram_index(self):
+        inquiry = self.create("ログインできない", "会員サイトに入れません", "山田 花子")
+        self.create("請求書の再発行", "郵送で届きます")
+
+        for q in ["ログ", "山田", "花", "ログ 山田"]:
+            with self.subTest(q=q):
+                results, sql = self.search(q)
+                self.assertEqual(results, [inquiry])
+                self.assertNotIn("LIKE", sql)
+
+        # 記号を含む短い語だけは部分一致で探す
+        results, sql = self.search("C#")
+        self.assertEqual(results, [])
+        self.assertIn("LIKE", sql)
+
+    def test_jobs_keep_the_index_in_sync(self):
+        inquiry = self.create("ログインできない", "会員サイトに入れません")
+
+        inquiry.title = "請求書の再発行"
+        inquiry.save()
+        # 確定しただけではインデックスは変わらず、ワーカーのジョブで更新する
+        self.assertEqual(self.search("ログイン")[0], [inquiry])
+        self.run_jobs()
+        self.assertEqual(self.search("ログイン")[0], [])
+        self.assertEqual(self.search("請求")[0], [inquiry])
+
+        Response.objects.create(
+            inquiry=inquiry, content="再送しました", responder=self.staff
+        )
+        self.run_jobs()
+        self.assertEqual(self.search("再送しました")[0], [inquiry])
+        self.assertEqual(self.search("再送")[0], [inquiry])
+
+        inquiry.delete()
+        self.run_jobs()
+        self.assertEqual(self.search("請求書")[0], [])
+        self.assertEqual(self.search("請求")[0], [])
+        with connection.cursor() as cursor:
+            for table in (search.index, search.bigram_index):
+                cursor.execute(f"SELECT COUNT(*) FROM {table.table}")
+                self.assertEqual(cursor.fetchone(), (0,))
+
+
+class InquiryFacetTests(TestCase):
+    """絞り込み件数が、条件で絞り込んだ問い合わせの件数と一致することを確かめる"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user("staff", is_staff=True)
+        cls.root = Category.objects.create(name="製品")
+        cls.child = Category.objects.create(name="会員サイト", parent=cls.root)
+        statuses = ["new", "in_progress", "resolved"]
+        priorities = ["low", "high", "urgent", "medium"]
+        for i in range(12):
+            Inquiry.objects.create(
+                title=f"問い合わせ{i}",
+                content="ログインできません",
+                customer_name="佐藤 太郎",
+                customer_email="sato@example.com",
+                status=statuses[i % 3],
+                priority=priorities[i % 4],
+                category=[None, cls.root, cls.child][i % 3 - 1],
+                assigned_to=cls.staff if i % 2 else None,
+            )
+
+    def setUp(self):
+        # カテゴリの選択肢はキャッシュしたツリーから作る
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def assertFacetsMatch(self, data):
+        form = InquirySearchForm(data)
+        self.assertTrue(form.is_valid(), form.errors)
+        result = facets.compute_facets(form)
+        self.assertEqual(
+            result["total"], form.filter_queryset(Inquiry.objects.all()).count()
+        )
+        for name, column in facets.FACET_COLUMNS.items():
+            queryset = form.filter_queryset(Inquiry.objects.all(), exclude=[name])
+            for facet in result["facets"][name]:
+                with self.subTest(data=data, facet=name, value=facet["value"]):
+                    value = facet["value"] or None
+                    expected = queryset.filter(**{column: value}).count()
+                    self.assertEqual(facet["count"], expected)
+            self.assertEqual(
+                sum(facet["count"] for facet in result["facets"][name]),
+                queryset.count(),
+            )
+
+    def test_counts_match_filtered_querysets(self):
+        self.assertFacetsMatch({})
+        self.assertFacetsMatch({"status": "new"})
+        self.assertFacetsMatch({"status": "resolved", "priority": "urgent"})
+        self.assertFacetsMatch({"assigned_to": self.staff.pk, "priority": "high"})
+        self.assertFacetsMatch({"category": self.root.pk, "include_subcategories": "on"})
+        self.assertFacetsMatch({"category": self.child.pk, "status": "in_progress"})
+
+    def test_one_group_by_per_facet(self):
+        form = InquirySearchForm({"status": "new", "priority": "low"})
+        self.assertTrue(form.is_valid(), form.errors)
+        with CaptureQueriesContext(connection) as queries:
+            facets.compute_facets(form)
+        group_by = [query for query in queries if "GROUP BY" in query["sql"]]
+        self.assertEqual(len(group_by), len(facets.FACET_COLUMNS))
+
+
+class InquiryImportTests(TestCase):
+    """JSONL の取り込みで、行の内容・除外した行・件数の集計・検索インデックスが揃うことを確かめる"""
+
+    rows = [
+        {
+            "title": "ログインできない",
+            "content": "パスワードを入れても戻されます",
+            "customer_name": "佐藤 太郎",
+            "customer_email": "sato@example.com",
+            "status": "resolved",
+            "priority": "high",
+            "category": "製品/会員サイト",
+            "assigned_to": "staff",
+            "tags": ["ログイン", "会員"],
+            "created_at": "2026-01-05T09:00:00+09:00",
+            "responses": [
+                {
+                    "content": "再設定をご案内しました",
+                    "created_at": "2026-01-05T10:00:00+09:00",
+                },
+                {
+                    "content": "解決を確認しました",
+                    "responder": "staff",
+                    "created_at": "2026-01-06T10:00:00+09:00",
+                },
+            ],
+        },
+        {
+            "title": "請求書の再発行",
+            "content": "郵送でお願いします",
+            "customer_name": "山田 花子",
+            "customer_email": "yamada@example.com",
+            "category": "請求",
+            "tags": "請求,郵送",
+        },
+        # 除外される行: メールアドレスの形式・存在しない担当者
+        {
+            "title": "不正",
+            "content": "内容",
+            "customer_name": "鈴木",
+            "customer_email": "suzuki",
+        },
+        {
+            "title": "担当者なし",
+            "content": "内容",
+            "customer_name": "鈴木",
+            "customer_email": "suzuki@example.com",
+            "assigned_to": "nobody",
+        },
+        {
+            "title": "会員情報の変更",
+            "content": "住所を変えたい",
+            "customer_name": "田中 一郎",
+            "customer_email": "tanaka@example.com",
+            "category": "製品/会員サイト",
+            "tags": ["会員"],
+        },
+    ]
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user("staff", is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = f"{directory}/inquiries.jsonl"
+        self.rejects = f"{directory}/rejects.jsonl"
+        with open(self.path, "w", encoding="utf-8") as f:
+            for row in self.rows:
+                f.write(json.dumps(row, ensure_ascii=False) + "\n")
+            f.write("{壊れた行\n")
+
+    def import_file(self):
+        # カテゴリのツリーのキャッシュは確定後に破棄される
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command(
+                "import_inquiries",
+                self.path,
+                batch_size=2,
+                default_user="staff",
+                rejects=self.rejects,
+                stdout=io.StringIO(),
+                stderr=io.StringIO(),
+            )
+
+    def test_imports_rows_and_reports_rejects(self):
+        self.import_file()
+
+        inquiry = Inquiry.objects.get(title="ログインできない")
+        self.assertEqual(
+            (inquiry.status, inquiry.priority, inquiry.assigned_to, str(inquiry.category)),
+            ("resolved", "high", self.staff, "会員サイト"),
+        )
+        self.assertEqual(inquiry.category.parent.name, "製品")
+        self.assertEqual(inquiry.created_at.isoformat(), "2026-01-05T00:00:00+00:00")
+        self.assertEqual(inquiry.response_count, 2)
+        self.assertEqual(inquiry.resolved_at, inquiry.last_response_at)
+        self.assertEqual(inquiry.last_responder, self.staff)
+        self.assertEqual(
+            sorted(inquiry.tags.values_list("name", flat=True)), ["ログイン", "会員"]
+        )
+        billing = Inquiry.objects.get(title="請求書の再発行")
+        self.assertEqual(
+            sorted(billing.tags.values_list("name", flat=True)), ["請求", "郵送"]
+        )
+
+        with open(self.rejects, encoding="utf-8") as f:
+            rejects = [json.loads(line) for line in f]
+        self.assertEqual([reject["line"] for reject in rejects], [3, 4, 6])
+        self.assertIn("customer_email", rejects[0]["error"])
+        self.assertIn("nobody", rejects[1]["error"])
+
+        self.assertEqual(Inquiry.objects.count(), 3)
+        self.assertEqual(InquiryCounter.objects.drift(), {})
+        if connection.vendor == "sqlite":
+            self.assertEqual(
+                list(search.search(Inquiry.objects.all(), "再設定")), [inquiry]
+            )
+
+    def test_rerun_reuses_tags_and_categories(self):
+        self.import_file()
+        tags, categories = Tag.objects.count(), Category.objects.count()
+        self.import_file()
+        # 行に一意のキーはないので問い合わせは増えるが、タグとカテゴリは作り直さない
+        self.assertEqual(Inquiry.objects.count(), 6)
+        self.assertEqual(
+            (Tag.objects.count(), Category.objects.count()), (tags, categories)
+        )
+        self.assertEqual(InquiryCounter.objects.drift(), {})
+
+
+class DuplicateInquiryTests(TestCase):
+    """同じ顧客の似た問い合わせだけを重複として検出することを確かめる"""
+
+    content = "会員サイトにログインしようとするとエラーが表示されます。パスワードは合っています。"
+
+    def create(self, email, content=None):
+        inquiry = Inquiry.objects.create(
+            title="ログインできません",
+            content=content or self.content,
+            customer_name="佐藤 太郎",
+            customer_email=email,
+        )
+        duplicates.update_signatures([inquiry.pk])
+        return inquiry
+
+    def test_finds_similar_inquiry_from_same_customer(self):
+        original = self.create("sato@example.com")
+        self.create("suzuki@example.com")
+        inquiry = Inquiry(
+            title="ログインできません",
+            content=self.content + "よろしくお願いします。",
+            customer_email="Sato@Example.com",
+        )
+        self.assertEqual(duplicates.find_duplicate(inquiry), original)
+
+    def test_ignores_different_content(self):
+        self.create("sato@example.com")
+        inquiry = Inquiry(
+            title="請求書の再発行",
+            content="先月分の請求書を再発行してください。",
+            customer_email="sato@example.com",
+        )
+        self.assertIsNone(duplicates.find_duplicate(inquiry))
+
+    def test_sweep_links_to_oldest(self):
+        first = self.create("sato@example.com")
+        second = self.create("sato@example.com")
+        third = self.create("sato@example.com")
+        self.create("suzuki@example.com")
+        self.assertEqual(duplicates.sweep(), {second.pk: first.pk, third.pk: first.pk})
+
+    def test_create_view_stores_signature_without_job(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client.force_login(User.objects.create_user("staff", is_staff=True))
+        original = self.create("sato@example.com")
+        jobs = Job.objects.filter(name=duplicates.UPDATE_JOB)
+        before = jobs.count()
+        response = self.client.post(
+            reverse("inquiry:inquiry_create"),
+            {
+                "title": "ログインできません",
+                "content": self.content,
+                "customer_name": "佐藤 太郎",
+                "customer_email": "sato@example.com",
+                "priority": "medium",
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        inquiry = Inquiry.objects.latest("pk")
+        self.assertEqual(inquiry.duplicate_of, original)
+        self.assertTrue(InquirySignature.objects.filter(inquiry=inquiry).exists())
+        self.assertEqual(jobs.count(), before)
+
+
+class AttachmentUploadTests(TestCase):
+    """分割アップロードと添付ファイルの配信"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("staff", is_staff=True)
+        cls.inquiry = Inquiry.objects.create(
+            title="添付", content="内容", customer_name="佐藤", customer_email="sato@example.com"
+        )
+
+    def setUp(self):
+        media = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media)
+        self.enterContext(
+            override_settings(
+                MEDIA_ROOT=media,
+                BLOB_UPLOAD_DIR=f"{media}/uploads",
+                BLOB_UPLOAD_CHUNK_SIZE=4,
+            )
+        )
+
+    def start(self, size):
+        return uploads.start(self.inquiry, self.user, "memo.txt", size, "text/plain")
+
+    def receive(self, upload, first, data, total=None):
+        content_range = f"bytes {first}-{first + len(data) - 1}/{total or upload.size}"
+        return uploads.receive(upload, io.BytesIO(data), content_range, len(data))
+
+    def test_losing_request_does_not_overwrite_received_bytes(self):
+        upload = self.start(8)
+        stale = AttachmentUpload.objects.get(pk=upload.pk)
+        self.receive(upload, 0, b"abcd")
+        # 同じ範囲を同時に受け取り、offset を進められなかった側
+        with self.assertRaises(uploads.UploadError) as raised:
+            self.receive(stale, 0, b"XXXX")
+        self.assertEqual(raised.exception.status, 409)
+        attachment = self.receive(upload, 4, b"efgh")
+        with attachment.blob.file.open("rb") as f:
+            self.assertEqual(f.read(), b"abcdefgh")
+        self.assertEqual(
+            attachment.blob.sha256,
+            "9c56cc51b374c3ba189210d5b6d4bf57790d351c96c47c02190ecf1e430635ab",
+        )
+
+    def upload_via_views(self, content, chunks):
+        """content を chunks（[(開始, 終了の次), ...]）の順に PUT し、最後のレスポンスを返す"""
+        self.client.force_login(self.user)
+        response = self.client.post(
+            reverse("inquiry:attachment_upload_start", args=[self.inquiry.pk]),
+            {"filename": "memo.txt", "size": len(content), "content_type": "text/plain"},
+        )
+        url = reverse("inquiry:attachment_upload", args=[response.json()["upload_id"]])
+        for first, end in chunks:
+            response = self.client.put(
+                url,
+                content[first:end],
+                content_type="application/octet-stream",
+                headers={"content-range": f"bytes {first}-{end - 1}/{len(content)}"},
+            )
+        return url, response
+
+    def test_resumes_from_received_offset(self):
+        url, response = self.upload_via_views(b"abcdefghij", [(0, 4)])
+        self.assertEqual(response.json()["offset"], 4)
+        # 受信済みの位置と違うところからは受け取らず、offset を返す
+        response = self.client.put(
+            url,
+            b"ijkl",
+            content_type="application/octet-stream",
+            headers={"content-range": "bytes 8-9/10"},
+        )
+        self.assertEqual(response.status_code, 400)
+        response = self.client.put(
+            url,
+            b"ij",
+            content_type="application/octet-stream",
+            headers={"content-range": "bytes 8-9/10"},
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(response.json()["offset"], 4)
+        self.assertEqual(self.client.get(url).json()["offset"], 4)
+
+        for first, end in [(4, 8), (8, 10)]:
+            response = self.client.put(
+                url,
+                b"abcdefghij"[first:end],
+                content_type="application/octet-stream",
+                headers={"content-range": f"bytes {first}-{end - 1}/10"},
+            )
+        self.assertTrue(response.json()["complete"])
+        attachment = self.inquiry.attachments.get()
+        with attachment.blob.file.open("rb") as f:
+            self.assertEqual(f.read(), b"abcdefghij")
+
+    def test_truncated_chunk_is_not_received(self):
+        upload = self.start(8)
+        # Content-Length より先に本文が終わった
+        with self.assertRaises(uploads.UploadError):
+            uploads.receive(upload, io.BytesIO(b"ab"), "bytes 0-3/8", 4)
+        upload.refresh_from_db()
+        self.assertEqual(upload.offset, 0)
+        self.receive(upload, 0, b"abcd")
+        attachment = self.receive(upload, 4, b"efgh")
+        with attachment.blob.file.open("rb") as f:
+            self.assertEqual(f.read(), b"abcdefgh")
+
+    def test_identical_content_shares_one_blob(self):
+        _, first = self.upload_via_views(b"abcdef", [(0, 4), (4, 6)])
+        _, second = self.upload_via_views(b"abcdef", [(0, 4), (4, 6)])
+        self.assertNotEqual(first.json()["attachment"]["id"], second.json()["attachment"]["id"])
+        blobs = {attachment.blob_id for attachment in self.inquiry.attachments.all()}
+        self.assertEqual(len(blobs), 1)
+        self.assertEqual(Blob.objects.count(), 1)
+
+    def test_download_requires_login(self):
+        _, response = self.upload_via_views(b"abcdef", [(0, 4), (4, 6)])
+        url = response.json()["attachment"]["url"]
+        self.client.logout()
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(settings.LOGIN_URL, response["Location"])
+
+    def test_download_is_served_directly_or_by_nginx(self):
+        _, response = self.upload_via_views(b"abcdef", [(0, 4), (4, 6)])
+        url = response.json()["attachment"]["url"]
+        blob = Blob.objects.get()
+
+        response = self.client.get(url)
+        self.assertEqual(b"".join(response.streaming_content), b"abcdef")
+        self.assertNotIn("X-Accel-Redirect", response)
+        self.assertIn('filename="memo.txt"', response["Content-Disposition"])
+
+        with override_settings(BLOB_X_ACCEL_PREFIX="/protected/"):
+            response = self.client.get(url)
+        self.assertEqual(response.content, b"")
+        self.assertEqual(response["X-Accel-Redirect"], f"/protected/{blob.file.name}")
+        self.assertIn('filename="memo.txt"', response["Content-Disposition"])
+        self.assertIn("private", response["Cache-Control"])
+
+    def test_admin_upload_is_hashed_while_receiving(self):
+        admin = User.objects.create_superuser("admin")
+        url = reverse("admin:inquiry_attachment_add")
+        data = {"inquiry": self.inquiry.pk, "filename": ""}
+        # CSRF の確認は csrf_exempt にした後も行う
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(admin)
+        upload = SimpleUploadedFile("memo.txt", b"abcdefgh")
+        self.assertEqual(client.post(url, {**data, "upload": upload}).status_code, 403)
+
+        self.client.force_login(admin)
+        upload = SimpleUploadedFile("memo.txt", b"abcdefgh")
+        with mock.patch("common.blobs.hash_file", side_effect=AssertionError):
+            response = self.client.post(url, {**data, "upload": upload})
+        self.assertEqual(response.status_code, 302)
+        attachment = self.inquiry.attachments.get()
+        self.assertEqual(attachment.filename, "memo.txt")
+        self.assertEqual(
+            attachment.blob.sha256,
+            "9c56cc51b374c3ba189210d5b6d4bf57790d351c96c47c02190ecf1e430635ab",
+        )
+
+
+class InquiryConditionalGetTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("staff", is_staff=True)
+        cls.inquiry = Inquiry.objects.create(
+            title="ログインできない", content="内容", customer_name="佐藤", customer_email="sato@example.com"
+        )
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.url = reverse("inquiry:inquiry_detail", args=[self.inquiry.pk])
+        # CSRF の Cookie が付いた状態で ETag を受け取る
+        self.client.get(self.url)
+        self.etag = self.client.get(self.url)["ETag"]
+
+    def test_not_modified_does_not_search_related_knowledge(self):
+        with mock.patch.object(
+            similarity, "related_knowledge_ids", side_effect=AssertionError
+        ):
+            response = self.client.get(self.url, headers={"if-none-match": self.etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_knowledge_vector_update_changes_etag(self):
+        similarity.bump_version()
+        response = self.client.get(self.url, headers={"if-none-match": self.etag})
+        self.assertEqual(response.status_code, 200)
+
+    def test_no_last_modified(self):
+        # ETag の入力（ユーザー・関連ナレッジの版など）は日時で表せないので付けない
+        response = self.client.get(
+            self.url, headers={"if-modified-since": "Fri, 01 Jan 2100 00:00:00 GMT"}
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Last-Modified", response)
+
+
+class InquiryCounterTests(TestCase):
+    """保存・付け替え・削除の後も、件数の集計が実データと一致することを確かめる"""
+
+    worker = "test:1"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user("staff", is_staff=True)
+        cls.other = User.objects.create_user("other", is_staff=True)
+        cls.category = Category.objects.create(name="ログイン")
+        cls.other_category = Category.objects.create(name="請求")
+        cls.inquiries = [
+            Inquiry.objects.create(
+                title=f"問い合わせ{i}",
+                content="ログインできません",
+                customer_name="佐藤 太郎",
+                customer_email="sato@example.com",
+                category=cls.category,
+                assigned_to=cls.staff,
+            )
+            for i in range(3)
+        ]
+
+    def run_jobs(self):
+        while jobs := jobqueue.claim(self.worker):
+            jobqueue.run(jobs, self.worker)
+
+    def test_reassigning_and_deleting_keep_counters(self):
+        self.run_jobs()
+        first, second, third = self.inquiries
+        category_key = str(self.category.pk)
+        first.category = self.other_category
+        first.assigned_to = self.other
+        first.save()
+        second.delete()
+        self.category.delete()
+        self.staff.delete()
+        # 付け替え・削除による件数の移動も、保存と同じくジョブで反映する
+        self.assertEqual(
+            InquiryCounter.objects.counts("category"), {category_key: 3}
+        )
+        self.run_jobs()
+
+        def counts(dimension):
+            counts = InquiryCounter.objects.counts(dimension)
+            return {key: count for key, count in counts.items() if count}
+
+        self.assertEqual(counts("category"), {str(self.other_category.pk): 1, "": 1})
+        self.assertEqual(counts("assignee"), {str(self.other.pk): 1, "": 1})
+        self.assertEqual(InquiryCounter.objects.headline()["total_inquiries"], 2)
+        self.assertEqual(InquiryCounter.objects.drift(), {})
+
+    def test_saving_a_stale_copy_keeps_concurrent_changes(self):
+        inquiry = self.inquiries[0]
+        stale = Inquiry.objects.get(pk=inquiry.pk)
+        inquiry.status = "in_progress"
+        inquiry.save()
+        # 読み込み後に変えていないステータスは、古い値で戻さない
+        stale.title = "件名を変更"
+        stale.save()
+        self.run_jobs()
+
+        stale.refresh_from_db()
+        self.assertEqual((stale.title, stale.status), ("件名を変更", "in_progress"))
+        self.assertEqual(InquiryCounter.objects.drift(), {})
+
+
+class InquiryBulkUpdateTests(TestCase):
+    """一括変更が save() と同じ解決日時・件数・通知の扱いになることを確かめる"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user("staff", is_staff=True)
+        cls.customer = User.objects.create_user("customer")
+        cls.resolved_at = timezone.now() - timedelta(days=1)
+        cls.inquiries = [
+            Inquiry.objects.create(
+                title=f"問い合わせ{i}",
+                content="ログインできません",
+                customer_name="佐藤 太郎",
+                customer_email="sato@example.com",
+            )
+            for i in range(2)
+        ]
+        cls.resolved = Inquiry.objects.create(
+            title="解決済み",
+            content="ログインできません",
+            customer_name="佐藤 太郎",
+            customer_email="sato@example.com",
+            status="resolved",
+            assigned_to=cls.staff,
+        )
+        Inquiry.objects.filter(pk=cls.resolved.pk).update(resolved_at=cls.resolved_at)
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def post(self, data):
+        return self.client.post(reverse("inquiry:inquiry_bulk_update"), data)
+
+    def test_updates_many_and_reports_each_id(self):
+        ids = [inquiry.pk for inquiry in self.inquiries]
+        missing = self.resolved.pk + 100
+        response = self.post(
+            {
+                "ids": [*ids, self.resolved.pk, missing],
+                "status": "resolved",
+                "assigned_to": self.staff.pk,
+            }
+        )
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data["updated"], 2)
+        self.assertEqual(
+            {row["id"]: row["result"] for row in data["results"]},
+            {
+                ids[0]: "updated",
+                ids[1]: "updated",
+                self.resolved.pk: "unchanged",
+                missing: "not_found",
+            },
+        )
+
+        for inquiry in Inquiry.objects.filter(pk__in=ids):
+            self.assertEqual(inquiry.status, "resolved")
+            self.assertEqual(inquiry.assigned_to, self.staff)
+            self.assertIsNotNone(inquiry.resolved_at)
+        self.resolved.refresh_from_db()
+        self.assertEqual(self.resolved.resolved_at, self.resolved_at)
+
+        # 件数の増減はジョブとして残っていて、反映後の件数とずれない
+        self.assertEqual(InquiryCounter.objects.drift(), {})
+        # 担当者が変わったものに通知する（解決済みのものは作成時の通知）
+        self.assertEqual(
+            sorted(jobqueue.pending(NOTIFY_JOB).values_list("key", flat=True)),
+            sorted(str(pk) for pk in [*ids, self.resolved.pk]),
+        )
+
+    def test_keeps_resolved_at_when_reopened(self):
+        response = self.post(
+            {"ids": [self.resolved.pk], "status": "in_progress", "unassign": "on"}
+        )
+        self.assertEqual(response.json()["updated"], 1)
+        self.resolved.refresh_from_db()
+        self.assertEqual(self.resolved.status, "in_progress")
+        self.assertIsNone(self.resolved.assigned_to)
+        self.assertEqual(self.resolved.resolved_at, self.resolved_at)
+        self.assertEqual(InquiryCounter.objects.drift(), {})
+
+    def test_invalidates_dashboard_stats(self):
+        cache.set(DASHBOARD_STATS_KEY, {"total_inquiries": 3})
+        self.addCleanup(cache.delete, DASHBOARD_STATS_KEY)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post({"ids": [self.inquiries[0].pk], "priority": "urgent"})
+        self.assertIsNone(cache.get(DASHBOARD_STATS_KEY))
+
+    def test_rejects_non_staff_assignee(self):
+        response = self.post(
+            {"ids": [self.inquiries[0].pk], "assigned_to": self.customer.pk}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn("assigned_to", response.json()["errors"])
+        self.inquiries[0].refresh_from_db()
+        self.assertIsNone(self.inquiries[0].assigned_to)
+
+
+class InquiryListFragmentCacheTests(TestCase):
+    """一覧の行の部分キャッシュが、表示している値の変更で描画し直されることを確かめる"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user("staff", is_staff=True)
+        cls.category = Category.objects.create(name="ログイン")
+        cls.inquiry = Inquiry.objects.create(
+            title="ログインできない",
+            content="内容",
+            customer_name="佐藤 太郎",
+            customer_email="sato@example.com",
+            category=cls.category,
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client.force_login(self.staff)
+        self.url = reverse("inquiry:inquiry_list")
+        self.client.get(self.url)
+
+    def test_row_is_cached(self):
+        # 行のキーに含まれない値を直接書き換えても、キャッシュした行を返す
+        Inquiry.objects.filter(pk=self.inquiry.pk).update(customer_name="鈴木 花子")
+        response = self.client.get(self.url)
+        self.assertContains(response, "佐藤 太郎")
+        self.assertNotContains(response, "鈴木 花子")
+
+    def test_category_rename(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.name = "認証"
+            self.category.save()
+        response = self.client.get(self.url)
+        self.assertContains(response, '<i class="fas fa-tag mr-1"></i>認証</span>')
+        self.assertNotContains(response, '<i class="fas fa-tag mr-1"></i>ログイン</span>')
+
+    def test_assignee_rename(self):
+        self.inquiry.assigned_to = self.staff
+        self.inquiry.save()
+        self.client.get(self.url)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.staff.first_name = "一郎"
+            self.staff.last_name = "山田"
+            self.staff.save()
+        response = self.client.get(self.url)
+        self.assertContains(response, '<i class="fas fa-user-tie mr-1"></i>一郎 山田</span>')
+        self.assertNotContains(response, '<i class="fas fa-user-tie mr-1"></i>staff</span>')
+
+    def test_new_response(self):
+        Response.objects.create(inquiry=self.inquiry, responder=self.staff, content="確認します")
+        response = self.client.get(self.url)
+        self.assertContains(response, "1件の対応")
+
+    def test_bulk_update(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            bulk.bulk_update([self.inquiry.pk], {"status": "resolved"})
+        response = self.client.get(self.url)
+        self.assertContains(response, 'status-resolved">')
+        self.assertNotContains(response, 'status-new">')
+
+
+class InquiryExportTests(TestCase):
+    """ASGI でも出力を全件読み込まずに、少しずつ送ることを確かめる"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("staff", is_staff=True)
+        for i in range(3):
+            Inquiry.objects.create(
+                title=f"問い合わせ{i}",
+                content="ログインできません",
+                customer_name="佐藤 太郎",
+                customer_email="sato@example.com",
+            )
+
+    async def test_chunks(self):
+        chunks = [chunk async for chunk in exports.aiter_chunks(["a", "b", "c"], size=2)]
+        self.assertEqual(chunks, ["ab", "c"])
+
+    async def test_asgi_export_is_async_iterator(self):
+        await self.async_client.aforce_login(self.user)
+        response = await self.async_client.get(
+            reverse("inquiry:inquiry_export"), {"format": "jsonl"}
+        )
+        self.assertTrue(response.is_async)
+        content = b"".join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(len(content.decode().splitlines()), 3)
+
+
+class AsyncInquiryViewTests(TestCase):
+    """非同期のステータス更新・担当者割り当てと、同時に保存した後の件数を確かめる"""
+
+    worker = "test:1"
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user("staff", is_staff=True)
+        cls.customer = User.objects.create_user("customer")
+        cls.inquiry = Inquiry.objects.create(
+            title="ログインできません",
+            content="パスワードは合っています",
+            customer_name="佐藤 太郎",
+            customer_email="sato@example.com",
+        )
+
+    def setUp(self):
+        self.async_client.force_login(self.staff)
+
+    def run_jobs(self):
+        while jobs := jobqueue.claim(self.worker):
+            jobqueue.run(jobs, self.worker)
+
+    def update_status(self, status):
+        return self.async_client.post(
+            reverse("inquiry:inquiry_status_update", args=[self.inquiry.pk]),
+            {"status": status},
+        )
+
+    def assign(self, user):
+        return self.async_client.post(
+            reverse("inquiry:inquiry_assign", args=[self.inquiry.pk]),
+            {"assignee_id": user.pk},
+        )
+
+    async def test_status_update_sets_resolved_at(self):
+        response = await self.update_status("resolved")
+        self.assertEqual(response.json(), {"success": True, "status": "解決済み"})
+        await self.inquiry.arefresh_from_db()
+        self.assertIsNotNone(self.inquiry.resolved_at)
+
+        response = await self.update_status("unknown")
+        self.assertEqual(response.json(), {"success": False})
+
+    async def test_assign_only_staff(self):
+        response = await self.assign(self.customer)
+        self.assertEqual(response.json(), {"success": False})
+        response = await self.assign(self.staff)
+        self.assertEqual(response.json(), {"success": True, "assignee_name": "staff"})
+        await self.inquiry.arefresh_from_db()
+        self.assertEqual(self.inquiry.assigned_to_id, self.staff.pk)
+
+    async def test_concurrent_saves_keep_counters(self):
+        # ステータスと担当者を同時に変更しても、どちらの変更も件数に一度だけ反映される
+        responses = await asyncio.gather(
+            self.update_status("in_progress"), self.assign(self.staff)
+        )
+        self.assertTrue(all(response.json()["success"] for response in responses))
+        await sync_to_async(self.run_jobs)()
+
+        counts = sync_to_async(InquiryCounter.objects.counts)
+        self.assertEqual(await counts("status"), {"in_progress": 1})
+        self.assertEqual(await counts("assignee"), {str(self.staff.pk): 1})
+        self.assertEqual(await sync_to_async(InquiryCounter.objects.drift)(), {})
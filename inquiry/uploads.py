@@ -0,0 +1,166 @@
+"""添付ファイルの分割アップロード
+
+ブラウザはファイルを BLOB_UPLOAD_CHUNK_SIZE ごとに分け、
+Content-Range を付けて順に PUT する。受信した内容は少しずつ
+BLOB_UPLOAD_DIR/<id>.part に書き出すので、ファイルの大きさに関わらず
+メモリ使用量は一定で、途中で切れても受信済みの位置から再開できる。
+
+各分割はいったん別の一時ファイル（<id>.*.chunk）に受け取り、offset を進められた
+リクエストだけが .part に書き込む。同じ範囲を同時に送られても、負けた方の内容で
+受信済みの部分が上書きされることはない。
+SHA-256 はすべて受信した後にファイルから計算する（Blob は内容のハッシュで
+重複を除くので、ディスク上の内容と食い違うハッシュで保存しないように）。
+"""
+
+import os
+import re
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from common.blobs import hash_file, store_file, upload_dir
+from .models import Attachment, AttachmentUpload
+
+READ_SIZE = 64 * 1024
+
+CONTENT_RANGE = re.compile(r"^bytes (\d+)-(\d+)/(\d+)$")
+
+# 受信途中の分割の一時ファイル
+CHUNK_SUFFIX = ".chunk"
+
+
+class UploadError(Exception):
+    """受け取れない分割。status は返す HTTP ステータス"""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def start(inquiry, user, filename, size, content_type=""):
+    if size > settings.ATTACHMENT_MAX_SIZE:
+        raise UploadError("ファイルが大きすぎます。", status=413)
+    upload = AttachmentUpload.objects.create(
+        inquiry=inquiry,
+        uploaded_by=user,
+        filename=os.path.basename(filename)[:255],
+        content_type=content_type[:100],
+        size=size,
+    )
+    # 空のファイルを先に作り、以降の分割は位置を指定して書き込む
+    upload_dir()
+    open(upload.part_path, "wb").close()
+    return upload
+
+
+def parse_content_range(value):
+    """Content-Range: bytes 開始-終了/全体 → (開始, 終了の次, 全体)"""
+    match = CONTENT_RANGE.match(value or "")
+    if not match:
+        raise UploadError("Content-Range の形式が不正です。")
+    first, last, total = (int(group) for group in match.groups())
+    if last < first:
+        raise UploadError("Content-Range の範囲が不正です。")
+    return first, last + 1, total
+
+
+def receive(upload, stream, content_range, content_length):
+    """1つの分割を書き込み、すべて受信したら Attachment を返す（途中なら None）"""
+    start, end, total = parse_content_range(content_range)
+    if total != upload.size or end > upload.size:
+        raise UploadError("ファイルのサイズが開始時と異なります。")
+    if end - start != content_length:
+        raise UploadError("Content-Range と Content-Length が一致しません。")
+    if end - start > settings.BLOB_UPLOAD_CHUNK_SIZE:
+        raise UploadError("分割が大きすぎます。", status=413)
+    if start != upload.offset:
+        # 再送や順序の入れ替わり。クライアントは返した offset から送り直す
+        raise UploadError("受信済みの位置と一致しません。", status=409)
+
+    chunk = receive_chunk(upload, stream, end - start)
+    try:
+        # 同じ分割を同時に受け取った場合は、先に offset を進めた方だけが書き込む。
+        # 書き込みに失敗したら offset も戻す
+        with transaction.atomic():
+            # update() では auto_now が効かないので、updated_at も進める（受信中のものを期限切れにしない）
+            now = timezone.now()
+            updated = AttachmentUpload.objects.filter(
+                pk=upload.pk, offset=start
+            ).update(offset=end, updated_at=now)
+            if not updated:
+                raise UploadError("受信済みの位置と一致しません。", status=409)
+            with open(chunk, "rb") as source, open(upload.part_path, "r+b") as f:
+                f.seek(start)
+                shutil.copyfileobj(source, f, READ_SIZE)
+    finally:
+        os.remove(chunk)
+    upload.offset = end
+    upload.updated_at = now
+
+    if end < upload.size:
+        return None
+    return complete(upload)
+
+
+def receive_chunk(upload, stream, length):
+    """分割を一時ファイルに受け取り、そのパスを返す"""
+    with tempfile.NamedTemporaryFile(
+        dir=upload_dir(), prefix=f"{upload.pk}.", suffix=CHUNK_SUFFIX, delete=False
+    ) as f:
+        received = 0
+        while received < length:
+            data = stream.read(min(READ_SIZE, length - received))
+            if not data:
+                break
+            f.write(data)
+            received += len(data)
+    if received != length:
+        # 途中で切れた分割は受信しなかったことにする（offset は進めない）
+        os.remove(f.name)
+        raise UploadError("分割を最後まで受信できませんでした。")
+    return f.name
+
+
+def complete(upload):
+    """受信したファイルを Blob に取り込み、添付ファイルを作る"""
+    sha256, size = hash_file(upload.part_path)
+    blob = store_file(upload.part_path, sha256, size)
+    with transaction.atomic():
+        attachment = Attachment.objects.create(
+            inquiry_id=upload.inquiry_id,
+            blob=blob,
+            filename=upload.filename,
+            content_type=upload.content_type,
+        )
+        upload.delete()
+    return attachment
+
+
+def cancel(upload):
+    """アップロードを中止し、受信済みの部分を削除する"""
+    path = upload.part_path
+    upload.delete()
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def delete_stale_chunks(before):
+    """受信中にワーカーが止まるなどして残った、before より前の分割の一時ファイルを削除する"""
+    deleted = 0
+    directory = upload_dir()
+    for name in os.listdir(directory):
+        path = os.path.join(directory, name)
+        if not name.endswith(CHUNK_SUFFIX):
+            continue
+        try:
+            if os.path.getmtime(path) < before.timestamp():
+                os.remove(path)
+                deleted += 1
+        except FileNotFoundError:
+            pass
+    return deleted
@@ -6,6 +6,7 @@ app_name = "inquiry"
 urlpatterns = [
     path("", views.InquiryListView.as_view(), name="inquiry_list"),
     path("create/", views.InquiryCreateView.as_view(), name="inquiry_create"),
+    path("export/", views.inquiry_export, name="inquiry_export"),
     path("<int:pk>/", views.InquiryDetailView.as_view(), name="inquiry_detail"),
     path(
         "<int:pk>/edit/",
@@ -18,10 +19,32 @@ urlpatterns = [
         name="inquiry_delete",
     ),
     # AJAX用
+    path("facets/", views.inquiry_facets, name="inquiry_facets"),
     path(
         "<int:pk>/status/",
         views.inquiry_status_update,
         name="inquiry_status_update",
     ),
     path("<int:pk>/assign/", views.inquiry_assign, name="inquiry_assign"),
+    path("bulk-update/", views.inquiry_bulk_update, name="inquiry_bulk_update"),
+    path(
+        "<int:pk>/uploads/",
+        views.attachment_upload_start,
+        name="attachment_upload_start",
+    ),
+    path(
+        "uploads/<uuid:upload_id>/",
+        views.attachment_upload,
+        name="attachment_upload",
+    ),
+    path(
+        "attachments/<int:pk>/download/",
+        views.attachment_download,
+        name="attachment_download",
+    ),
+    path(
+        "attachments/<int:pk>/preview/",
+        views.attachment_preview,
+        name="attachment_preview",
+    ),
 ]
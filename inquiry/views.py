@@ -1,10 +1,13 @@
-from django.shortcuts import render, get_object_or_404, redirect
+from django.shortcuts import render, get_object_or_404, aget_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.contrib import messages
 from django.core.paginator import Paginator
-from django.db.models import Q, Count
-from django.http import JsonResponse
+from django.db import transaction
+from django.db.models import Count, Max
+from django.db.models.functions import Substr
+from django.conf import settings
+from django.http import Http404, JsonResponse
 from django.views.generic import (
     ListView,
     DetailView,
@@ -14,97 +17,104 @@ from django.views.generic import (
 )
 from django.urls import reverse_lazy
 from django.utils import timezone
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import require_http_methods, require_POST
 from datetime import datetime, timedelta
 
-from .models import Inquiry, Response, Category
+from common.blobs import serve_blob, serve_file
+from common.conditional import ConditionalDetailMixin
+from common.db import retry_on_lock
+from common.pagination import KeysetPaginationMixin
+from knowledge import similarity
+from .models import (
+    Attachment,
+    AttachmentUpload,
+    Inquiry,
+    InquiryCounter,
+    Response,
+    Category,
+)
 from .forms import (
     InquiryForm,
     InquiryUpdateForm,
     ResponseForm,
     InquirySearchForm,
+    InquiryBulkUpdateForm,
 )
+from . import bulk, duplicates, exports, facets, uploads
 
 
-class InquiryListView(LoginRequiredMixin, ListView):
+class InquiryListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     """問い合わせ一覧"""
 
     model = Inquiry
     template_name = "inquiry/inquiry_list.html"
     context_object_name = "inquiries"
     paginate_by = 20
+    keyset_ordering = ("-created_at", "-pk")
 
     def get_queryset(self):
-        queryset = Inquiry.objects.select_related(
-            "category", "assigned_to"
-        ).prefetch_related("responses")
+        queryset = Inquiry.objects.select_related("category", "assigned_to")
 
         # 検索フォームの処理
         form = InquirySearchForm(self.request.GET)
         if form.is_valid():
-            q = form.cleaned_data.get("q")
-            if q:
-                queryset = queryset.filter(
-                    Q(title__icontains=q)
-                    | Q(content__icontains=q)
-                    | Q(customer_name__icontains=q)
-                    | Q(customer_email__icontains=q)
-                    | Q(tags__icontains=q)
-                )
-
-            status = form.cleaned_data.get("status")
-            if status:
-                queryset = queryset.filter(status=status)
-
-            priority = form.cleaned_data.get("priority")
-            if priority:
-                queryset = queryset.filter(priority=priority)
-
-            category = form.cleaned_data.get("category")
-            if category:
-                queryset = queryset.filter(category=category)
-
-            assigned_to = form.cleaned_data.get("assigned_to")
-            if assigned_to:
-                queryset = queryset.filter(assigned_to=assigned_to)
-
-            date_from = form.cleaned_data.get("date_from")
-            if date_from:
-                queryset = queryset.filter(created_at__date__gte=date_from)
-
-            date_to = form.cleaned_data.get("date_to")
-            if date_to:
-                queryset = queryset.filter(created_at__date__lte=date_to)
+            queryset = form.filter_queryset(queryset)
 
         return queryset
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["search_form"] = InquirySearchForm(self.request.GET)
+        # 検索フォームと id が重ならないようにする
+        context["bulk_form"] = InquiryBulkUpdateForm(auto_id="id_bulk_%s")
 
         # 統計情報
-        context["total_inquiries"] = Inquiry.objects.count()
-        context["new_inquiries"] = Inquiry.objects.filter(status="new").count()
-        context["in_progress_inquiries"] = Inquiry.objects.filter(
-            status="in_progress"
-        ).count()
-        context["urgent_inquiries"] = Inquiry.objects.filter(priority="urgent").count()
+        context.update(InquiryCounter.objects.headline())
 
         return context
 
 
-class InquiryDetailView(LoginRequiredMixin, DetailView):
+class InquiryDetailView(LoginRequiredMixin, ConditionalDetailMixin, DetailView):
     """問い合わせ詳細"""
 
     model = Inquiry
     template_name = "inquiry/inquiry_detail.html"
     context_object_name = "inquiry"
 
+    def get_etag_values(self):
+        """問い合わせ自体に加え、対応履歴・添付ファイル・関連ナレッジの変化で ETag を変える"""
+        inquiry = self.object
+        attachments = inquiry.attachments.aggregate(
+            count=Count("pk"),
+            uploaded_at=Max("uploaded_at"),
+            processed_at=Max("blob__processed_at"),
+        )
+        return [
+            inquiry.updated_at,
+            inquiry.response_count,
+            inquiry.last_response_at,
+            inquiry.duplicate_of_id,
+            *attachments.values(),
+            # 関連ナレッジは検索せず、ナレッジのベクトルの版で判断する
+            similarity.index_version(),
+        ]
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["response_form"] = ResponseForm()
         context["responses"] = self.object.responses.select_related(
             "responder"
         ).order_by("-created_at")
+        # 抽出したテキストは全文を読まずに冒頭だけを表示する
+        context["attachments"] = (
+            self.object.attachments.select_related("blob")
+            .defer("blob__text")
+            .annotate(text_excerpt=Substr("blob__text", 1, 200))
+        )
+        context["attachment_chunk_size"] = settings.BLOB_UPLOAD_CHUNK_SIZE
+        context["attachment_max_size"] = settings.ATTACHMENT_MAX_SIZE
+        context["related_knowledge"] = similarity.related_knowledge(self.object)
 
         # 担当者リストを取得
         from django.contrib.auth import get_user_model
@@ -114,6 +124,7 @@ class InquiryDetailView(LoginRequiredMixin, DetailView):
 
         return context
 
+    @method_decorator(retry_on_lock)
     def post(self, request, *args, **kwargs):
         inquiry = self.get_object()
         form = ResponseForm(request.POST)
@@ -122,7 +133,9 @@ class InquiryDetailView(LoginRequiredMixin, DetailView):
             response = form.save(commit=False)
             response.inquiry = inquiry
             response.responder = request.user
-            response.save()
+            # 対応履歴と問い合わせの集計を1トランザクションで書き込む
+            with transaction.atomic():
+                response.save()
 
             messages.success(request, "対応内容を追加しました。")
             return redirect("inquiry:inquiry_detail", pk=inquiry.pk)
@@ -141,8 +154,23 @@ class InquiryCreateView(LoginRequiredMixin, CreateView):
     success_url = reverse_lazy("inquiry:inquiry_list")
 
     def form_valid(self, form):
-        messages.success(self.request, "問い合わせを作成しました。")
-        return super().form_valid(form)
+        duplicate = duplicates.find_duplicate(form.instance)
+        form.instance.duplicate_of = duplicate
+        # 署名は下で同じトランザクションのうちに登録するので、post_save のジョブは不要
+        form.instance._signature_updated = True
+        with transaction.atomic():
+            response = super().form_valid(form)
+            # 続けて送られた同じ問い合わせも検出できるよう、署名はジョブを待たずに登録する
+            duplicates.update_signatures([self.object.pk])
+        if duplicate is not None:
+            messages.warning(
+                self.request,
+                f"問い合わせを作成しました。同じ顧客の「{duplicate.title}」と"
+                "重複している可能性があります。",
+            )
+        else:
+            messages.success(self.request, "問い合わせを作成しました。")
+        return response
 
 
 class InquiryUpdateView(LoginRequiredMixin, UpdateView):
@@ -173,15 +201,48 @@ class InquiryDeleteView(LoginRequiredMixin, DeleteView):
 
 
 @login_required
-def inquiry_status_update(request, pk):
+def inquiry_facets(request):
+    """一覧の絞り込み条件ごとの件数（AJAX）"""
+    form = InquirySearchForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({"success": False, "errors": form.errors}, status=400)
+    return JsonResponse({"success": True, **facets.get_facets(form)})
+
+
+@login_required
+def inquiry_export(request):
+    """一覧の絞り込み結果を CSV / JSONL で出力する"""
+    form = InquirySearchForm(request.GET)
+    if not form.is_valid():
+        return JsonResponse({"success": False, "errors": form.errors}, status=400)
+    queryset = form.filter_queryset(Inquiry.objects.all())
+
+    timestamp = timezone.localtime().strftime("%Y%m%d_%H%M%S")
+    if request.GET.get("format") == "jsonl":
+        response = exports.streaming_response(
+            request, exports.stream_jsonl(queryset), "application/x-ndjson"
+        )
+        filename = f"inquiries_{timestamp}.jsonl"
+    else:
+        response = exports.streaming_response(
+            request, exports.stream_csv(queryset), "text/csv; charset=utf-8"
+        )
+        filename = f"inquiries_{timestamp}.csv"
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+@login_required
+@retry_on_lock
+async def inquiry_status_update(request, pk):
     """問い合わせステータス更新（AJAX）"""
     if request.method == "POST":
-        inquiry = get_object_or_404(Inquiry, pk=pk)
+        inquiry = await aget_object_or_404(Inquiry, pk=pk)
         new_status = request.POST.get("status")
 
         if new_status in dict(Inquiry.STATUS_CHOICES):
             inquiry.status = new_status
-            inquiry.save()
+            await inquiry.asave(update_fields=["status", "resolved_at", "updated_at"])
             return JsonResponse(
                 {"success": True, "status": inquiry.get_status_display()}
             )
@@ -190,10 +251,11 @@ def inquiry_status_update(request, pk):
 
 
 @login_required
-def inquiry_assign(request, pk):
+@retry_on_lock
+async def inquiry_assign(request, pk):
     """問い合わせ担当者割り当て（AJAX）"""
     if request.method == "POST":
-        inquiry = get_object_or_404(Inquiry, pk=pk)
+        inquiry = await aget_object_or_404(Inquiry, pk=pk)
         assignee_id = request.POST.get("assignee_id")
 
         if assignee_id:
@@ -201,9 +263,9 @@ def inquiry_assign(request, pk):
 
             User = get_user_model()
             try:
-                assignee = User.objects.get(id=assignee_id, is_staff=True)
+                assignee = await User.objects.aget(id=assignee_id, is_staff=True)
                 inquiry.assigned_to = assignee
-                inquiry.save()
+                await inquiry.asave(update_fields=["assigned_to", "updated_at"])
                 return JsonResponse(
                     {
                         "success": True,
@@ -214,3 +276,132 @@ def inquiry_assign(request, pk):
                 pass
 
     return JsonResponse({"success": False})
+
+
+@login_required
+@require_POST
+@retry_on_lock
+def inquiry_bulk_update(request):
+    """問い合わせのステータス・優先度・担当者の一括変更（AJAX）"""
+    form = InquiryBulkUpdateForm(request.POST)
+    if not form.is_valid():
+        return JsonResponse(
+            {"success": False, "errors": form.errors.get_json_data()}, status=400
+        )
+    results = bulk.bulk_update(form.cleaned_data["ids"], form.changes())
+    return JsonResponse(
+        {
+            "success": True,
+            "updated": sum(result == bulk.UPDATED for result in results.values()),
+            "results": [
+                {"id": pk, "success": result != bulk.NOT_FOUND, "result": result}
+                for pk, result in results.items()
+            ],
+        }
+    )
+
+
+@login_required
+def attachment_download(request, pk):
+    """添付ファイルのダウンロード（ファイルの送信は nginx に任せる）"""
+    attachment = get_object_or_404(Attachment.objects.select_related("blob"), pk=pk)
+    return serve_blob(attachment.blob, attachment.filename, attachment.content_type)
+
+
+@login_required
+def attachment_preview(request, pk):
+    """添付ファイルの縮小版・1ページ目の画像"""
+    attachment = get_object_or_404(Attachment.objects.select_related("blob"), pk=pk)
+    if not attachment.blob.preview:
+        raise Http404
+    return serve_file(
+        attachment.blob.preview,
+        f"{attachment.filename}.png",
+        "image/png",
+        as_attachment=False,
+    )
+
+
+def upload_status(upload, **extra):
+    return {
+        "success": True,
+        "upload_id": str(upload.pk),
+        "offset": upload.offset,
+        "size": upload.size,
+        "chunk_size": settings.BLOB_UPLOAD_CHUNK_SIZE,
+        **extra,
+    }
+
+
+def attachment_data(attachment):
+    return {
+        "id": attachment.pk,
+        "filename": attachment.filename,
+        "size": attachment.blob.size,
+        "url": attachment.get_absolute_url(),
+    }
+
+
+@login_required
+@require_POST
+def attachment_upload_start(request, pk):
+    """添付ファイルの分割アップロードを開始する（AJAX）"""
+    inquiry = get_object_or_404(Inquiry, pk=pk)
+    filename = request.POST.get("filename", "").strip()
+    try:
+        size = int(request.POST.get("size", ""))
+    except ValueError:
+        size = -1
+    if not filename or size < 0:
+        return JsonResponse(
+            {"success": False, "error": "ファイル名とサイズを指定してください。"},
+            status=400,
+        )
+    try:
+        upload = uploads.start(
+            inquiry, request.user, filename, size, request.POST.get("content_type", "")
+        )
+    except uploads.UploadError as e:
+        return JsonResponse({"success": False, "error": str(e)}, status=e.status)
+    if size == 0:
+        attachment = uploads.complete(upload)
+        return JsonResponse(
+            {"success": True, "complete": True, "attachment": attachment_data(attachment)}
+        )
+    return JsonResponse(upload_status(upload), status=201)
+
+
+@login_required
+@require_http_methods(["GET", "PUT", "DELETE"])
+def attachment_upload(request, upload_id):
+    """分割アップロードの状況確認（GET）・分割の受信（PUT）・中止（DELETE）（AJAX）
+
+    PUT の本文は request.body を使わずに少しずつ読み、そのままファイルに書き出す。
+    """
+    upload = get_object_or_404(
+        AttachmentUpload, pk=upload_id, uploaded_by=request.user
+    )
+    if request.method == "GET":
+        return JsonResponse(upload_status(upload))
+    if request.method == "DELETE":
+        uploads.cancel(upload)
+        return JsonResponse({"success": True})
+
+    try:
+        attachment = uploads.receive(
+            upload,
+            request,
+            request.headers.get("Content-Range"),
+            int(request.META.get("CONTENT_LENGTH") or 0),
+        )
+    except uploads.UploadError as e:
+        upload.refresh_from_db(fields=["offset"])
+        return JsonResponse(
+            {"success": False, "error": str(e), "offset": upload.offset},
+            status=e.status,
+        )
+    if attachment is None:
+        return JsonResponse(upload_status(upload))
+    return JsonResponse(
+        {"success": True, "complete": True, "attachment": attachment_data(attachment)}
+    )
@@ -13,7 +13,8 @@ class KnowledgeAdmin(admin.ModelAdmin):
         "updated_at",
     ]
     list_filter = ["category", "author", "is_public", "created_at"]
-    search_fields = ["title", "content", "tags"]
+    search_fields = ["title", "content", "tags__name"]
+    filter_horizontal = ["tags"]
     readonly_fields = ["view_count", "created_at", "updated_at"]
 
     fieldsets = (
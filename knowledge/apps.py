@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class KnowledgeConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'knowledge'
+
+    def ready(self):
+        from . import counters, signals  # noqa: F401
@@ -0,0 +1,175 @@
+"""ナレッジ閲覧回数の書き込みをまとめて行う
+
+閲覧ごとに UPDATE するとワーカー間で書き込みロックを取り合うため、
+ワーカー内で件数を溜めておき、一定間隔で1件のジョブにして登録する。
+加算はジョブのワーカーが、他のワーカーの分とまとめて F() で反映する。
+
+リクエストの後に間隔が過ぎていれば書き込み、リクエストが来なくなったワーカーでも
+タイマーのスレッドが間隔の後に書き込む。溜めている件数はそのプロセスにしかないので、
+詳細の表示には、他のワーカーの分は書き込まれるまで（最大 KNOWLEDGE_VIEW_FLUSH_INTERVAL 秒と
+ジョブの待ち時間）含まれない。
+"""
+
+import atexit
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.signals import request_finished
+from django.db import connection
+from django.db.models import F
+from django.dispatch import receiver
+from django.utils import timezone
+
+from common import jobqueue
+from common.db import retry_on_lock
+from .models import Knowledge, KnowledgeDailyView
+
+logger = logging.getLogger(__name__)
+
+# 溜まった件数がこれを超えたら間隔を待たずに書き込む
+MAX_PENDING = 1000
+
+VIEW_COUNT_JOB = "knowledge.add_view_counts"
+
+
+class ViewCountBuffer:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = Counter()
+        self._last_flush = time.monotonic()
+        self._timer = None
+
+    def add(self, pk, date=None):
+        with self._lock:
+            self._pending[pk, date or timezone.localdate()] += 1
+            self._schedule()
+
+    def _schedule(self):
+        # self._lock を取った状態で呼ぶ。タイマーは1つだけ動かす
+        if self._timer is None:
+            self._timer = threading.Timer(
+                settings.KNOWLEDGE_VIEW_FLUSH_INTERVAL, self._flush_idle
+            )
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _flush_idle(self):
+        """リクエストが来なくても、間隔が過ぎたら書き込む（タイマーのスレッドで実行する）"""
+        with self._lock:
+            self._timer = None
+        try:
+            self.flush()
+        except Exception:
+            logger.exception("閲覧回数を書き込めませんでした")
+            # 件数はバッファに残っているので、次の間隔の後に書き込み直す
+            with self._lock:
+                self._schedule()
+        finally:
+            connection.close()
+
+    def stop(self):
+        """タイマーを止める（溜まった件数は残る）"""
+        with self._lock:
+            timer, self._timer = self._timer, None
+        if timer is not None:
+            timer.cancel()
+
+    def pending(self, pk):
+        """このプロセスでまだ書き込んでいない閲覧回数"""
+        with self._lock:
+            return sum(n for (key, _), n in self._pending.items() if key == pk)
+
+    def is_due(self):
+        if not self._pending:
+            return False
+        elapsed = time.monotonic() - self._last_flush
+        return (
+            elapsed >= settings.KNOWLEDGE_VIEW_FLUSH_INTERVAL
+            or len(self._pending) >= MAX_PENDING
+        )
+
+    def flush(self):
+        """溜まった件数をジョブに登録する。失敗した場合は次回に持ち越す"""
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            self._last_flush = time.monotonic()
+        if not pending:
+            return 0
+        try:
+            retry_on_lock(jobqueue.enqueue)(
+                VIEW_COUNT_JOB,
+                [[pk, date.isoformat(), n] for (pk, date), n in pending.items()],
+            )
+        except Exception:
+            with self._lock:
+                self._pending.update(pending)
+            raise
+        return sum(pending.values())
+
+
+def write_view_counts(pending):
+    """{(ナレッジID, 日付): 回数} を閲覧回数と日別集計に加算する
+
+    ジョブのトランザクションの中で呼ばれるので、ロック待ちで失敗した場合はジョブごと再試行される。
+    """
+    totals = Counter()
+    for (pk, _), n in pending.items():
+        totals[pk] += n
+    existing = set(
+        Knowledge.objects.filter(pk__in=totals).values_list("pk", flat=True)
+    )
+
+    # 加算する回数ごとにまとめて UPDATE する（ほとんどは 1 回分）
+    by_count = defaultdict(list)
+    for pk, n in totals.items():
+        if pk in existing:
+            by_count[n].append(pk)
+
+    table = KnowledgeDailyView._meta.db_table
+    for n, pks in by_count.items():
+        Knowledge.objects.filter(pk__in=pks).update(view_count=F("view_count") + n)
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f"INSERT INTO {table} (knowledge_id, date, count) VALUES (%s, %s, %s) "
+            "ON CONFLICT (knowledge_id, date) "
+            "DO UPDATE SET count = count + excluded.count",
+            [[pk, date, n] for (pk, date), n in pending.items() if pk in existing],
+        )
+
+
+buffer = ViewCountBuffer()
+
+
+def record_view(pk):
+    buffer.add(pk)
+
+
+def pending_views(pk):
+    """このプロセスで未書き込みの閲覧回数（他のワーカーの分は含まない）"""
+    return buffer.pending(pk)
+
+
+@receiver(request_finished)
+def flush_if_due(sender, **kwargs):
+    """レスポンスを返し終えた後に、間隔が空いていれば書き込む"""
+    if not buffer.is_due():
+        return
+    try:
+        buffer.flush()
+    except Exception:
+        # 件数はバッファに残っているので、次のリクエストの後に書き込み直す
+        logger.exception("閲覧回数を書き込めませんでした")
+    finally:
+        connection.close_if_unusable_or_obsolete()
+
+
+@atexit.register
+def flush_on_exit():
+    buffer.stop()
+    try:
+        buffer.flush()
+    except Exception:
+        logger.exception("終了時に閲覧回数を書き込めませんでした")
@@ -0,0 +1,37 @@
+"""ナレッジ一覧のタグ件数の集計とキャッシュ
+
+タグ以外の絞り込み条件が同じなら件数も同じなので、条件ごとに
+KNOWLEDGE_TAG_COUNTS_TTL 秒キャッシュする（タグの付け替えはその間反映されない）。
+"""
+
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+
+TAG_COUNTS_KEY_PREFIX = "knowledge:tag_counts:"
+
+
+def cache_key(form):
+    """タグ以外の正規化した絞り込み条件からキャッシュキーを作る"""
+    cleaned_data = form.cleaned_data if form.is_valid() else {}
+    data = {
+        name: getattr(value, "pk", value)
+        for name, value in cleaned_data.items()
+        if value and name != "tag"
+    }
+    digest = hashlib.md5(
+        json.dumps(data, sort_keys=True, default=str).encode()
+    ).hexdigest()
+    return TAG_COUNTS_KEY_PREFIX + digest
+
+
+def get_tag_counts(form, queryset):
+    """queryset（タグ以外の条件で絞り込んだもの）に付いているタグと件数"""
+    key = cache_key(form)
+    tag_counts = cache.get(key)
+    if tag_counts is None:
+        tag_counts = queryset.tag_counts()
+        cache.set(key, tag_counts, settings.KNOWLEDGE_TAG_COUNTS_TTL)
+    return tag_counts
@@ -1,14 +1,18 @@
 from django import forms
 from django.contrib.auth import get_user_model
 from .models import Knowledge
-from common.models import Category
+from . import search
+from common.categories import filter_by_category
+from common.forms import CategoryChoiceField, TagNamesField, TagNamesFormMixin
 
 User = get_user_model()
 
 
-class KnowledgeForm(forms.ModelForm):
+class KnowledgeForm(TagNamesFormMixin, forms.ModelForm):
     """ナレッジフォーム"""
 
+    tags = TagNamesField(label="タグ")
+
     class Meta:
         model = Knowledge
         fields = ["title", "content", "category", "is_public", "tags"]
@@ -17,9 +21,6 @@ class KnowledgeForm(forms.ModelForm):
             "content": forms.Textarea(attrs={"class": "form-control", "rows": 8}),
             "category": forms.Select(attrs={"class": "form-control"}),
             "is_public": forms.CheckboxInput(attrs={"class": "form-check-input"}),
-            "tags": forms.TextInput(
-                attrs={"class": "form-control", "placeholder": "カンマ区切りで入力"}
-            ),
         }
 
 
@@ -28,17 +29,25 @@ class KnowledgeSearchForm(forms.Form):
 
     q = forms.CharField(
         label="キーワード検索",
+        max_length=200,
         required=False,
         widget=forms.TextInput(
-            attrs={"class": "form-control", "placeholder": "タイトル、内容で検索"}
+            attrs={
+                "class": "form-control",
+                "placeholder": "タイトル、内容、タグで検索（スペース区切りでAND検索）",
+            }
         ),
     )
-    category = forms.ModelChoiceField(
+    category = CategoryChoiceField(
         label="カテゴリ",
-        queryset=Category.objects.all(),
         required=False,
         widget=forms.Select(attrs={"class": "form-control"}),
     )
+    include_subcategories = forms.BooleanField(
+        label="下位カテゴリを含む",
+        required=False,
+        widget=forms.CheckboxInput(attrs={"class": "form-check-input"}),
+    )
     author = forms.ModelChoiceField(
         label="作成者",
         queryset=User.objects.filter(is_staff=True),
@@ -51,3 +60,36 @@ class KnowledgeSearchForm(forms.Form):
         required=False,
         widget=forms.Select(attrs={"class": "form-control"}),
     )
+
+    tag = forms.CharField(
+        label="タグ", max_length=50, required=False, widget=forms.HiddenInput()
+    )
+
+    def clean_q(self):
+        return " ".join(self.cleaned_data["q"].split())
+
+    def filter_queryset(self, queryset, exclude=()):
+        """入力された条件で絞り込む。exclude に挙げたフィールドは条件に使わない"""
+        category = self.cleaned_data.get("category")
+        if category and "category" not in exclude:
+            queryset = filter_by_category(
+                queryset, category, self.cleaned_data.get("include_subcategories")
+            )
+
+        author = self.cleaned_data.get("author")
+        if author and "author" not in exclude:
+            queryset = queryset.filter(author=author)
+
+        is_public = self.cleaned_data.get("is_public")
+        if is_public and "is_public" not in exclude:
+            queryset = queryset.filter(is_public=is_public)
+
+        q = self.cleaned_data.get("q")
+        if q:
+            queryset = search.search(queryset, q)
+
+        tag = self.cleaned_data.get("tag")
+        if tag and "tag" not in exclude:
+            queryset = queryset.filter(tags__name=tag)
+
+        return queryset
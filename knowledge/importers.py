@@ -0,0 +1,76 @@
+"""ナレッジの一括取り込み
+
+タグはタグ名の配列かカンマ区切り、カテゴリは「親/子」形式のパス、
+作成者はユーザー名で指定する。
+"""
+
+from django.utils import timezone
+
+from common.importers import (
+    BulkImporter,
+    CategoryMap,
+    RowError,
+    TagMap,
+    boolean,
+    datetime_value,
+    names,
+    preserve_timestamps,
+    text,
+)
+from common.stats import invalidate_dashboard_stats
+from .models import Knowledge
+from . import search, similarity
+
+
+class KnowledgeImporter(BulkImporter):
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.tags = TagMap()
+        self.categories = CategoryMap()
+
+    def build(self, row):
+        created_at = datetime_value(row, "created_at", timezone.now())
+        try:
+            view_count = int(text(row, "view_count") or 0)
+        except ValueError:
+            raise RowError(f"view_count が数値ではありません: {row.get('view_count')}")
+        if view_count < 0:
+            raise RowError("view_count は0以上にしてください。")
+
+        knowledge = Knowledge(
+            title=text(row, "title", required=True, max_length=200),
+            content=text(row, "content", required=True),
+            author_id=self.user(text(row, "author"), "author", required=True),
+            is_public=boolean(row, "is_public") if "is_public" in row else True,
+            view_count=view_count,
+            created_at=created_at,
+            updated_at=datetime_value(row, "updated_at", created_at),
+        )
+        category = self.categories.parse(text(row, "category"))
+        return knowledge, names(row, "tags"), category
+
+    def save_batch(self, batch):
+        tag_ids = self.tags.resolve(
+            name for _, tag_names, _ in batch for name in tag_names
+        )
+        category_ids = self.categories.resolve(category for *_, category in batch)
+        knowledge_list = []
+        for knowledge, _, category in batch:
+            knowledge.category_id = category_ids.get(category)
+            knowledge_list.append(knowledge)
+        with preserve_timestamps(Knowledge):
+            Knowledge.objects.bulk_create(knowledge_list)
+        Knowledge.tags.through.objects.bulk_create(
+            [
+                Knowledge.tags.through(knowledge_id=knowledge.pk, tag_id=tag_ids[name])
+                for knowledge, tag_names, _ in batch
+                for name in tag_names
+            ],
+            batch_size=self.batch_size,
+        )
+        # bulk_create ではシグナルが呼ばれないので、検索インデックスと関連ナレッジのベクトルをここで更新する
+        search.update_index([knowledge.pk for knowledge in knowledge_list])
+        similarity.update_vectors([knowledge.pk for knowledge in knowledge_list])
+
+    def finish(self):
+        invalidate_dashboard_stats()
@@ -0,0 +1,27 @@
+from collections import Counter
+from datetime import date
+
+from common.jobqueue import handler
+from .counters import VIEW_COUNT_JOB, write_view_counts
+from . import search, similarity
+
+
+@handler(search.UPDATE_JOB, batch_size=1000)
+def update_search_index(payloads):
+    """溜まったナレッジ ID をまとめて1回で更新する"""
+    search.update_index(set().union(*payloads))
+
+
+@handler(similarity.UPDATE_JOB, batch_size=1000)
+def update_vectors(payloads):
+    similarity.update_vectors(set().union(*payloads))
+
+
+@handler(VIEW_COUNT_JOB, atomic=True, batch_size=1000)
+def add_view_counts(payloads):
+    """各ワーカーから届いた [[ナレッジID, 日付, 回数], ...] をまとめて加算する"""
+    pending = Counter()
+    for payload in payloads:
+        for pk, day, n in payload:
+            pending[pk, date.fromisoformat(day)] += n
+    write_view_counts(pending)
@@ -0,0 +1,7 @@
+from common.importers import ImportCommand
+from knowledge.importers import KnowledgeImporter
+
+
+class Command(ImportCommand):
+    help = "CSV / JSONL ファイルからナレッジをタグとともに一括で取り込みます"
+    importer_class = KnowledgeImporter
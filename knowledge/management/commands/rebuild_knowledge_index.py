@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from knowledge import search
+
+
+class Command(BaseCommand):
+    help = "ナレッジ全文検索インデックスを全件作り直します"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=1000, help="一度に登録する件数"
+        )
+
+    def handle(self, *args, **options):
+        if not search.fts5_available():
+            self.stderr.write("このデータベースでは全文検索インデックスを使用できません。")
+            return
+        count = search.rebuild_index(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"{count}件のナレッジを登録しました。"))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from knowledge import similarity
+
+
+class Command(BaseCommand):
+    help = "関連ナレッジの計算に使うベクトルを全件作り直します"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--batch-size", type=int, default=1000, help="一度に登録する件数"
+        )
+
+    def handle(self, *args, **options):
+        count = similarity.rebuild(batch_size=options["batch_size"])
+        self.stdout.write(self.style.SUCCESS(f"{count}件のナレッジを登録しました。"))
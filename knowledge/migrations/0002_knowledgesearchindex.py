@@ -0,0 +1,61 @@
+# Generated by Django 5.2.6 on 2026-10-18 20:32
+
+import common.search
+import django.db.models.deletion
+import unicodedata
+
+from django.db import migrations, models
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS knowledge_fts "
+        "USING fts5(title, content, tags, tokenize='trigram')"
+    )
+    Knowledge = apps.get_model("knowledge", "Knowledge")
+    rows = [
+        [pk] + [unicodedata.normalize("NFKC", value or "") for value in values]
+        for pk, *values in Knowledge.objects.values_list(
+            "pk", "title", "content", "tags"
+        ).iterator()
+    ]
+    with schema_editor.connection.cursor() as cursor:
+        cursor.executemany(
+            "INSERT INTO knowledge_fts (rowid, title, content, tags) "
+            "VALUES (%s, %s, %s, %s)",
+            rows,
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    schema_editor.execute("DROP TABLE IF EXISTS knowledge_fts")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KnowledgeSearchIndex',
+            fields=[
+                ('knowledge', models.OneToOneField(db_column='rowid', on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='search_index', serialize=False, to='knowledge.knowledge')),
+                ('document', common.search.FullTextField(db_column='knowledge_fts')),
+                ('title', models.TextField()),
+                ('content', models.TextField()),
+                ('tags', models.TextField()),
+                ('rank', models.FloatField()),
+            ],
+            options={
+                'db_table': 'knowledge_fts',
+                'managed': False,
+            },
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
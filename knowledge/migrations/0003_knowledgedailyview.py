@@ -0,0 +1,29 @@
+# Generated by Django 5.2.6 on 2026-10-18 20:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0002_knowledgesearchindex'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KnowledgeDailyView',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='日付')),
+                ('count', models.PositiveIntegerField(default=0, verbose_name='閲覧回数')),
+                ('knowledge', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_views', to='knowledge.knowledge', verbose_name='ナレッジ')),
+            ],
+            options={
+                'verbose_name': '日別閲覧回数',
+                'verbose_name_plural': '日別閲覧回数',
+                'ordering': ['-date'],
+                'constraints': [models.UniqueConstraint(fields=('knowledge', 'date'), name='knowledge_daily_view_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.6 on 2026-10-18 21:02
+
+import re
+
+from django.db import migrations, models
+
+TAG_SEPARATOR = re.compile(r"[,、，]")
+
+
+def split_tag_names(apps, schema_editor):
+    """カンマ区切りのタグ文字列を common.Tag に移し替える"""
+    Knowledge = apps.get_model("knowledge", "Knowledge")
+    Tag = apps.get_model("common", "Tag")
+    Through = Knowledge.tags.through
+    max_length = Tag._meta.get_field("name").max_length
+
+    names_by_knowledge = {}
+    for pk, tag_names in Knowledge.objects.exclude(tag_names="").values_list(
+        "pk", "tag_names"
+    ):
+        names = [name.strip()[:max_length] for name in TAG_SEPARATOR.split(tag_names)]
+        names_by_knowledge[pk] = list(dict.fromkeys(filter(None, names)))
+
+    all_names = {name for names in names_by_knowledge.values() for name in names}
+    Tag.objects.bulk_create(
+        [Tag(name=name) for name in sorted(all_names)], ignore_conflicts=True
+    )
+    tag_ids = dict(
+        Tag.objects.filter(name__in=all_names).values_list("name", "pk")
+    )
+    Through.objects.bulk_create(
+        [
+            Through(knowledge_id=pk, tag_id=tag_ids[name])
+            for pk, names in names_by_knowledge.items()
+            for name in names
+        ],
+        batch_size=1000,
+        ignore_conflicts=True,
+    )
+
+
+def join_tag_names(apps, schema_editor):
+    Knowledge = apps.get_model("knowledge", "Knowledge")
+    for knowledge in Knowledge.objects.prefetch_related("tags"):
+        knowledge.tag_names = ",".join(tag.name for tag in knowledge.tags.all())[:500]
+        knowledge.save(update_fields=["tag_names"])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0001_initial'),
+        ('knowledge', '0003_knowledgedailyview'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='knowledge',
+            old_name='tags',
+            new_name='tag_names',
+        ),
+        migrations.AddField(
+            model_name='knowledge',
+            name='tags',
+            field=models.ManyToManyField(blank=True, to='common.tag', verbose_name='タグ'),
+        ),
+        migrations.RunPython(split_tag_names, join_tag_names),
+        migrations.RemoveField(
+            model_name='knowledge',
+            name='tag_names',
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.6 on 2026-10-18 20:54
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('common', '0002_category_tree_index'),
+        ('inquiry', '0007_list_indexes'),
+        ('knowledge', '0004_tags_m2m'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='knowledge',
+            index=models.Index(fields=['updated_at'], name='knowledge_updated'),
+        ),
+        migrations.AddIndex(
+            model_name='knowledge',
+            index=models.Index(condition=models.Q(('is_public', True)), fields=['updated_at'], name='knowledge_public_updated'),
+        ),
+        migrations.AddIndex(
+            model_name='knowledge',
+            index=models.Index(condition=models.Q(('is_public', False)), fields=['updated_at'], name='knowledge_private_updated'),
+        ),
+        migrations.AddIndex(
+            model_name='knowledge',
+            index=models.Index(fields=['author', 'updated_at'], name='knowledge_author_updated'),
+        ),
+        migrations.AddIndex(
+            model_name='knowledge',
+            index=models.Index(fields=['category', 'updated_at'], name='knowledge_category_updated'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-18 21:19
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0005_list_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='KnowledgeVector',
+            fields=[
+                ('knowledge', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='vector', serialize=False, to='knowledge.knowledge', verbose_name='ナレッジ')),
+                ('terms', models.BinaryField(verbose_name='語')),
+                ('counts', models.BinaryField(verbose_name='出現回数')),
+                ('updated_at', models.DateTimeField(auto_now=True, db_index=True, verbose_name='更新日時')),
+            ],
+            options={
+                'verbose_name': 'ナレッジのベクトル',
+                'verbose_name_plural': 'ナレッジのベクトル',
+            },
+        ),
+    ]
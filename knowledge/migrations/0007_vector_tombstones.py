@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-18 22:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0006_knowledgevector'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='knowledgevector',
+            name='knowledge',
+            field=models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.DO_NOTHING, primary_key=True, related_name='vector', serialize=False, to='knowledge.knowledge', verbose_name='ナレッジ'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+import common.search
+from django.db import migrations
+
+
+def rebuild_search_tags(apps, schema_editor):
+    """tags カラムを m2m のタグ名（空白区切り）で作り直す
+
+    0004 でタグを common.Tag に移したとき、全文検索インデックスには移す前の
+    カンマ区切りの文字列が残っていた（0008 の2文字語インデックスもそれを写している）。
+    """
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    Knowledge = apps.get_model("knowledge", "Knowledge")
+    Through = Knowledge.tags.through
+    index = common.search.FTS5Table("knowledge_fts", ["title", "content", "tags"])
+    bigram_index = common.search.BigramTable("knowledge_bigram")
+    ids = list(Knowledge.objects.order_by("pk").values_list("pk", flat=True))
+    for start in range(0, len(ids), 1000):
+        batch = ids[start : start + 1000]
+        tags = {}
+        for knowledge_id, name in Through.objects.filter(
+            knowledge_id__in=batch
+        ).values_list("knowledge_id", "tag__name"):
+            tags.setdefault(knowledge_id, []).append(name)
+        rows = [
+            [pk, title, content, " ".join(tags.get(pk, []))]
+            for pk, title, content in Knowledge.objects.filter(
+                pk__in=batch
+            ).values_list("pk", "title", "content")
+        ]
+        index.replace(rows)
+        bigram_index.replace(rows)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('knowledge', '0008_knowledgebigramindex'),
+    ]
+
+    operations = [
+        migrations.RunPython(rebuild_search_tags, migrations.RunPython.noop),
+    ]
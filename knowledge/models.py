@@ -1,11 +1,29 @@
 from django.db import models
-from common.models import Category
+from django.db.models import Count
+from common.models import Category, Tag
+from common.search import FullTextField
 from inquiry.models import Inquiry
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
 
+class KnowledgeQuerySet(models.QuerySet):
+    def tag_counts(self, limit=30):
+        """絞り込み結果に付いているタグと件数を、件数の多い順に返す
+
+        中間テーブルを tag_id でまとめる1クエリで数える。
+        """
+        knowledge_ids = self.order_by().values("pk")
+        return list(
+            Knowledge.tags.through.objects.filter(knowledge_id__in=knowledge_ids)
+            .values("tag_id", "tag__name")
+            .annotate(count=Count("knowledge_id"))
+            .order_by("-count", "tag__name")
+            .values_list("tag__name", "count")[:limit]
+        )
+
+
 class Knowledge(models.Model):
     """ナレッジベース"""
 
@@ -30,18 +48,129 @@ class Knowledge(models.Model):
     created_at = models.DateTimeField("作成日時", auto_now_add=True)
     updated_at = models.DateTimeField("更新日時", auto_now=True)
 
-    tags = models.CharField(
-        "タグ", max_length=500, blank=True, help_text="カンマ区切りで入力"
-    )
+    tags = models.ManyToManyField(Tag, blank=True, verbose_name="タグ")
+
+    objects = KnowledgeQuerySet.as_manager()
 
     class Meta:
         verbose_name = "ナレッジ"
         verbose_name_plural = "ナレッジ"
         ordering = ["-updated_at"]
+        # 一覧は -updated_at, -id の順なので、絞り込みの列の後ろに updated_at を置く
+        indexes = [
+            models.Index(fields=["updated_at"], name="knowledge_updated"),
+            # is_public の条件は列そのもの（NOT is_public）で出力されるので、
+            # 複合インデックスではなく公開・非公開それぞれの部分インデックスにする
+            models.Index(
+                fields=["updated_at"],
+                condition=models.Q(is_public=True),
+                name="knowledge_public_updated",
+            ),
+            models.Index(
+                fields=["updated_at"],
+                condition=models.Q(is_public=False),
+                name="knowledge_private_updated",
+            ),
+            models.Index(
+                fields=["author", "updated_at"], name="knowledge_author_updated"
+            ),
+            models.Index(
+                fields=["category", "updated_at"], name="knowledge_category_updated"
+            ),
+        ]
 
     def __str__(self):
         return self.title
 
-    def increment_view_count(self):
-        self.view_count += 1
-        self.save(update_fields=["view_count"])
+
+class KnowledgeDailyView(models.Model):
+    """ナレッジの日別閲覧回数"""
+
+    knowledge = models.ForeignKey(
+        Knowledge,
+        on_delete=models.CASCADE,
+        related_name="daily_views",
+        verbose_name="ナレッジ",
+    )
+    date = models.DateField("日付")
+    count = models.PositiveIntegerField("閲覧回数", default=0)
+
+    class Meta:
+        verbose_name = "日別閲覧回数"
+        verbose_name_plural = "日別閲覧回数"
+        ordering = ["-date"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["knowledge", "date"], name="knowledge_daily_view_unique"
+            )
+        ]
+
+    def __str__(self):
+        return f"{self.knowledge} {self.date}: {self.count}"
+
+
+class KnowledgeVector(models.Model):
+    """関連ナレッジを探すための語と出現回数（公開ナレッジのみ）
+
+    knowledge.similarity が作る。terms は語 ID（uint32）、counts は回数（uint16）の配列。
+    非公開・削除したナレッジの行は terms を空にして残す（墓標）ので、
+    ナレッジを削除しても CASCADE では消さない。
+    """
+
+    knowledge = models.OneToOneField(
+        Knowledge,
+        on_delete=models.DO_NOTHING,
+        db_constraint=False,
+        primary_key=True,
+        related_name="vector",
+        verbose_name="ナレッジ",
+    )
+    terms = models.BinaryField("語")
+    counts = models.BinaryField("出現回数")
+    updated_at = models.DateTimeField("更新日時", auto_now=True, db_index=True)
+
+    class Meta:
+        verbose_name = "ナレッジのベクトル"
+        verbose_name_plural = "ナレッジのベクトル"
+
+    def __str__(self):
+        return str(self.knowledge_id)
+
+
+class KnowledgeSearchIndex(models.Model):
+    """ナレッジ全文検索インデックス（SQLite FTS5 仮想テーブル）"""
+
+    knowledge = models.OneToOneField(
+        Knowledge,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_column="rowid",
+        related_name="search_index",
+    )
+    document = FullTextField(db_column="knowledge_fts")
+    title = models.TextField()
+    content = models.TextField()
+    tags = models.TextField()
+    rank = models.FloatField()
+
+    class Meta:
+        managed = False
+        db_table = "knowledge_fts"
+
+
+class KnowledgeBigramIndex(models.Model):
+    """2文字以下の語を引くための補助インデックス（common.search.BigramTable）"""
+
+    knowledge = models.OneToOneField(
+        Knowledge,
+        on_delete=models.DO_NOTHING,
+        primary_key=True,
+        db_column="rowid",
+        related_name="bigram_index",
+    )
+    document = FullTextField(db_column="knowledge_bigram")
+    bigrams = models.TextField()
+
+    class Meta:
+        managed = False
+        db_table = "knowledge_bigram"
@@ -0,0 +1,130 @@
+"""ナレッジ全文検索インデックスの更新と検索"""
+
+from collections import defaultdict
+
+from django.db.models import Q
+
+from common import jobqueue
+from common.search import (
+    BigramTable,
+    FTS5Table,
+    Highlight,
+    Snippet,
+    build_bigram_query,
+    build_match_query,
+    fts5_available,
+    normalize_query,
+)
+from .models import Knowledge, KnowledgeBigramIndex, KnowledgeSearchIndex
+
+index = FTS5Table(KnowledgeSearchIndex._meta.db_table, ["title", "content", "tags"])
+bigram_index = BigramTable(KnowledgeBigramIndex._meta.db_table)
+
+
+def _rows(ids):
+    """ナレッジとタグをそれぞれ1クエリで集めて行を組み立てる"""
+    tags = defaultdict(list)
+    for knowledge_id, name in Knowledge.tags.through.objects.filter(
+        knowledge_id__in=ids
+    ).values_list("knowledge_id", "tag__name"):
+        tags[knowledge_id].append(name)
+
+    knowledge_list = Knowledge.objects.filter(pk__in=ids).values_list(
+        "pk", "title", "content"
+    )
+    return [
+        [pk, title, content, " ".join(tags[pk])]
+        for pk, title, content in knowledge_list
+    ]
+
+
+def update_index(ids):
+    """指定したナレッジのインデックスを作り直す（削除済みのものは取り除く）"""
+    ids = set(ids)
+    if not ids or not fts5_available():
+        return
+    rows = _rows(ids)
+    removed = ids - {row[0] for row in rows}
+    for table in (index, bigram_index):
+        table.replace(rows)
+        table.delete(removed)
+
+
+UPDATE_JOB = "knowledge.update_search_index"
+
+
+def schedule_update(ids):
+    """インデックスの更新をジョブに回す
+
+    溜まったジョブはワーカーが ID をまとめて1回で処理するので、
+    一括削除などで同じナレッジが何度も通知されても、確定時点の内容で1回ずつ作り直すだけで済む。
+    """
+    ids = sorted(set(ids))
+    if ids:
+        jobqueue.enqueue(UPDATE_JOB, ids)
+
+
+def rebuild_index(batch_size=1000):
+    """インデックスを全件作り直す。登録件数を返す"""
+    if not fts5_available():
+        return 0
+    index.clear()
+    bigram_index.clear()
+    count = 0
+    ids = Knowledge.objects.order_by("pk").values_list("pk", flat=True)
+    batch = []
+    for pk in ids.iterator(chunk_size=batch_size):
+        batch.append(pk)
+        if len(batch) >= batch_size:
+            count += _replace(_rows(batch))
+            batch = []
+    count += _replace(_rows(batch))
+    index.optimize()
+    bigram_index.optimize()
+    return count
+
+
+def _replace(rows):
+    bigram_index.replace(rows)
+    return index.replace(rows)
+
+
+def search(queryset, q):
+    """キーワードで絞り込み、関連度（BM25）順に並べる
+
+    インデックスで引けた場合は search_title / search_snippet に
+    一致箇所をマークした文字列を付与する。
+    """
+    terms = normalize_query(q)
+    if not terms:
+        return queryset
+
+    if not fts5_available():
+        for term in terms:
+            queryset = queryset.filter(
+                Q(title__icontains=term)
+                | Q(content__icontains=term)
+                | Q(tags__name__icontains=term)
+            ).distinct()
+        return queryset
+
+    match, short_terms = build_match_query(terms)
+    bigram_match, short_terms = build_bigram_query(short_terms)
+    if bigram_match:
+        queryset = queryset.filter(bigram_index__document__match=bigram_match)
+    for term in short_terms:
+        queryset = queryset.filter(
+            Q(search_index__title__contains=term)
+            | Q(search_index__content__contains=term)
+            | Q(search_index__tags__contains=term)
+        )
+    if match:
+        queryset = (
+            queryset.filter(search_index__document__match=match)
+            .annotate(
+                search_title=Highlight("search_index__document", 0),
+                search_snippet=Snippet("search_index__document", 1),
+            )
+            .order_by("search_index__rank", "-updated_at")
+        )
+    return queryset
@@ -0,0 +1,56 @@
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from common.models import Tag
+from .models import Knowledge
+from . import search, similarity
+
+
+@receiver(post_save, sender=Knowledge)
+def update_search_index(sender, instance, update_fields=None, **kwargs):
+    """検索対象のカラムが保存されたときだけインデックスを更新する"""
+    if update_fields is not None and not {"title", "content"} & set(update_fields):
+        return
+    search.schedule_update([instance.pk])
+
+
+@receiver(post_save, sender=Knowledge)
+def update_vector(sender, instance, update_fields=None, **kwargs):
+    """関連ナレッジに使うベクトルを作り直す"""
+    fields = {"title", "content", "is_public"}
+    if update_fields is not None and not fields & set(update_fields):
+        return
+    similarity.schedule_update([instance.pk])
+
+
+@receiver(post_delete, sender=Knowledge)
+def remove_search_index(sender, instance, **kwargs):
+    search.schedule_update([instance.pk])
+
+
+@receiver(post_delete, sender=Knowledge)
+def remove_vector(sender, instance, **kwargs):
+    # ベクトルを墓標にし、各プロセスのインデックスから取り除く
+    similarity.schedule_update([instance.pk])
+
+
+@receiver(m2m_changed, sender=Knowledge.tags.through)
+def update_search_index_for_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == "pre_clear" and reverse:
+        # タグ側から clear() される場合は、外れる前に対象のナレッジを控えておく
+        search.schedule_update(
+            Knowledge.objects.filter(tags=instance).values_list("pk", flat=True)
+        )
+    elif action in ("post_add", "post_remove", "post_clear"):
+        search.schedule_update((pk_set or []) if reverse else [instance.pk])
+
+
+@receiver(post_save, sender=Tag)
+@receiver(pre_delete, sender=Tag)
+def update_search_index_for_tag(sender, instance, created=False, **kwargs):
+    """タグ名の変更・削除を、そのタグが付いたナレッジに反映する"""
+    if created:
+        return
+    search.schedule_update(
+        Knowledge.objects.filter(tags=instance).values_list("pk", flat=True)
+    )
@@ -0,0 +1,395 @@
+"""問い合わせに近い公開ナレッジを探す
+
+ナレッジのタイトル・内容を文字 bigram に分け、語の ID（CRC32）と出現回数を
+KnowledgeVector に保存しておく（ナレッジの保存後にジョブで作り直す）。
+各プロセスは保存済みのベクトルから TF-IDF の転置インデックスを作って保持し、
+問い合わせの bigram と重なるナレッジだけをコサイン類似度で順位付けする。
+類似度の計算は numpy で行い、インデックスのロックは対象の語の転置リストを
+写し取る間だけ持つ（計算中に他のスレッドを待たせない）。
+
+ベクトルを更新するとキャッシュの版（VERSION_KEY）が変わる。各プロセスは版が変わったときだけ
+更新日時が新しいベクトルを読み、保持しているインデックスに反映する
+（全件を読み直すのはプロセスで最初に使うときだけ）。非公開・削除したナレッジは
+語が空のベクトル（墓標）を TOMBSTONE_TTL の間残し、更新日時で取り除けるようにする。
+
+結果は問い合わせごとに RELATED_KNOWLEDGE_TTL 秒キャッシュする。
+"""
+
+import math
+import re
+import threading
+import uuid
+import zlib
+from array import array
+from collections import Counter
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+from common import jobqueue
+from common.search import normalize_text
+from .models import Knowledge, KnowledgeVector
+
+UPDATE_JOB = "knowledge.update_vectors"
+
+VERSION_KEY = "knowledge:vectors_version"
+
+# 他のプロセスが書き込んだベクトルを取りこぼさないよう、最後に読んだ更新日時より少し前から読む
+SYNC_OVERLAP = timedelta(seconds=5)
+
+# 墓標を残す期間。これより前から更新を読んでいないプロセスは全件を読み直す
+TOMBSTONE_TTL = timedelta(days=1)
+
+# 語として扱う文字の並び（記号・空白で区切る）
+WORD = re.compile(r"\w+")
+
+# タイトルの語は内容より重く数える
+TITLE_WEIGHT = 3
+
+# 出現回数は array("H") に入る値までにする
+MAX_COUNT = 0xFFFF
+
+_lock = threading.Lock()
+_index = None
+_version = None
+_synced_at = None
+# 反映したベクトルの更新日時 {ナレッジ ID: 更新日時}
+_updated_at = {}
+
+
+def terms(text):
+    """文字 bigram（1文字だけの語はその文字）の出現回数 {語 ID: 回数}"""
+    counts = Counter()
+    for word in WORD.findall(normalize_text(text).lower()):
+        if len(word) == 1:
+            counts[zlib.crc32(word.encode())] += 1
+            continue
+        for i in range(len(word) - 1):
+            counts[zlib.crc32(word[i : i + 2].encode())] += 1
+    return counts
+
+
+def document_terms(title, content):
+    counts = terms(content)
+    for term, n in terms(title).items():
+        counts[term] += n * TITLE_WEIGHT
+    return counts
+
+
+def build_vector(knowledge):
+    """語 ID の昇順に並べた (語 ID の配列, 回数の配列) のバイト列"""
+    counts = document_terms(knowledge.title, knowledge.content)
+    term_ids = sorted(counts)
+    return (
+        array("I", term_ids).tobytes(),
+        array("H", [min(counts[term], MAX_COUNT) for term in term_ids]).tobytes(),
+    )
+
+
+def update_vectors(ids):
+    """ナレッジのベクトルを作り直す。非公開・削除済みのものは墓標にする。登録件数を返す"""
+    ids = set(ids)
+    vectors = []
+    for knowledge in Knowledge.objects.filter(pk__in=ids, is_public=True).only(
+        "pk", "title", "content"
+    ):
+        term_ids, counts = build_vector(knowledge)
+        vectors.append(
+            KnowledgeVector(knowledge_id=knowledge.pk, terms=term_ids, counts=counts)
+        )
+    removed = ids - {vector.knowledge_id for vector in vectors}
+    tombstones = [
+        KnowledgeVector(knowledge_id=pk, terms=b"", counts=b"")
+        for pk in KnowledgeVector.objects.filter(knowledge_id__in=removed)
+        .exclude(terms=b"")
+        .values_list("knowledge_id", flat=True)
+    ]
+    with transaction.atomic():
+        KnowledgeVector.objects.filter(knowledge_id__in=ids).delete()
+        KnowledgeVector.objects.bulk_create(vectors + tombstones)
+        KnowledgeVector.objects.filter(
+            terms=b"", updated_at__lt=timezone.now() - TOMBSTONE_TTL
+        ).delete()
+        transaction.on_commit(bump_version)
+    return len(vectors)
+
+
+def rebuild(batch_size=1000):
+    """すべての公開ナレッジのベクトルを作り直す。登録件数を返す"""
+    stale = (
+        KnowledgeVector.objects.exclude(terms=b"")
+        .exclude(knowledge_id__in=Knowledge.objects.filter(is_public=True).values("pk"))
+        .values_list("knowledge_id", flat=True)
+    )
+    stale = list(stale)
+    for i in range(0, len(stale), batch_size):
+        update_vectors(stale[i : i + batch_size])
+    count = 0
+    ids = Knowledge.objects.filter(is_public=True).order_by("pk")
+    batch = []
+    for pk in ids.values_list("pk", flat=True).iterator(chunk_size=batch_size):
+        batch.append(pk)
+        if len(batch) >= batch_size:
+            count += update_vectors(batch)
+            batch = []
+    count += update_vectors(batch)
+    return count
+
+
+def schedule_update(ids):
+    """ベクトルの更新をジョブに回す"""
+    ids = sorted(set(ids))
+    if ids:
+        jobqueue.enqueue(UPDATE_JOB, ids)
+
+
+def bump_version():
+    """各プロセスにベクトルの更新を知らせる"""
+    cache.set(VERSION_KEY, uuid.uuid4().hex, None)
+
+
+class SimilarityIndex:
+    """保存済みのベクトルから作る TF-IDF の転置インデックス
+
+    語ごとに (ナレッジの番号の配列, 重みの配列) を持つ。重みは出現回数から求めた値を
+    ベクトルの長さで割ったもので、IDF は検索時に掛ける。
+    ナレッジごとの語は重みの大きい RELATED_KNOWLEDGE_MAX_TERMS 個までに絞る。
+
+    add() / remove() でナレッジ単位に反映できる。取り除いたナレッジの番号は
+    転置リストに残したまま無効にし（ids を -1 にする）、無効な番号が有効なものより
+    多くなったら詰め直す。語の絞り込みとベクトルの長さは追加した時点の IDF で
+    決めるので、ナレッジが増減すると少しずつずれる（プロセスを起動し直すと全件から作り直される）。
+    """
+
+    def __init__(self, rows, max_terms):
+        self.max_terms = max_terms
+        self.frequency = Counter()
+        self.terms = {}
+        # 番号 → ナレッジ ID（無効にした番号は -1）
+        self.ids = array("q")
+        # ナレッジ ID → (番号, 語 ID の配列, 重みの配列)
+        self.documents = {}
+        self.removed = 0
+        self.postings = {}
+
+        documents = []
+        for knowledge_id, term_bytes, count_bytes in rows:
+            if not term_bytes:
+                continue
+            term_ids, counts = self._decode(term_bytes, count_bytes)
+            documents.append((knowledge_id, term_ids, counts))
+            self.frequency.update(term_ids)
+            self.terms[knowledge_id] = term_ids
+        # 全件の IDF がそろってから語を絞る
+        for knowledge_id, term_ids, counts in documents:
+            self._insert(knowledge_id, term_ids, counts)
+
+    @staticmethod
+    def _decode(term_bytes, count_bytes):
+        term_ids = array("I")
+        term_ids.frombytes(term_bytes)
+        counts = array("H")
+        counts.frombytes(count_bytes)
+        return term_ids, counts
+
+    def __len__(self):
+        return len(self.documents)
+
+    def idf(self, term):
+        return math.log((len(self.terms) + 1) / (self.frequency[term] + 1)) + 1
+
+    def add(self, knowledge_id, term_bytes, count_bytes):
+        """ナレッジを追加する（登録済みなら置き換える。語が空なら取り除く）"""
+        self.remove(knowledge_id)
+        if not term_bytes:
+            return
+        term_ids, counts = self._decode(term_bytes, count_bytes)
+        self.frequency.update(term_ids)
+        self.terms[knowledge_id] = term_ids
+        self._insert(knowledge_id, term_ids, counts)
+
+    def remove(self, knowledge_id):
+        term_ids = self.terms.pop(knowledge_id, None)
+        if term_ids is None:
+            return
+        self.frequency.subtract(term_ids)
+        for term in term_ids:
+            if self.frequency[term] <= 0:
+                del self.frequency[term]
+        document = self.documents.pop(knowledge_id, None)
+        if document is None:
+            return
+        self.ids[document[0]] = -1
+        self.removed += 1
+        if self.removed > len(self.documents):
+            self.compact()
+
+    def compact(self):
+        """無効にした番号を転置リストから除き、番号を振り直す"""
+        documents = self.documents
+        self.ids = array("q")
+        self.documents = {}
+        self.removed = 0
+        self.postings = {}
+        for knowledge_id, (_, selected, values) in documents.items():
+            self._append(knowledge_id, selected, values)
+
+    def _insert(self, knowledge_id, term_ids, counts):
+        # (重み, 出現回数から求めた値, 語 ID)
+        weights = sorted(
+            (
+                ((1 + math.log(n)) * self.idf(term), 1 + math.log(n), term)
+                for term, n in zip(term_ids, counts)
+            ),
+            reverse=True,
+        )[: self.max_terms]
+        norm = math.sqrt(sum(weight * weight for weight, _, _ in weights))
+        if not norm:
+            return
+        self._append(
+            knowledge_id,
+            array("I", [term for *_, term in weights]),
+            array("f", [tf / norm for _, tf, _ in weights]),
+        )
+
+    def _append(self, knowledge_id, selected, values):
+        number = len(self.ids)
+        self.ids.append(knowledge_id)
+        self.documents[knowledge_id] = (number, selected, values)
+        for term, value in zip(selected, values):
+            if term not in self.postings:
+                self.postings[term] = (array("I"), array("f"))
+            numbers, term_values = self.postings[term]
+            numbers.append(number)
+            term_values.append(value)
+
+    def snapshot(self, counts):
+        """counts（{語 ID: 回数}）の類似度の計算に使う値を写し取る（ロックを持って呼ぶ）
+
+        (番号 → ナレッジ ID の配列, [(番号の配列, 重みの配列), ...]) を返す。
+        """
+        idf = {term: self.idf(term) for term in counts if term in self.postings}
+        weights = {term: (1 + math.log(counts[term])) * idf[term] for term in idf}
+        norm = math.sqrt(sum(weight * weight for weight in weights.values()))
+        postings = []
+        if norm:
+            for term, weight in weights.items():
+                # 問い合わせ側の重みと、ナレッジ側の IDF をまとめて掛ける
+                numbers, values = self.postings[term]
+                postings.append(
+                    (
+                        np.array(numbers, dtype=np.intp),
+                        np.array(values, dtype=np.float64) * (weight / norm * idf[term]),
+                    )
+                )
+        return np.array(self.ids, dtype=np.int64), postings
+
+    @staticmethod
+    def rank(snapshot, limit, min_score=0.0):
+        """snapshot() の値から [(ナレッジ ID, 類似度), ...] を類似度の高い順に返す"""
+        ids, postings = snapshot
+        if not postings:
+            return []
+        scores = np.zeros(len(ids))
+        for numbers, values in postings:
+            # 1つの語の転置リストに同じ番号は1度しか出ない
+            scores[numbers] += values
+        scores[ids < 0] = 0
+        candidates = np.flatnonzero((scores > 0) & (scores >= min_score))
+        if len(candidates) > limit:
+            top = np.argpartition(-scores[candidates], limit - 1)[:limit]
+            candidates = candidates[top]
+        candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+        return [
+            (int(ids[number]), round(float(scores[number]), 4))
+            for number in candidates
+        ]
+
+    def query(self, counts, limit, min_score=0.0):
+        """[(ナレッジ ID, 類似度), ...] を類似度の高い順に返す"""
+        return self.rank(self.snapshot(counts), limit, min_score)
+
+
+def index_version():
+    """ベクトルの版（キャッシュが消えていたら新しく作る）"""
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, uuid.uuid4().hex, None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+def _refresh():
+    """プロセス内の転置インデックスに、他のプロセスでの更新を反映する（_lock を持って呼ぶ）"""
+    global _index, _version, _synced_at, _updated_at
+
+    version = index_version()
+    if _index is not None and _version == version:
+        return _index
+
+    # 版を読んだ後に書き込まれたベクトルは、次の版で読む
+    rows = KnowledgeVector.objects.values_list(
+        "knowledge_id", "terms", "counts", "updated_at"
+    )
+    since = _synced_at - SYNC_OVERLAP if _synced_at is not None else None
+    # 墓標が消えているかもしれないほど前から読んでいなければ、全件を読み直す
+    if _index is None or since is None or since < timezone.now() - TOMBSTONE_TTL:
+        rows = list(rows.exclude(terms=b""))
+        _index = SimilarityIndex(
+            [row[:3] for row in rows], settings.RELATED_KNOWLEDGE_MAX_TERMS
+        )
+        _updated_at = {row[0]: row[3] for row in rows}
+    else:
+        rows = list(rows.filter(updated_at__gte=since))
+        for knowledge_id, terms, counts, updated_at in rows:
+            # 重ねて読んだ範囲のうち、反映済みのものは飛ばす
+            if _updated_at.get(knowledge_id) == updated_at:
+                continue
+            # 墓標（非公開・削除したナレッジ）は add() で取り除かれる
+            _index.add(knowledge_id, terms, counts)
+            _updated_at[knowledge_id] = updated_at
+    _synced_at = max((row[3] for row in rows), default=_synced_at)
+    _version = version
+    return _index
+
+
+def get_index():
+    """プロセス内の転置インデックスを返す。ベクトルが変わっていれば反映する"""
+    with _lock:
+        return _refresh()
+
+
+def related_knowledge_ids(inquiry, limit=None):
+    """問い合わせに近い公開ナレッジ [(ナレッジ ID, 類似度), ...]"""
+    limit = limit or settings.RELATED_KNOWLEDGE_LIMIT
+    key = f"knowledge:related:{inquiry.pk}:{inquiry.updated_at.timestamp()}:{limit}"
+    related = cache.get(key)
+    if related is None:
+        counts = document_terms(inquiry.title, inquiry.content)
+        # 他のスレッドが反映している間は写し取らない。計算はロックを外してから行う
+        with _lock:
+            snapshot = _refresh().snapshot(counts)
+        related = SimilarityIndex.rank(
+            snapshot, limit, settings.RELATED_KNOWLEDGE_MIN_SCORE
+        )
+        cache.set(key, related, settings.RELATED_KNOWLEDGE_TTL)
+    return related
+
+
+def related_knowledge(inquiry, limit=None):
+    """問い合わせに近い公開ナレッジ。各ナレッジの similarity に類似度を入れる"""
+    related = related_knowledge_ids(inquiry, limit)
+    # キャッシュした後に非公開・削除されたものは除く
+    knowledge = Knowledge.objects.filter(is_public=True).only(
+        "pk", "title", "updated_at", "view_count"
+    ).in_bulk([pk for pk, _ in related])
+    result = []
+    for pk, score in related:
+        if pk in knowledge:
+            knowledge[pk].similarity = score
+            result.append(knowledge[pk])
+    return result
@@ -1,3 +1,575 @@
-from django.test import TestCase
+import io
+import shutil
+import tempfile
+import threading
+from unittest import mock, skipUnless
 
-# Create your tests here.
+from django.contrib.auth import get_user_model
+from django.db import connection
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+
+from common.models import Category, Tag
+from common.pagination import KeysetPaginator
+from common.search import MARK_END, MARK_START
+from common.testing import QueryPlanTestMixin
+from .forms import KnowledgeForm, KnowledgeSearchForm
+from inquiry.models import Inquiry
+from .models import Knowledge, KnowledgeVector
+from . import counters, facets, search, similarity
+
+User = get_user_model()
+
+
+@skipUnless(connection.vendor == "sqlite", "SQLite の実行計画を確かめるテスト")
+class KnowledgeListQueryPlanTests(QueryPlanTestMixin, TestCase):
+    """ナレッジ一覧の絞り込みごとに、インデックスで引けていることを確かめる"""
+
+    ordering = ("-updated_at", "-pk")
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("staff", is_staff=True)
+        cls.root = Category.objects.create(name="製品")
+        cls.child = Category.objects.create(name="会員サイト", parent=cls.root)
+        tag = Tag.objects.create(name="認証")
+        for i in range(3):
+            for is_public in (True, False):
+                knowledge = Knowledge.objects.create(
+                    title=f"ナレッジ{i}",
+                    content="ログインできない場合の対処方法",
+                    category=cls.child,
+                    author=cls.user,
+                    is_public=is_public,
+                )
+                knowledge.tags.add(tag)
+
+    def assertListUsesIndex(self, data, indexes, search=True, sorted_by_index=True):
+        form = KnowledgeSearchForm(data)
+        self.assertTrue(form.is_valid(), form.errors)
+        queryset = form.filter_queryset(
+            Knowledge.objects.select_related("category", "author")
+        )
+        paginator = KeysetPaginator(queryset, 1, self.ordering)
+        first = paginator.page()
+        self.assertTrue(first.has_next())
+        for func in (
+            paginator.page,
+            lambda: paginator.page(first.next_cursor),
+            lambda: paginator.page(paginator.page(first.next_cursor).previous_cursor),
+        ):
+            self.assertIndexedPlans(
+                self.capture_plans(func),
+                "knowledge_knowledge",
+                indexes,
+                search=search,
+                sorted_by_index=sorted_by_index,
+            )
+        self.assertIndexedPlans(
+            self.capture_plans(lambda: paginator.count),
+            "knowledge_knowledge",
+            None,
+            search=search,
+        )
+
+    def test_unfiltered(self):
+        self.assertListUsesIndex({}, ["knowledge_updated"], search=False)
+
+    def test_public(self):
+        # 部分インデックスには公開のナレッジしかないので、先頭から順にたどればよい
+        self.assertListUsesIndex(
+            {"is_public": "True"}, ["knowledge_public_updated"], search=False
+        )
+
+    def test_private(self):
+        self.assertListUsesIndex(
+            {"is_public": "False"}, ["knowledge_private_updated"], search=False
+        )
+
+    def test_author(self):
+        self.assertListUsesIndex(
+            {"author": self.user.pk}, ["knowledge_author_updated"]
+        )
+
+    def test_author_and_public(self):
+        self.assertListUsesIndex(
+            {"author": self.user.pk, "is_public": "True"},
+            ["knowledge_author_updated", "knowledge_public_updated"],
+        )
+
+    def test_category(self):
+        self.assertListUsesIndex(
+            {"category": self.child.pk}, ["knowledge_category_updated"]
+        )
+
+    def test_category_with_subcategories(self):
+        # 複数カテゴリにまたがるので並べ替えは必要になるが、全件走査はしない
+        self.assertListUsesIndex(
+            {"category": self.root.pk, "include_subcategories": "on"},
+            None,
+            sorted_by_index=False,
+        )
+
+    def test_tag(self):
+        # タグから中間テーブルをたどり、ナレッジは主キーで引く
+        self.assertListUsesIndex({"tag": "認証"}, None, sorted_by_index=False)
+
+
+@skipUnless(connection.vendor == "sqlite", "FTS5 の全文検索を確かめるテスト")
+@override_settings(JOBS_EAGER=True)
+class KnowledgeSearchTests(TestCase):
+    """全文検索の絞り込み・並び順・一致箇所の表示と、短い語の検索を確かめる"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("staff", is_staff=True)
+
+    def create(self, title, content):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Knowledge.objects.create(title=title, content=content, author=self.user)
+
+    def search(self, q):
+        with CaptureQueriesContext(connection) as queries:
+            results = list(search.search(Knowledge.objects.all(), q))
+        return results, queries[-1]["sql"]
+
+    def test_ranks_and_highlights_matches(self):
+        once = self.create("請求書の再発行", "パスワードの再設定は設定画面から行います")
+        twice = self.create("パスワードの再設定", "パスワードを忘れた場合は再設定します")
+        self.create("請求書の送付先", "送付先は設定画面で変更できます")
+
+        results, sql = self.search("パスワード 再設定")
+        self.assertEqual(results, [twice, once])
+        self.assertNotIn("LIKE", sql)
+        self.assertEqual(
+            results[0].search_title,
+            f"{MARK_START}パスワード{MARK_END}の{MARK_START}再設定{MARK_END}",
+        )
+
+    def test_short_terms_use_the_bigram_index(self):
+        login = self.create("ログインできない", "会員サイトに入れない")
+        billing = self.create("請求書の再発行", "郵送で届きます")
+
+        for q, expected in [
+            ("ログ", [login]),
+            ("請求 郵送", [billing]),
+            ("す", [billing]),
+            ("ない", [login]),
+            ("い 書", []),
+        ]:
+            with self.subTest(q=q):
+                results, sql = self.search(q)
+                self.assertEqual(results, expected)
+                self.assertNotIn("LIKE", sql)
+
+    def test_short_terms_with_symbols_fall_back_to_partial_match(self):
+        knowledge = self.create("C# の設定", "接続文字列を変更する")
+        results, sql = self.search("C#")
+        self.assertEqual(results, [knowledge])
+        self.assertIn("LIKE", sql)
+
+    def test_index_follows_edits_and_deletion(self):
+        knowledge = self.create("ログインできない", "会員サイトに入れない")
+        knowledge.title = "請求書の再発行"
+        with self.captureOnCommitCallbacks(execute=True):
+            knowledge.save()
+        self.assertEqual(self.search("ログイン")[0], [])
+        self.assertEqual(self.search("ログ")[0], [])
+        self.assertEqual(self.search("請求")[0], [knowledge])
+
+        with self.captureOnCommitCallbacks(execute=True):
+            knowledge.delete()
+        self.assertEqual(self.search("請求書")[0], [])
+        self.assertEqual(self.search("請求")[0], [])
+
+    def test_rebuild_restores_both_indexes(self):
+        knowledge = self.create("ログインできない", "会員サイトに入れない")
+        search.index.clear()
+        search.bigram_index.clear()
+        self.assertEqual(search.rebuild_index(), 1)
+        self.assertEqual(self.search("ログイン")[0], [knowledge])
+        self.assertEqual(self.search("ログ")[0], [knowledge])
+
+
+class KnowledgeImportTests(TestCase):
+    """CSV の取り込みで、タグ・カテゴリ・日時と検索インデックスが揃うことを確かめる"""
+
+    csv = (
+        "title,content,author,tags,category,is_public,view_count,created_at\n"
+        "パスワードの再設定,設定画面から再設定します,staff,\"ログイン,会員\",製品/会員サイト,1,5,"
+        "2026-01-05T09:00:00+09:00\n"
+        "社内手順,非公開の手順です,,手順,,0,,\n"
+        "閲覧数が不正,内容,staff,,,1,-1,\n"
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("staff", is_staff=True)
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        self.path = f"{directory}/knowledge.csv"
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write(self.csv)
+
+    def test_imports_csv(self):
+        stderr = io.StringIO()
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command(
+                "import_knowledge",
+                self.path,
+                default_user="staff",
+                stdout=io.StringIO(),
+                stderr=stderr,
+            )
+        self.assertIn("4行目", stderr.getvalue())
+
+        knowledge = Knowledge.objects.get(title="パスワードの再設定")
+        self.assertEqual(
+            (knowledge.author, knowledge.is_public, knowledge.view_count),
+            (self.user, True, 5),
+        )
+        self.assertEqual(knowledge.category.parent.name, "製品")
+        self.assertEqual(
+            sorted(knowledge.tags.values_list("name", flat=True)), ["ログイン", "会員"]
+        )
+        self.assertEqual(knowledge.created_at.isoformat(), "2026-01-05T00:00:00+00:00")
+        private = Knowledge.objects.get(title="社内手順")
+        self.assertEqual((private.author, private.is_public), (self.user, False))
+        self.assertEqual(Knowledge.objects.count(), 2)
+        if connection.vendor == "sqlite":
+            self.assertEqual(
+                list(search.search(Knowledge.objects.all(), "再設定")), [knowledge]
+            )
+        self.assertTrue(KnowledgeVector.objects.filter(knowledge=knowledge).exists())
+
+
+@override_settings(JOBS_EAGER=True)
+class RelatedKnowledgeTests(TestCase):
+    """問い合わせに近い公開ナレッジが上位に来ることを確かめる"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("staff", is_staff=True)
+
+    def setUp(self):
+        # 他のテストで作ったプロセス内のインデックスを使わない
+        self.enterContext(
+            mock.patch.multiple(
+                similarity, _index=None, _version=None, _synced_at=None, _updated_at={}
+            )
+        )
+
+    def create(self, title, content, is_public=True):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Knowledge.objects.create(
+                title=title, content=content, author=self.user, is_public=is_public
+            )
+
+    def test_ranks_similar_public_knowledge(self):
+        password = self.create("パスワードの再設定", "再設定メールのリンクから変更します")
+        self.create("請求書の再発行", "請求書は管理画面から再発行できます")
+        self.create("パスワードの変更", "非公開の手順", is_public=False)
+        inquiry = Inquiry.objects.create(
+            title="パスワードを再設定できない",
+            content="再設定メールが届きません",
+            customer_name="佐藤 太郎",
+            customer_email="sato@example.com",
+        )
+        related = similarity.related_knowledge(inquiry)
+        self.assertEqual(related[0], password)
+        self.assertTrue(all(knowledge.is_public for knowledge in related))
+
+    def test_applies_changes_without_rebuilding(self):
+        password = self.create("パスワードの再設定", "再設定メールのリンクから変更します")
+        billing = self.create("請求書の再発行", "請求書は管理画面から再発行できます")
+        index = similarity.get_index()
+        # 版が変わらなければデータベースを読まない
+        with self.assertNumQueries(0):
+            self.assertIs(similarity.get_index(), index)
+
+        billing.content = "パスワードの再設定メールが届かない場合の請求書の確認"
+        with self.captureOnCommitCallbacks(execute=True):
+            billing.save()
+        self.create("ログインできない", "パスワードを再設定してください")
+        with self.captureOnCommitCallbacks(execute=True):
+            password.delete()
+        self.assertIs(similarity.get_index(), index)
+
+        rows = KnowledgeVector.objects.values_list("knowledge_id", "terms", "counts")
+        rebuilt = similarity.SimilarityIndex(rows, 200)
+        query = similarity.document_terms("パスワードを再設定したい", "メールが届きません")
+        self.assertEqual(len(index), 2)
+        # 追加した時点の IDF で正規化しているので、類似度は作り直したものと少しずれる
+        self.assertEqual(
+            [pk for pk, _ in index.query(query, 5)],
+            [pk for pk, _ in rebuilt.query(query, 5)],
+        )
+
+    def test_deleted_knowledge_leaves_a_tombstone(self):
+        knowledge = self.create("パスワードの再設定", "再設定メールのリンクから変更します")
+        self.create("請求書の再発行", "請求書は管理画面から再発行できます")
+        index = similarity.get_index()
+        pk = knowledge.pk
+        with self.captureOnCommitCallbacks(execute=True):
+            knowledge.delete()
+        self.assertEqual(KnowledgeVector.objects.get(knowledge_id=pk).terms, b"")
+        # 更新されたベクトルだけを読む（全件の ID は読み直さない）
+        with self.assertNumQueries(1):
+            self.assertIs(similarity.get_index(), index)
+        self.assertEqual(len(index), 1)
+        query = similarity.document_terms("パスワード", "再設定")
+        self.assertNotIn(pk, [found for found, _ in index.query(query, 5)])
+
+    def test_removed_numbers_are_compacted(self):
+        vectors = {
+            pk: similarity.build_vector(Knowledge(title=title, content=content))
+            for pk, (title, content) in enumerate(
+                [
+                    ("パスワードの再設定", "再設定メールのリンクから変更します"),
+                    ("請求書の再発行", "請求書は管理画面から再発行できます"),
+                    ("ログインできない", "パスワードを再設定してください"),
+                ],
+                start=1,
+            )
+        }
+        index = similarity.SimilarityIndex(
+            [(pk, *vector) for pk, vector in vectors.items()], 200
+        )
+        query = similarity.document_terms("パスワードを再設定したい", "")
+        expected = index.query(query, 5)
+
+        index.add(1, *vectors[1])
+        self.assertEqual(index.removed, 1)
+        self.assertEqual(len(index.ids), 4)
+        # 無効な番号が有効なものより多くなったら詰め直す
+        index.add(2, *vectors[2])
+        index.add(3, *vectors[3])
+        self.assertEqual(index.removed, 0)
+        self.assertEqual(len(index.ids), 3)
+        self.assertEqual(
+            [pk for pk, _ in index.query(query, 5)], [pk for pk, _ in expected]
+        )
+
+    def test_unpublished_knowledge_is_removed(self):
+        knowledge = self.create("パスワードの再設定", "再設定メールのリンクから変更します")
+        knowledge.is_public = False
+        with self.captureOnCommitCallbacks(execute=True):
+            knowledge.save()
+        self.assertEqual(len(similarity.get_index()), 0)
+
+
+class KnowledgeConditionalGetTests(TestCase):
+    """変わっていないナレッジは 304 を返し、そのときも閲覧回数を数えることを確かめる"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("staff", is_staff=True)
+        cls.knowledge = Knowledge.objects.create(
+            title="パスワードの再設定", content="手順", author=cls.user
+        )
+
+    def setUp(self):
+        # タイマーのスレッドがテスト中のデータベースに書き込まないようにする
+        buffer = counters.ViewCountBuffer()
+        self.enterContext(mock.patch.object(counters, "buffer", buffer))
+        self.addCleanup(buffer.stop)
+        self.client.force_login(self.user)
+        self.url = f"/knowledge/{self.knowledge.pk}/"
+        # CSRF の Cookie が付いた状態で ETag を受け取る
+        self.client.get(self.url)
+        self.etag = self.client.get(self.url)["ETag"]
+
+    def test_not_modified_counts_view(self):
+        before = counters.pending_views(self.knowledge.pk)
+        response = self.client.get(self.url, headers={"if-none-match": self.etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(counters.pending_views(self.knowledge.pk), before + 1)
+        # 既定では nginx に保持させず、毎回ここで数える
+        self.assertNotIn("X-Accel-Expires", response)
+
+    @override_settings(KNOWLEDGE_MICRO_CACHE_SECONDS=2)
+    def test_micro_cache_only_for_public_knowledge(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response["X-Accel-Expires"], "2")
+        self.knowledge.is_public = False
+        self.knowledge.save()
+        response = self.client.get(self.url)
+        self.assertNotIn("X-Accel-Expires", response)
+
+    def test_failed_flush_keeps_pending_views(self):
+        before = counters.pending_views(self.knowledge.pk)
+        with (
+            mock.patch.object(counters.buffer, "is_due", return_value=True),
+            mock.patch.object(
+                counters.jobqueue, "enqueue", side_effect=RuntimeError("失敗")
+            ),
+            self.assertLogs("knowledge.counters", "ERROR"),
+        ):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(counters.pending_views(self.knowledge.pk), before + 1)
+
+    def test_modified_after_update(self):
+        self.knowledge.title = "パスワードの変更"
+        self.knowledge.save()
+        response = self.client.get(self.url, headers={"if-none-match": self.etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response["ETag"], self.etag)
+
+
+class KnowledgeListFragmentCacheTests(TestCase):
+    """一覧の行の部分キャッシュが、カテゴリ・タグ・作成者の変更で描画し直されることを確かめる"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user("staff", is_staff=True)
+        cls.category = Category.objects.create(name="アカウント")
+        cls.tag = Tag.objects.create(name="パスワード")
+        cls.knowledge = Knowledge.objects.create(
+            title="パスワードの再設定", content="手順", author=cls.user, category=cls.category
+        )
+        cls.knowledge.tags.add(cls.tag)
+
+    def setUp(self):
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.client.force_login(self.user)
+        self.url = "/knowledge/"
+        self.client.get(self.url)
+
+    def test_row_is_cached(self):
+        Knowledge.objects.filter(pk=self.knowledge.pk).update(is_public=False)
+        response = self.client.get(self.url)
+        self.assertContains(response, '<i class="fas fa-eye mr-1"></i>公開')
+
+    def test_category_rename(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.category.name = "認証"
+            self.category.save()
+        response = self.client.get(self.url)
+        self.assertContains(response, '<i class="fas fa-tag mr-1"></i>認証</span>')
+
+    def test_tag_rename(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.name = "パスワード変更"
+            self.tag.save()
+        response = self.client.get(self.url)
+        # タグのリンクは行のキャッシュの外にあるので、そのまま新しい名前になる
+        self.assertContains(response, "パスワード変更")
+
+    def test_author_rename(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.user.first_name = "花子"
+            self.user.save()
+        response = self.client.get(self.url)
+        self.assertContains(response, '<i class="fas fa-user mr-1"></i>花子</span>')
+
+
+class ViewCountBufferTests(TestCase):
+    """リクエストが来なくなったワーカーでも、溜まった閲覧回数を書き込むことを確かめる"""
+
+    def setUp(self):
+        self.buffer = counters.ViewCountBuffer()
+        self.addCleanup(self.buffer.stop)
+
+    def wait_for_timer(self):
+        timer = self.buffer._timer
+        timer.join(5)
+        self.assertFalse(timer.is_alive())
+
+    @override_settings(KNOWLEDGE_VIEW_FLUSH_INTERVAL=0)
+    def test_idle_buffer_flushes_after_interval(self):
+        with mock.patch.object(self.buffer, "flush") as flush:
+            self.buffer.add(1)
+            self.wait_for_timer()
+        flush.assert_called_once_with()
+
+    @override_settings(KNOWLEDGE_VIEW_FLUSH_INTERVAL=0)
+    def test_failed_idle_flush_is_logged_and_retried(self):
+        retried = threading.Event()
+
+        def flush():
+            if flush_mock.call_count == 1:
+                raise RuntimeError("失敗")
+            retried.set()
+            return 1
+
+        with (
+            mock.patch.object(self.buffer, "flush", side_effect=flush) as flush_mock,
+            self.assertLogs("knowledge.counters", "ERROR"),
+        ):
+            self.buffer.add(1)
+            # 失敗した後も次のタイマーで書き込み直す
+            self.assertTrue(retried.wait(5))
+        self.assertEqual(flush_mock.call_count, 2)
+
+    def test_failed_flush_on_exit_is_logged(self):
+        self.buffer.add(1)
+        with (
+            mock.patch.object(counters, "buffer", self.buffer),
+            mock.patch.object(
+                counters.jobqueue, "enqueue", side_effect=RuntimeError("失敗")
+            ),
+            self.assertLogs("knowledge.counters", "ERROR"),
+        ):
+            counters.flush_on_exit()
+        self.assertIsNone(self.buffer._timer)
+        self.assertEqual(self.buffer.pending(1), 1)
+
+
+class KnowledgeFormTagTests(TestCase):
+    """タグは検証では作成せず、保存したときだけ作成することを確かめる"""
+
+    def test_creates_tags_only_on_save(self):
+        Tag.objects.create(name="ログイン")
+        data = {"title": "", "content": "本文", "tags": "ログイン, パスワード"}
+        form = KnowledgeForm(data)
+        self.assertFalse(form.is_valid())
+        self.assertFalse(Tag.objects.filter(name="パスワード").exists())
+
+        author = get_user_model().objects.create_user("staff", is_staff=True)
+        form = KnowledgeForm({**data, "title": "ログインできない"})
+        self.assertTrue(form.is_valid())
+        knowledge = form.save(commit=False)
+        knowledge.author = author
+        knowledge.save()
+        self.assertFalse(Tag.objects.filter(name="パスワード").exists())
+        form.save_m2m()
+        self.assertEqual(
+            sorted(knowledge.tags.values_list("name", flat=True)),
+            ["パスワード", "ログイン"],
+        )
+
+
+class KnowledgeTagCountTests(TestCase):
+    """タグの件数をタグ以外の条件ごとにキャッシュすることを確かめる"""
+
+    def setUp(self):
+        self.addCleanup(cache.clear)
+
+    def test_cached_per_filter(self):
+        author = get_user_model().objects.create_user("staff", is_staff=True)
+        knowledge = Knowledge.objects.create(
+            title="ログイン", content="本文", author=author, is_public=True
+        )
+        knowledge.tags.set(Tag.objects.from_names(["ログイン"]))
+
+        form = KnowledgeSearchForm({"is_public": "True", "tag": "ログイン"})
+        self.assertTrue(form.is_valid())
+        queryset = form.filter_queryset(Knowledge.objects.all(), exclude=("tag",))
+        self.assertEqual(facets.get_tag_counts(form, queryset), [("ログイン", 1)])
+        with self.assertNumQueries(0):
+            # 選択中のタグが違っても、同じキャッシュを使う
+            other = KnowledgeSearchForm({"is_public": "True", "tag": "パスワード"})
+            self.assertEqual(facets.get_tag_counts(other, queryset), [("ログイン", 1)])
+
+        form = KnowledgeSearchForm({"is_public": "False"})
+        self.assertTrue(form.is_valid())
+        queryset = form.filter_queryset(Knowledge.objects.all())
+        self.assertEqual(facets.get_tag_counts(form, queryset), [])
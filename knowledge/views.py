@@ -8,55 +8,49 @@ from django.views.generic import (
 )
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.urls import reverse_lazy
-from django.db.models import Q
+from django.conf import settings
 from django.contrib import messages
+from common.conditional import ConditionalDetailMixin
+from common.pagination import KeysetPaginationMixin
 from .models import Knowledge
 from .forms import KnowledgeForm, KnowledgeSearchForm
+from . import counters, facets
 
 
-class KnowledgeListView(LoginRequiredMixin, ListView):
+class KnowledgeListView(LoginRequiredMixin, KeysetPaginationMixin, ListView):
     """ナレッジ一覧"""
 
     model = Knowledge
     template_name = "knowledge/knowledge_list.html"
     context_object_name = "knowledge_list"
     paginate_by = 20
+    keyset_ordering = ("-updated_at", "-pk")
 
     def get_queryset(self):
-        queryset = Knowledge.objects.select_related("category", "author")
+        queryset = Knowledge.objects.select_related(
+            "category", "author"
+        ).prefetch_related("tags")
+        self.tag_queryset = queryset
 
         # 検索フォームの処理
-        form = KnowledgeSearchForm(self.request.GET)
+        form = self.search_form = KnowledgeSearchForm(self.request.GET)
         if form.is_valid():
-            q = form.cleaned_data.get("q")
-            if q:
-                queryset = queryset.filter(
-                    Q(title__icontains=q)
-                    | Q(content__icontains=q)
-                    | Q(tags__icontains=q)
-                )
-
-            category = form.cleaned_data.get("category")
-            if category:
-                queryset = queryset.filter(category=category)
-
-            author = form.cleaned_data.get("author")
-            if author:
-                queryset = queryset.filter(author=author)
-
-            is_public = form.cleaned_data.get("is_public")
-            if is_public:
-                queryset = queryset.filter(is_public=is_public)
+            # タグの件数は、タグ以外の条件で絞り込んだ結果から数える
+            self.tag_queryset = form.filter_queryset(queryset, exclude=("tag",))
+            queryset = form.filter_queryset(queryset)
 
         return queryset
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         context["search_form"] = KnowledgeSearchForm(self.request.GET)
+        context["tag_counts"] = facets.get_tag_counts(
+            self.search_form, self.tag_queryset
+        )
         return context
 
 
-class KnowledgeDetailView(LoginRequiredMixin, DetailView):
+class KnowledgeDetailView(LoginRequiredMixin, ConditionalDetailMixin, DetailView):
     """ナレッジ詳細"""
 
     model = Knowledge
@@ -64,10 +58,22 @@ class KnowledgeDetailView(LoginRequiredMixin, DetailView):
     context_object_name = "knowledge"
 
     def get_object(self, queryset=None):
+        # 304 を返す場合も呼ばれるので、閲覧回数はここで数える
         obj = super().get_object(queryset)
-        obj.increment_view_count()
+        # 閲覧回数はまとめて書き込むので、このプロセスで未反映の分を足して表示する
+        counters.record_view(obj.pk)
+        obj.view_count += counters.pending_views(obj.pk)
         return obj
 
+    def get(self, request, *args, **kwargs):
+        response = super().get(request, *args, **kwargs)
+        seconds = settings.KNOWLEDGE_MICRO_CACHE_SECONDS
+        if seconds and self.object.is_public and response.has_header("ETag"):
+            # 公開ナレッジを nginx に短時間だけ保持させる（ユーザーごと。nginx.conf を参照）。
+            # 保持している間の表示は Django に届かず、閲覧回数に数えない
+            response["X-Accel-Expires"] = seconds
+        return response
+
 
 class KnowledgeCreateView(LoginRequiredMixin, CreateView):
     """ナレッジ作成"""